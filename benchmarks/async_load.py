@@ -0,0 +1,185 @@
+"""
+WSGI vs ASGI load test of the read endpoints.
+
+Drives the synchronous endpoints through Django's WSGI handler from a fixed
+pool of worker threads (like ``gunicorn --threads N``), then their async
+variants under ``/api/async/`` through the ASGI handler from a single event
+loop with many requests in flight (like one ``uvicorn`` worker), and reports
+throughput and latency for each. ``--db-latency`` adds a sleep to every
+query to stand in for the network round trip of a database server, which is
+where an event loop that does not park a thread per request pays off:
+
+    python -m benchmarks.async_load --workers 4 --concurrency 64 --requests 2000 --db-latency 2
+"""
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .common import percentile, scratch_db_path, setup_django
+
+PATHS = [
+    '/api/{prefix}posts/?page_size=20',
+    '/api/{prefix}posts/{slug}/',
+    '/api/{prefix}stats/',
+    '/api/{hiking}tours/?page_size=20',
+    '/api/{hiking}tours/{tour}/',
+    '/api/{hiking}tour-dates/?tour={tour}',
+]
+
+def _seed(rng):
+    import datetime
+    from django.contrib.auth.models import User
+    from booking.models import BlogPost, Category as BlogCategory
+    from hiking.models import Category, Location, Review, Tour, TourDate
+
+    users = User.objects.bulk_create([User(username=f'user{i}') for i in range(20)])
+    category = Category.objects.create(name='Trekking')
+    location = Location.objects.create(name='Khumbu', country='Nepal', latitude=27.9, longitude=86.9)
+    tours = [Tour.objects.create(title=f'Tour {i}', description='Trail notes', category=category, location=location,
+                                 duration_days=5, difficulty='moderate', price=500, max_participants=12)
+             for i in range(50)]
+    today = datetime.date.today()
+    for tour in tours:
+        TourDate.objects.bulk_create([
+            TourDate(tour=tour, start_date=today + datetime.timedelta(days=7 * n),
+                     end_date=today + datetime.timedelta(days=7 * n + 4), available_spots=10, guide=users[0])
+            for n in range(4)
+        ])
+        for user in rng.sample(users, 3):
+            Review.objects.create(tour=tour, user=user, rating=rng.randint(1, 5), comment='Great')
+    blog_category = BlogCategory.objects.create(name='Trails', slug='trails')
+    for i in range(200):
+        BlogPost.objects.create(title=f'Post {i}', slug=f'post-{i}', author=rng.choice(users),
+                                category=blog_category, content='Trail notes', excerpt='Notes', is_published=True)
+    return [tour.pk for tour in tours], [f'post-{i}' for i in range(200)]
+
+def _urls(count, async_, tours, slugs, rng):
+    prefix, hiking = ('async/', 'async/v1/') if async_ else ('', 'api/v1/')
+    return [rng.choice(PATHS).format(prefix=prefix, hiking=hiking, tour=rng.choice(tours), slug=rng.choice(slugs))
+            for _ in range(count)]
+
+def _split(url):
+    path, _, query = url.partition('?')
+    return path, query
+
+def _check(status, url):
+    if status != 200:
+        raise SystemExit(f'{url}: HTTP {status}')
+
+def run_wsgi(urls, workers):
+    from wsgiref.util import setup_testing_defaults
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connections
+
+    application = get_wsgi_application()
+
+    def request(url):
+        path, query = _split(url)
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}
+        setup_testing_defaults(environ)
+        statuses = []
+        started = time.perf_counter()
+        body = application(environ, lambda status, headers: statuses.append(int(status[:3])))
+        b''.join(body)
+        body.close()
+        elapsed = time.perf_counter() - started
+        _check(statuses[0], url)
+        return elapsed
+
+    def close(_):
+        connections.close_all()
+
+    with ThreadPoolExecutor(workers) as pool:
+        started = time.perf_counter()
+        latencies = list(pool.map(request, urls))
+        total = time.perf_counter() - started
+        list(pool.map(close, range(workers)))
+    return latencies, total
+
+def run_asgi(urls, concurrency):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+
+    async def request(url):
+        path, query = _split(url)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        messages = []
+        pending = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            # The client stays connected until the response is sent
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+        await application(scope, receive, send)
+        _check(messages[0]['status'], url)
+
+    async def main():
+        queue = list(reversed(urls))
+        latencies = []
+
+        async def worker():
+            while queue:
+                url = queue.pop()
+                started = time.perf_counter()
+                await request(url)
+                latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, time.perf_counter() - started
+    return asyncio.run(main())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads')
+    parser.add_argument('--concurrency', type=int, default=64, help='ASGI requests in flight')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--db-latency', type=float, default=0, help='ms added to every query')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django(scratch_db_path('async-load'), migrate=True)
+    from django.conf import settings
+    from django.db.backends.signals import connection_created
+    from trips.cache import response_cache
+
+    settings.ALLOWED_HOSTS = ['*']
+    rng = random.Random(args.seed)
+    tours, slugs = _seed(rng)
+    # Both sides should reach the database, not the sync endpoints' response cache
+    response_cache.fetch = lambda request, compute, tags, vary=(): compute()
+
+    if args.db_latency:
+        def slow(execute, sql, params, many, context):
+            time.sleep(args.db_latency / 1000)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            # The wrapper list outlives the connections closed after every request
+            if slow not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow)
+        connection_created.connect(add_latency, weak=False)
+
+    print(f'requests: {args.requests}, WSGI threads: {args.workers}, ASGI in flight: {args.concurrency}, '
+          f'db latency: {args.db_latency} ms')
+    results = {
+        'WSGI sync': run_wsgi(_urls(args.requests, False, tours, slugs, random.Random(args.seed)), args.workers),
+        'ASGI async': run_asgi(_urls(args.requests, True, tours, slugs, random.Random(args.seed)),
+                               args.concurrency),
+    }
+    for name, (latencies, total) in results.items():
+        print(f'{name:<11} requests/s {len(latencies) / total:8.1f}   p50 {percentile(latencies, 50) * 1000:8.2f} ms   '
+              f'p95 {percentile(latencies, 95) * 1000:8.2f} ms   p99 {percentile(latencies, 99) * 1000:8.2f} ms')
+
+if __name__ == '__main__':
+    main()
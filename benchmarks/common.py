@@ -0,0 +1,35 @@
+"""
+Shared bootstrap for the benchmark scripts.
+
+Benchmarks never touch the project database: ``setup_django`` points the
+default alias at a scratch SQLite file before Django opens any connection.
+Run them from the repository root, e.g. ``python -m benchmarks.seat_contention``.
+"""
+import os
+import tempfile
+import django
+
+def scratch_db_path(name):
+    return os.path.join(tempfile.gettempdir(), f'trips-bench-{name}.sqlite3')
+
+def setup_django(db_path, migrate=False):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trips.settings')
+    from django.conf import settings
+    database = settings.DATABASES['default']
+    database['NAME'] = db_path
+    # Concurrent writers wait for the lock instead of failing immediately
+    database.setdefault('OPTIONS', {}).setdefault('timeout', 60)
+    django.setup()
+    if migrate:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,186 @@
+"""
+Deterministic synthetic dataset for the benchmarks.
+
+``generate()`` fills an empty, migrated database with users, blog posts,
+tours, tour dates, reviews and bookings. The same seed and counts always give
+the same rows, except that tour dates start from the day of generation. Rows
+are bulk-inserted in batches, so memory stays flat at any scale. Afterwards
+the denormalized counters, search indexes and blog stats are rebuilt, because
+bulk_create skips the signals that maintain them:
+
+    python -m benchmarks.datagen --scale full --db /tmp/trips-full.sqlite3
+    python -m benchmarks.datagen --scale small --bookings 2000000
+
+The user ``bench-admin`` (password ``bench-admin``) is staff and owns its
+share of the bookings, so the private endpoints have something to return.
+"""
+import argparse
+import datetime
+import io
+import itertools
+import random
+import time
+from .common import setup_django
+
+SCALES = {
+    'tiny': dict(users=200, categories=8, locations=50, tours=500, tour_dates=5_000, reviews=2_000,
+                 bookings=20_000, blog_categories=5, posts=2_000),
+    'small': dict(users=2_000, categories=12, locations=500, tours=5_000, tour_dates=100_000, reviews=20_000,
+                  bookings=500_000, blog_categories=10, posts=10_000),
+    'full': dict(users=20_000, categories=20, locations=5_000, tours=50_000, tour_dates=1_000_000,
+                 reviews=200_000, bookings=5_000_000, blog_categories=20, posts=100_000),
+}
+
+BATCH_SIZE = 5_000
+ADMIN = 'bench-admin'
+WORDS = ('ridge summit valley glacier trail lake forest pass hut alpine sunrise meadow river gorge '
+         'waterfall moraine col scramble traverse descent camp village view').split()
+
+def _batches(objects, size=BATCH_SIZE):
+    iterator = iter(objects)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+def _insert(model, objects):
+    count = 0
+    for batch in _batches(objects):
+        model.objects.bulk_create(batch, batch_size=len(batch))
+        count += len(batch)
+    return count
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+def _spread_created_at(model, days):
+    """Spread ``created_at`` over the last ``days`` days in id order (bulk_create stamps every row with now)"""
+    from django.db import connection
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table}')
+        first, last = cursor.fetchone()
+        if first is None:
+            return
+        step = days * 86400 / max(last - first, 1)
+        cursor.execute(
+            f"UPDATE {table} SET created_at = datetime('now', '-' || CAST((%s - id) * %s AS INTEGER) || ' seconds')",
+            [last, step])
+
+def generate(seed=1, today=None, log=print, **counts):
+    """Insert the dataset described by ``counts`` (keys of SCALES['tiny']) and return ``counts``"""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import transaction
+    from django.db.models import Max, Min
+    from booking.models import BlogPost, Category as BlogCategory
+    from hiking import geo
+    from hiking.models import Booking, Category, Location, Review, Tour, TourDate
+
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    started = time.perf_counter()
+
+    def step(name, count=None):
+        log(f'{name:<16} {"" if count is None else f"{count:,}":>10}   {time.perf_counter() - started:7.1f} s')
+
+    with transaction.atomic():
+        # One hash for everyone: hashing is deliberately slow
+        password = make_password(ADMIN)
+        step('users', _insert(User, (
+            User(username=ADMIN if i == 0 else f'user{i}', first_name='Bench', last_name=str(i),
+                 email=f'user{i}@example.com', password=password, is_staff=i == 0, is_superuser=i == 0)
+            for i in range(counts['users']))))
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        guide_ids = user_ids[:max(1, len(user_ids) // 20)]
+
+        step('categories', _insert(Category, (
+            Category(name=f'Category {i}', description=_text(rng, 12)) for i in range(counts['categories']))))
+        category_ids = list(Category.objects.values_list('pk', flat=True))
+
+        def location(i):
+            latitude, longitude = round(rng.uniform(-60, 70), 5), round(rng.uniform(-180, 180), 5)
+            return Location(name=f'Location {i}', country=f'Country {i % 60}', city=f'City {i}',
+                            latitude=latitude, longitude=longitude, geo_cell=geo.cell_for(latitude, longitude),
+                            description=_text(rng, 10))
+        step('locations', _insert(Location, (location(i) for i in range(counts['locations']))))
+        location_ids = list(Location.objects.values_list('pk', flat=True))
+
+        step('tours', _insert(Tour, (
+            Tour(title=f'{_text(rng, 3)[:-1]} {i}', description=_text(rng, 60), category_id=rng.choice(category_ids),
+                 location_id=rng.choice(location_ids), duration_days=rng.randint(1, 21),
+                 difficulty=rng.choice(['easy', 'moderate', 'hard', 'expert']), price=rng.randint(50, 5000),
+                 max_participants=rng.randint(4, 20), image=f'tours/{i}.jpg' if i % 2 else '',
+                 featured=i % 25 == 0, active=i % 50 != 0)
+            for i in range(counts['tours']))))
+        tour_ids = list(Tour.objects.order_by('pk').values_list('pk', flat=True))
+
+        # Weekly departures per tour, unique on (tour, start_date)
+        per_tour, extra = divmod(counts['tour_dates'], len(tour_ids))
+
+        def tour_dates():
+            for index, tour_id in enumerate(tour_ids):
+                offset = rng.randint(-30, 30)
+                for week in range(per_tour + (index < extra)):
+                    start = today + datetime.timedelta(days=offset + 7 * week)
+                    yield TourDate(tour_id=tour_id, start_date=start, end_date=start + datetime.timedelta(days=3),
+                                   available_spots=rng.randint(0, 20), guide_id=rng.choice(guide_ids))
+        step('tour dates', _insert(TourDate, tour_dates()))
+
+        # Unique on (tour, user): reviewers of a tour are consecutive users from a random start
+        per_tour, extra = divmod(counts['reviews'], len(tour_ids))
+
+        def reviews():
+            for index, tour_id in enumerate(tour_ids):
+                first = rng.randrange(len(user_ids))
+                for n in range(min(per_tour + (index < extra), len(user_ids))):
+                    yield Review(tour_id=tour_id, user_id=user_ids[(first + n) % len(user_ids)],
+                                 rating=rng.choices(range(1, 6), weights=(1, 2, 5, 10, 8))[0], comment=_text(rng, 15))
+        step('reviews', _insert(Review, reviews()))
+
+        date_ids = TourDate.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        step('bookings', _insert(Booking, (
+            Booking(user_id=user_ids[i % len(user_ids)], tour_date_id=rng.randint(date_ids['first'], date_ids['last']),
+                    participants=rng.randint(1, 4), total_price=rng.randint(50, 20000),
+                    status=rng.choices(['pending', 'confirmed', 'cancelled', 'completed'], weights=(2, 6, 1, 3))[0],
+                    booking_reference=f'BENCH{i:09d}')
+            for i in range(counts['bookings']))))
+
+        step('blog categories', _insert(BlogCategory, (
+            BlogCategory(name=f'Topic {i}', slug=f'topic-{i}', description=_text(rng, 8))
+            for i in range(counts['blog_categories']))))
+        blog_category_ids = list(BlogCategory.objects.values_list('pk', flat=True))
+        step('posts', _insert(BlogPost, (
+            BlogPost(title=f'{_text(rng, 5)[:-1]} {i}', slug=f'post-{i}', author_id=rng.choice(user_ids),
+                     category_id=rng.choice(blog_category_ids), content=_text(rng, 300), excerpt=_text(rng, 20),
+                     image=f'blog_images/{i}.jpg' if i % 3 else None, is_published=i % 20 != 0,
+                     views=int(rng.paretovariate(1.2) * 10))
+            for i in range(counts['posts']))))
+
+        for model, days in ((Tour, 720), (Review, 365), (Booking, 365), (BlogPost, 1500)):
+            _spread_created_at(model, days)
+        for command in ('rebuild_category_tour_counts', 'rebuild_tour_ratings', 'rebuild_tour_search_index',
+                        'rebuild_category_post_counts', 'rebuild_post_search_index', 'rebuild_blog_stats'):
+            call_command(command, stdout=io.StringIO())
+        step('counters')
+    return counts
+
+def add_arguments(parser):
+    parser.add_argument('--scale', choices=sorted(SCALES), default='tiny')
+    parser.add_argument('--seed', type=int, default=1)
+    for name, default in SCALES['tiny'].items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=int, help=f'override the scale (tiny: {default})')
+
+def counts_from(args):
+    return {name: getattr(args, name) or default for name, default in SCALES[args.scale].items()}
+
+def main():
+    from .common import scratch_db_path
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--db', help='SQLite file to (re)create, default a scratch file per scale')
+    args = parser.parse_args()
+    setup_django(args.db or scratch_db_path(f'dataset-{args.scale}'), migrate=True)
+    generate(seed=args.seed, **counts_from(args))
+
+if __name__ == '__main__':
+    main()
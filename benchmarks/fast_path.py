@@ -0,0 +1,115 @@
+"""
+Fast read path benchmark.
+
+Renders the tour and blog post list endpoints repeatedly in one process,
+through the serializers and through ``trips.fastpath`` (``FAST_READ_PATH``),
+with the response cache cleared before every request, and reports requests
+per second per core. Both paths must return byte-identical bodies:
+
+    python -m benchmarks.fast_path --tours 500 --posts 2000 --requests 300 --page-size 50
+"""
+import argparse
+import datetime
+import io
+import random
+import time
+from .common import percentile, scratch_db_path, setup_django
+
+def _seed(tours, posts, rng):
+    from django.contrib.auth.models import User
+    from booking.models import BlogPost, Category as BlogCategory
+    from hiking.models import Category, Location, Review, Tour, TourDate
+
+    users = User.objects.bulk_create([User(username=f'user{i}', first_name='Bench', last_name=f'{i}')
+                                      for i in range(50)])
+    categories = [Category.objects.create(name=f'Category {i}') for i in range(8)]
+    locations = [Location.objects.create(name=f'Location {i}', country='Benchmark', latitude=46 + i / 10,
+                                         longitude=8 + i / 10) for i in range(20)]
+    Tour.objects.bulk_create([
+        Tour(title=f'Tour {i}', description='A long day in the hills. ' * 10, category=rng.choice(categories),
+             location=rng.choice(locations), duration_days=rng.randint(1, 10),
+             difficulty=rng.choice(['easy', 'moderate', 'hard', 'expert']), price=rng.randint(50, 2000),
+             max_participants=12, image=f'tours/{i}.jpg' if i % 2 else '', featured=i % 10 == 0)
+        for i in range(tours)
+    ], batch_size=500)
+    today = datetime.date.today()
+    tour_ids = list(Tour.objects.values_list('pk', flat=True))
+    TourDate.objects.bulk_create([
+        TourDate(tour_id=tour_id, start_date=today + datetime.timedelta(days=7 * n),
+                 end_date=today + datetime.timedelta(days=7 * n + 2), available_spots=rng.randint(0, 12),
+                 guide=rng.choice(users))
+        for tour_id in tour_ids for n in range(3)
+    ], batch_size=500)
+    Review.objects.bulk_create([
+        Review(tour_id=tour_id, user=user, rating=rng.randint(1, 5), comment='Great views.')
+        for tour_id in tour_ids for user in rng.sample(users, 3)
+    ], batch_size=500)
+
+    blog_categories = [BlogCategory.objects.create(name=f'Topic {i}', slug=f'topic-{i}') for i in range(5)]
+    BlogPost.objects.bulk_create([
+        BlogPost(title=f'Post {i}', slug=f'post-{i}', author=rng.choice(users), category=rng.choice(blog_categories),
+                 content='Trail notes. ' * 50, excerpt='Trail notes.', image=f'blog/{i}.jpg' if i % 3 else '',
+                 is_published=True, views=rng.randint(0, 10000))
+        for i in range(posts)
+    ], batch_size=500)
+    # bulk_create skipped the signals that maintain the denormalized counters
+    from django.core.management import call_command
+    call_command('rebuild_category_tour_counts', stdout=io.StringIO())
+    call_command('rebuild_category_post_counts', stdout=io.StringIO())
+    call_command('rebuild_tour_ratings', stdout=io.StringIO())
+
+def _run(url, requests, fast):
+    from django.test import Client, override_settings
+    from trips.cache import response_cache
+
+    client = Client()
+    wall, body = [], None
+    with override_settings(FAST_READ_PATH=fast):
+        cpu_started = time.process_time()
+        for _ in range(requests):
+            response_cache.clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            wall.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+            body = response.content
+        cpu = time.process_time() - cpu_started
+    return wall, cpu, body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tours', type=int, default=500)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and path')
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django(scratch_db_path('fast-path'), migrate=True)
+    from django.conf import settings
+    from trips import fastpath
+
+    settings.ALLOWED_HOSTS = ['*']
+    settings.DEBUG = False
+    _seed(args.tours, args.posts, random.Random(args.seed))
+
+    print(f'tours: {args.tours}, posts: {args.posts}, page size: {args.page_size}, '
+          f'requests: {args.requests}, orjson: {fastpath.orjson is not None}')
+    mismatches = 0
+    for name, url in (('tours', f'/api/api/v1/tours/?page_size={args.page_size}'),
+                      ('posts', f'/api/posts/?page_size={args.page_size}')):
+        _run(url, 5, False), _run(url, 5, True)  # warm up (and compile the fast path)
+        results = {}
+        for label, fast in (('serializer', False), ('fast path', True)):
+            wall, cpu, body = results[label] = _run(url, args.requests, fast)
+            print(f'{name:<6} {label:<11} p50 {percentile(wall, 50) * 1000:7.2f} ms   '
+                  f'p95 {percentile(wall, 95) * 1000:7.2f} ms   requests/s/core {args.requests / cpu:8.1f}')
+        speedup = results['serializer'][1] / results['fast path'][1]
+        identical = results['serializer'][2] == results['fast path'][2]
+        mismatches += not identical
+        print(f'{name:<6} speedup {speedup:.1f}x, identical output: {identical}')
+    if mismatches:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
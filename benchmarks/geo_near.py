@@ -0,0 +1,81 @@
+"""
+Proximity search benchmark.
+
+Compares ``hiking.geo.locations_near`` (grid cell index + haversine
+refinement of the candidates) against a full scan that loads every location
+and computes its distance, and checks both return the same locations:
+
+    python -m benchmarks.geo_near --locations 100000 --queries 200 --radius 50
+"""
+import argparse
+import random
+import time
+from .common import percentile, scratch_db_path, setup_django
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--locations', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--radius', type=float, default=50, help='search radius in km')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django(scratch_db_path('geo-near'), migrate=True)
+    from hiking import geo
+    from hiking.models import Location
+
+    rng = random.Random(args.seed)
+    # Cluster most locations around a few hubs, like real hiking regions
+    hubs = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(50)]
+    locations = []
+    for i in range(args.locations):
+        lat, lon = rng.choice(hubs)
+        lat = max(-90.0, min(90.0, lat + rng.gauss(0, 2)))
+        lon = (lon + rng.gauss(0, 2) + 180) % 360 - 180
+        # bulk_create skips Location.save(), so fill the cell in here
+        locations.append(Location(name=f'Location {i}', country='Benchmark', latitude=round(lat, 6),
+                                  longitude=round(lon, 6), geo_cell=geo.cell_for(lat, lon)))
+    Location.objects.bulk_create(locations, batch_size=1000)
+
+    def full_scan(lat, lon):
+        rows = Location.objects.values_list('pk', 'latitude', 'longitude')
+        return geo.nearest(rows, lat, lon, args.radius, args.limit)
+
+    def indexed(lat, lon):
+        return geo.locations_near(lat, lon, args.radius, args.limit)
+
+    points = []
+    for _ in range(args.queries):
+        lat, lon = rng.choice(hubs)
+        points.append((lat + rng.gauss(0, 2), (lon + rng.gauss(0, 2) + 180) % 360 - 180))
+
+    indexed_times, scan_times, mismatches, found = [], [], 0, 0
+    for lat, lon in points:
+        elapsed, fast = _timed(indexed, lat, lon)
+        indexed_times.append(elapsed)
+        elapsed, slow = _timed(full_scan, lat, lon)
+        scan_times.append(elapsed)
+        mismatches += fast != slow
+        found += len(fast)
+
+    def report(name, times):
+        print(f'{name:<10} p50 {percentile(times, 50) * 1000:8.2f} ms   p95 {percentile(times, 95) * 1000:8.2f} ms   '
+              f'queries/s {len(times) / sum(times):8.1f}')
+
+    print(f'locations: {args.locations}, queries: {args.queries}, radius: {args.radius} km, '
+          f'limit: {args.limit}, numpy: {geo.numpy is not None}')
+    report('indexed', indexed_times)
+    report('full scan', scan_times)
+    print(f'speedup (p50): {percentile(scan_times, 50) / percentile(indexed_times, 50):.1f}x')
+    print(f'average hits: {found / len(points):.1f}, mismatches: {mismatches}')
+    if mismatches:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
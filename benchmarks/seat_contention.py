@@ -0,0 +1,140 @@
+"""
+Multi-process seat contention benchmark.
+
+Hundreds of clients, spread over several processes, book seats on the same
+tour date through BookingViewSet.create until demand exceeds capacity. The
+run reports bookings per second and checks that not a single seat was
+oversold:
+
+    python -m benchmarks.seat_contention --processes 8 --clients 32 --capacity 2000
+"""
+import argparse
+import datetime
+import multiprocessing
+import random
+import threading
+import time
+from .common import percentile, scratch_db_path, setup_django
+
+def _client(user_id, tour_date_id, attempts, max_seats, seed, results):
+    from django.contrib.auth.models import User
+    from django.db import connections
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from hiking.views import BookingViewSet
+
+    view = BookingViewSet.as_view({'post': 'create'})
+    factory = APIRequestFactory()
+    rng = random.Random(seed)
+    user = User.objects.get(pk=user_id)
+    created = rejected = errors = seats = 0
+    latencies = []
+    for _ in range(attempts):
+        participants = rng.randint(1, max_seats)
+        request = factory.post('/bookings/', {'tour_date_id': tour_date_id, 'participants': participants},
+                               format='json')
+        force_authenticate(request, user=user)
+        started = time.perf_counter()
+        try:
+            response = view(request)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 201:
+            created += 1
+            seats += participants
+        elif response.status_code == 400:
+            rejected += 1
+        else:
+            errors += 1
+    connections.close_all()
+    results.append((created, rejected, errors, seats, latencies))
+
+def _worker(db_path, user_ids, tour_date_id, attempts, max_seats, barrier, queue):
+    setup_django(db_path)
+    results = []
+    threads = [
+        threading.Thread(target=_client, args=(user_id, tour_date_id, attempts, max_seats, user_id, results))
+        for user_id in user_ids
+    ]
+    barrier.wait()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(results)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32, help='client threads per process')
+    parser.add_argument('--attempts', type=int, default=10, help='booking attempts per client')
+    parser.add_argument('--capacity', type=int, default=1000, help='available spots on the tour date')
+    parser.add_argument('--max-seats', type=int, default=3, help='participants per booking, 1..N')
+    args = parser.parse_args()
+
+    db_path = scratch_db_path('seat-contention')
+    setup_django(db_path, migrate=True)
+    from django.contrib.auth.models import User
+    from django.db import connections
+    from hiking.models import Booking, Category, Location, Tour, TourDate
+
+    guide = User.objects.create(username='guide')
+    tour = Tour.objects.create(
+        title='Popular tour', description='Benchmark', duration_days=1, difficulty='easy',
+        price='50.00', max_participants=args.capacity,
+        category=Category.objects.create(name='Benchmark'),
+        location=Location.objects.create(name='Benchmark', country='Nowhere'),
+    )
+    start = datetime.date.today() + datetime.timedelta(days=30)
+    tour_date = TourDate.objects.create(tour=tour, start_date=start, end_date=start,
+                                        available_spots=args.capacity, guide=guide)
+    total_clients = args.processes * args.clients
+    users = User.objects.bulk_create([User(username=f'client-{i}') for i in range(total_clients)])
+    user_ids = [user.pk for user in users]
+    connections.close_all()
+
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(args.processes + 1)
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(db_path, user_ids[i::args.processes], tour_date.pk,
+                                          args.attempts, args.max_seats, barrier, queue))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    started = time.perf_counter()
+    results = [result for _ in processes for result in queue.get()]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    created = sum(r[0] for r in results)
+    rejected = sum(r[1] for r in results)
+    errors = sum(r[2] for r in results)
+    latencies = [latency for r in results for latency in r[4]]
+    tour_date.refresh_from_db()
+    booked = sum(Booking.objects.filter(tour_date=tour_date).values_list('participants', flat=True))
+    oversold = max(0, booked - args.capacity)
+    consistent = booked + tour_date.available_spots == args.capacity
+
+    print(f'clients:            {total_clients} ({args.processes} processes x {args.clients} threads)')
+    print(f'attempts:           {created + rejected + errors}')
+    print(f'bookings created:   {created} ({booked} seats of {args.capacity})')
+    print(f'rejected (no seats): {rejected}')
+    print(f'errors:             {errors}')
+    print(f'elapsed:            {elapsed:.2f}s')
+    print(f'bookings/s:         {created / elapsed:.1f}')
+    print(f'attempts/s:         {(created + rejected) / elapsed:.1f}')
+    print(f'latency p50/p95/p99: {percentile(latencies, 50) * 1000:.1f} / '
+          f'{percentile(latencies, 95) * 1000:.1f} / {percentile(latencies, 99) * 1000:.1f} ms')
+    print(f'seats left:         {tour_date.available_spots}')
+    print(f'oversold seats:     {oversold}')
+    print(f'inventory consistent: {consistent}')
+    if oversold or not consistent:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
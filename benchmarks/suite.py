@@ -0,0 +1,260 @@
+"""
+Benchmark of every API GET endpoint and the main writes on a generated dataset.
+
+Builds a ``benchmarks.datagen`` dataset, or reuses the one generated with the
+same scale and seed. Then it requests every GET endpoint found in the
+URLconf (``trips.routes``) plainly and with each filter, ordering and search
+parameter, through Django's test client as the staff user ``bench-admin``,
+with the response cache bypassed. The write scenarios follow: booking
+creation, a bulk booking, cancellation and review creation. They run in a
+transaction rolled back at the end, so the dataset stays reusable, but the
+work they defer to on_commit (cache invalidation) is not timed.
+
+For each request it reports p50/p95/p99 latency, requests per second,
+queries per request and the peak Python allocation of one traced request.
+The process RSS high-water mark only ever grows, so it is reported once for
+the whole run. Results are saved as JSON, and a saved run can serve as the
+baseline of the next one:
+
+    python -m benchmarks.suite --scale small --output baseline.json
+    python -m benchmarks.suite --scale small --baseline baseline.json --fail-on-regression
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from . import datagen
+from .common import percentile, scratch_db_path, setup_django
+
+def _dataset(args):
+    """Point Django at the dataset database for ``args``, generating it unless a matching one exists"""
+    counts = datagen.counts_from(args)
+    path = args.db or scratch_db_path(f'dataset-{args.scale}-{args.seed}')
+    description = {'seed': args.seed, 'counts': counts}
+    try:
+        with open(path + '.json') as file:
+            reusable = not args.regenerate and json.load(file) == description and os.path.exists(path)
+    except (OSError, ValueError):
+        reusable = False
+    setup_django(path, migrate=not reusable)
+    if reusable:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        print(f'reusing {path}')
+    else:
+        print(f'generating {path}')
+        datagen.generate(seed=args.seed, **counts)
+        with open(path + '.json', 'w') as file:
+            json.dump(description, file)
+    return description
+
+def _requests(route_filter):
+    """``(name, url, params)`` of every request to benchmark, as the audit makes them"""
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from trips.routes import discover, sample_requests
+
+    user = User.objects.get(username=datagen.ADMIN)
+    request = APIRequestFactory().get('/')
+    force_authenticate(request, user)
+    for route in discover():
+        if route_filter and route_filter not in route.label:
+            continue
+        for url, params in sample_requests(route, request):
+            query = '&'.join(f'{key}={value}' for key, value in params.items())
+            yield f'{route.label} {url}{"?" + query if query else ""}', url, params
+
+# Bookings per bulk request
+BULK_SIZE = 10
+
+def _writes(client, user, count):
+    """
+    ``(name, send)`` of the write scenarios, ``send()`` making the next of
+    ``count`` requests of its scenario; the data they need is created here
+    """
+    from django.db.models import F
+    from hiking.models import Booking, Tour, TourDate
+
+    dates = list(TourDate.objects.order_by('pk').values_list('pk', flat=True)[:BULK_SIZE])
+    # Enough seats that no booking runs out of them
+    TourDate.objects.filter(pk__in=dates).update(available_spots=F('available_spots') + 100 * count * BULK_SIZE)
+    pending = Booking.objects.bulk_create([
+        Booking(user=user, tour_date_id=dates[i % len(dates)], participants=1, total_price=0,
+                booking_reference=f'BENCH{i:06}') for i in range(count)])
+    # One review per user and tour
+    unreviewed = list(Tour.objects.filter(active=True).exclude(reviews__user=user)
+                      .values_list('pk', flat=True)[:count])
+    bulk = {'bookings': [{'tour_date_id': pk, 'participants': 1} for pk in dates]}
+    # {name: [(url, data) of each request]}
+    scenarios = {
+        'BookingViewSet.create POST /api/api/v1/bookings/': [
+            ('/api/api/v1/bookings/', {'tour_date_id': dates[i % len(dates)], 'participants': 1})
+            for i in range(count)],
+        f'BookingViewSet.bulk POST /api/api/v1/bookings/bulk/ ({len(dates)} bookings)': [
+            ('/api/api/v1/bookings/bulk/', bulk)] * count,
+        'BookingViewSet.cancel POST /api/api/v1/bookings/{pk}/cancel/': [
+            (f'/api/api/v1/bookings/{booking.pk}/cancel/', {}) for booking in pending],
+    }
+    if len(unreviewed) == count:
+        scenarios['ReviewViewSet.create POST /api/api/v1/reviews/'] = [
+            ('/api/api/v1/reviews/', {'tour': pk, 'rating': 4, 'comment': 'Benchmark'}) for pk in unreviewed]
+    else:
+        print(f'skipping review creation: fewer than {count} tours left to review')
+    for name, requests in scenarios.items():
+        def send(requests=iter(requests)):
+            url, data = next(requests)
+            return client.post(url, data, content_type='application/json')
+        yield name, send
+
+def _measure(send, warmup, requests):
+    """Time ``requests`` calls of ``send()``, which makes one request, after ``warmup`` unmeasured ones"""
+    from django.db import connection
+
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries[-1] += 1
+        return execute(sql, params, many, context)
+
+    for _ in range(warmup):
+        send()
+    latencies = []
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        for _ in range(requests):
+            queries.append(0)
+            request_started = time.perf_counter()
+            response = send()
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append(time.perf_counter() - request_started)
+        total = time.perf_counter() - started
+
+    tracemalloc.start()
+    send()
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'requests_per_s': round(requests / total, 1),
+        'queries': max(queries),
+        'alloc_peak_kb': round(allocated / 1024, 1),
+    }
+
+def _rss_peak_mb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                 / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _meta(dataset, args):
+    import django
+    import sqlite3
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+        'python': platform.python_version(), 'django': django.get_version(), 'sqlite': sqlite3.sqlite_version,
+        'scale': args.scale, **dataset, 'warmup': args.warmup, 'requests': args.requests,
+        'rss_peak_mb': _rss_peak_mb(),
+    }
+
+def compare(results, baseline, threshold):
+    """Lines describing the changes from ``baseline``, and whether any of them is a regression"""
+    lines, regressed = [], False
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            lines.append(f'  new         {name}')
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0
+        worse = change > threshold or result['queries'] > before['queries']
+        better = change < -threshold or result['queries'] < before['queries']
+        if worse or better:
+            regressed |= worse
+            lines.append(f'  {"SLOWER" if worse else "faster":<11} {name}: p50 {before["p50_ms"]:.2f} -> '
+                         f'{result["p50_ms"]:.2f} ms ({change:+.0%}), queries {before["queries"]} -> '
+                         f'{result["queries"]}')
+    lines.extend(f'  gone        {name}' for name in baseline.keys() - results.keys())
+    return lines, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    datagen.add_arguments(parser)
+    parser.add_argument('--db', help='dataset SQLite file, default a scratch file per scale and seed')
+    parser.add_argument('--regenerate', action='store_true', help='rebuild the dataset even if it exists')
+    parser.add_argument('--route', help='only benchmark endpoints whose label contains this text')
+    parser.add_argument('--no-writes', action='store_true', help='only benchmark GET endpoints')
+    parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests per endpoint')
+    parser.add_argument('--requests', type=int, default=30, help='measured requests per endpoint')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='p50 change that counts, default 10%%')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    dataset = _dataset(args)
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.test import Client
+    from trips.cache import response_cache
+
+    settings.ALLOWED_HOSTS = ['*']
+    settings.DEBUG = False
+    client = Client()
+    user = User.objects.get(username=datagen.ADMIN)
+    client.force_login(user)
+
+    results = {}
+
+    def run(name, send):
+        result = results[name] = _measure(send, args.warmup, args.requests)
+        status = '' if result['status'] < 400 else f'  HTTP {result["status"]}'
+        print(f'{name[:72]:<72} {result["p50_ms"]:8.2f} {result["p95_ms"]:8.2f} {result["p99_ms"]:8.2f} '
+              f'{result["requests_per_s"]:8.1f} {result["queries"]:7} {result["alloc_peak_kb"]:9.1f}{status}')
+
+    print(f'{"endpoint":<72} {"p50":>8} {"p95":>8} {"p99":>8} {"req/s":>8} {"queries":>7} {"alloc KB":>9}')
+    with response_cache.bypassed():
+        for name, url, params in _requests(args.route):
+            run(name, lambda url=url, params=params: client.get(url, params))
+    if not args.no_writes:
+        with transaction.atomic():
+            # warmup, measured and traced requests
+            for name, send in _writes(client, user, args.warmup + args.requests + 1):
+                if not args.route or args.route in name.split(' ')[0]:
+                    run(name, send)
+            transaction.set_rollback(True)
+    if not results:
+        raise SystemExit('no endpoint matches --route')
+    print(f'peak RSS {_rss_peak_mb():.1f} MB')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'meta': _meta(dataset, args), 'endpoints': results}, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['meta'].get('counts') != dataset['counts']:
+            print('warning: the baseline was measured on a different dataset')
+        endpoints = {name: result for name, result in baseline['endpoints'].items()
+                     if not args.route or args.route in name.split(' ')[0]}
+        lines, regressed = compare(results, endpoints, args.threshold)
+        print(f'compared with {args.baseline} ({baseline["meta"].get("commit")}):')
+        print('\n'.join(lines) or '  no changes beyond the threshold')
+        if regressed and args.fail_on_regression:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Token authentication benchmark.
+
+Clients with their own API tokens request their bookings
+(BookingViewSet.list) in turn: first with DRF's TokenAuthentication, then
+with ``trips.authentication.CachedTokenAuthentication``. The run reports the
+latency and queries per request of both, the per-request saving and the
+cache hit ratio. ``--max-entries`` below ``--users`` shows an LRU that
+evicts:
+
+    python -m benchmarks.token_auth --users 200 --requests 5000
+    python -m benchmarks.token_auth --users 200 --max-entries 100
+"""
+import argparse
+import random
+import time
+from unittest import mock
+from .common import percentile, scratch_db_path, setup_django
+
+def _seed(users):
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    created = User.objects.bulk_create([User(username=f'client{i}') for i in range(users)])
+    return [token.key for token in Token.objects.bulk_create(
+        [Token(user=user, key=Token.generate_key()) for user in created])]
+
+def _run(authentication_class, keys, requests, seed):
+    from django.db import connection
+    from django.test import Client
+    from hiking.views import BookingViewSet
+
+    rng = random.Random(seed)
+    client = Client()
+    latencies, queries = [], [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    with mock.patch.object(BookingViewSet, 'authentication_classes', [authentication_class]), \
+            connection.execute_wrapper(count):
+        for _ in range(requests):
+            key = rng.choice(keys)
+            started = time.perf_counter()
+            response = client.get('/api/api/v1/bookings/', HTTP_AUTHORIZATION=f'Token {key}')
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+    return latencies, queries[0] / requests
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200, help='clients, each with a token')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--max-entries', type=int, help='in-process LRU size (default: TOKEN_AUTH_CACHE)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django(scratch_db_path('token-auth'), migrate=True)
+    from django.conf import settings
+    from rest_framework.authentication import TokenAuthentication
+    from trips.authentication import CachedTokenAuthentication, token_cache
+
+    settings.ALLOWED_HOSTS = ['*']
+    settings.DEBUG = False
+    if args.max_entries:
+        settings.TOKEN_AUTH_CACHE = {**settings.TOKEN_AUTH_CACHE, 'MAX_ENTRIES': args.max_entries}
+    keys = _seed(args.users)
+
+    print(f'users: {args.users}, requests: {args.requests}, LRU entries: {token_cache.options["MAX_ENTRIES"]}')
+    results = {}
+    for label, authentication_class in (('token', TokenAuthentication), ('cached', CachedTokenAuthentication)):
+        _run(authentication_class, keys, 50, args.seed + 1)  # warm up
+        token_cache.clear()
+        before = token_cache.stats()
+        latencies, queries = results[label] = _run(authentication_class, keys, args.requests, args.seed)
+        print(f'{label:<7} p50 {percentile(latencies, 50) * 1000:6.2f} ms   p95 {percentile(latencies, 95) * 1000:6.2f} ms'
+              f'   requests/s {args.requests / sum(latencies):8.1f}   queries/request {queries:.2f}')
+    saved = percentile(results['token'][0], 50) - percentile(results['cached'][0], 50)
+    print(f'saving per request: {saved * 1000:.3f} ms p50, {results["token"][1] - results["cached"][1]:.2f} queries')
+    stats = {name: value - before[name] for name, value in token_cache.stats().items()}
+    lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+    stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups
+    print(f'token cache: hit ratio {stats["hit_ratio"]:.1%}, {stats["local_hits"]} local hits, '
+          f'{stats["shared_hits"]} shared hits, {stats["misses"]} misses, {stats["evictions"]} evictions')
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     
@@ -16,6 +16,12 @@ urlpatterns = [
     # Utilities
     path('stats/', views.blog_stats, name='blog-stats'),
     path('search/', views.search_posts, name='search-posts'),
+    
+    # Async variants of the read endpoints (ASGI)
+    path('async/posts/', async_views.post_list, name='async-blog-post-list'),
+    path('async/posts/<slug:slug>/', async_views.post_detail, name='async-blog-post-detail'),
+    path('async/categories/', async_views.category_list, name='async-blog-category-list'),
+    path('async/stats/', async_views.blog_stats, name='async-blog-stats'),
 ]
 
 # settings.py (add these to your Django settings)
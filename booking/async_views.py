@@ -0,0 +1,36 @@
+"""Async variants of the blog read endpoints (see trips.asyncviews)"""
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import NotFound
+from trips.asyncviews import drf_view, endpoint, list_response, render
+from .models import BlogPost
+from . import stats
+from .counters import view_counter
+from .views import BlogPostDetailView, BlogPostListView, CategoryListView, sparse_posts
+
+@endpoint
+async def post_list(request):
+    return await list_response(BlogPostListView, request)
+
+@endpoint
+async def post_detail(request, slug):
+    view = drf_view(BlogPostDetailView, request, action='retrieve', slug=slug)
+    queryset = sparse_posts(view.get_queryset(), view.serializer_class, view.request)
+    try:
+        post = await queryset.aget(slug=slug)
+    except BlogPost.DoesNotExist:
+        raise NotFound("Blog post not found")
+    # The increment may flush the buffered counts to the database
+    await sync_to_async(view_counter.increment)(post.pk)
+    return render(view.get_serializer(post).data)
+
+@endpoint
+async def category_list(request):
+    return await list_response(CategoryListView, request)
+
+@endpoint
+async def blog_stats(request):
+    return render({
+        'error': False,
+        'message': 'Blog statistics retrieved successfully',
+        'data': await stats.aload(),
+    })
@@ -0,0 +1,99 @@
+"""
+Write-coalescing counters.
+
+Page views used to cost a read-modify-write transaction each. Increments are
+now accumulated in process memory and flushed as batched atomic
+``F(field) + n`` UPDATEs at most ``VIEW_COUNTER_FLUSH_INTERVAL`` seconds after
+the first pending increment, when more than ``VIEW_COUNTER_MAX_PENDING`` rows
+are pending, and at interpreter shutdown.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from .models import BlogPost
+
+logger = logging.getLogger(__name__)
+
+# Sent after each successful flush with ``model`` and ``increments`` ({pk: n})
+counters_flushed = Signal()
+
+class BufferedCounter:
+    def __init__(self, model, field, flush_interval=5, max_pending=1000):
+        self.model = model
+        self.field = field
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def increment(self, pk, n=1):
+        with self._lock:
+            self._pending[pk] += n
+            flush_now = self.flush_interval <= 0 or len(self._pending) >= self.max_pending
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+
+    def pending(self, pk):
+        """Increments of ``pk`` not yet written to the database"""
+        return self._pending.get(pk, 0)
+
+    def total(self, obj):
+        """Persisted plus pending count for a model instance"""
+        return getattr(obj, self.field) + self.pending(obj.pk)
+
+    def flush(self):
+        """Write every pending increment, one UPDATE per distinct increment size"""
+        with self._lock:
+            increments, self._pending = self._pending, defaultdict(int)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not increments:
+            return
+        by_amount = defaultdict(list)
+        for pk, n in increments.items():
+            by_amount[n].append(pk)
+        try:
+            with transaction.atomic(using=router.db_for_write(self.model)):
+                for n, pks in by_amount.items():
+                    self.model.objects.filter(pk__in=pks).update(**{self.field: F(self.field) + n})
+        except Exception as e:
+            logger.error(f"Error flushing {self.model.__name__}.{self.field} counters: {e}")
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                for pk, n in increments.items():
+                    self._pending[pk] += n
+            return
+        counters_flushed.send(sender=self.__class__, model=self.model, increments=dict(increments))
+
+    def discard(self):
+        """Drop every pending increment without writing it (dry runs such as the query plan audit)"""
+        with self._lock:
+            self._pending = defaultdict(int)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+view_counter = BufferedCounter(
+    BlogPost,
+    'views',
+    flush_interval=getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 5),
+    max_pending=getattr(settings, 'VIEW_COUNTER_MAX_PENDING', 1000),
+)
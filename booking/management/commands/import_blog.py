@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from booking import search
+from booking.models import BlogPost, Category
+from trips.importing import Importer, natural_keys, read_rows
+
+class CategoryImporter(Importer):
+    model = Category
+    unique_fields = ('slug',)
+
+class BlogPostImporter(Importer):
+    model = BlogPost
+    unique_fields = ('slug',)
+    foreign_keys = {'author': 'author_id', 'category': 'category_id'}
+
+    def lookup_maps(self):
+        return {
+            'author': natural_keys(User.objects.all(), 'username'),
+            'category': natural_keys(Category.objects.all(), 'slug', 'name'),
+        }
+
+class Command(BaseCommand):
+    help = 'Stream blog categories or posts from a CSV/JSONL file, upserting on slug'
+
+    importers = {
+        'categories': CategoryImporter,
+        'posts': BlogPostImporter,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(self.importers))
+        parser.add_argument('path', help='CSV or JSONL file, - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per INSERT transaction')
+        parser.add_argument('--progress-every', type=int, default=50000)
+        parser.add_argument('--strict', action='store_true', help='abort on the first invalid row')
+
+    def handle(self, *args, kind, path, **options):
+        importer = self.importers[kind](
+            batch_size=options['batch_size'], progress_every=options['progress_every'],
+            stdout=self.stdout, stderr=self.stderr, strict=options['strict'],
+        )
+        message = importer.run(read_rows(path, options['format']))
+
+        # bulk_create skipped the signals that keep these in sync
+        call_command('rebuild_category_post_counts', stdout=self.stdout)
+        call_command('rebuild_blog_stats', stdout=self.stdout)
+        if kind == 'posts' and search.is_enabled():
+            call_command('rebuild_post_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from booking import stats
+
+class Command(BaseCommand):
+    help = 'Recompute the blog statistics counters served by /api/stats/'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            snapshot = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt blog stats: {snapshot.total_posts} posts, {snapshot.total_views} views'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from booking.models import BlogPost, Category
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized published post count of every blog category'
+
+    def handle(self, *args, **options):
+        counts = (BlogPost.objects.filter(category=OuterRef('pk'), is_published=True)
+                  .order_by().values('category').annotate(n=Count('pk')).values('n'))
+        updated = Category.objects.update(published_posts_count=Coalesce(Subquery(counts), Value(0)))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt post counts for {updated} categories'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from booking import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of published blog posts'
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError('Full-text search index is only available on SQLite')
+        with transaction.atomic():
+            indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} published posts'))
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS booking_blogpost_fts "
+        "USING fts5(title, excerpt, content, tokenize='porter unicode61')"
+    )
+    schema_editor.execute(
+        "INSERT INTO booking_blogpost_fts (rowid, title, excerpt, content) "
+        "SELECT id, title, excerpt, content FROM booking_blogpost WHERE is_published"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS booking_blogpost_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:28
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_published_posts_count(apps, schema_editor):
+    Category = apps.get_model('booking', 'Category')
+    counts = Category.objects.annotate(n=Count('blogpost', filter=Q(blogpost__is_published=True)))
+    for category in counts.filter(n__gt=0):
+        Category.objects.filter(pk=category.pk).update(published_posts_count=category.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_blogpost_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='published_posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_published_posts_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_blog_stats(apps, schema_editor):
+    BlogPost = apps.get_model('booking', 'BlogPost')
+    BlogStats = apps.get_model('booking', 'BlogStats')
+    AuthorStats = apps.get_model('booking', 'AuthorStats')
+    Category = apps.get_model('booking', 'Category')
+    published = BlogPost.objects.filter(is_published=True).order_by()
+    for row in published.values('category_id').annotate(views=Sum('views')).filter(views__gt=0):
+        Category.objects.filter(pk=row['category_id']).update(published_views=row['views'])
+    AuthorStats.objects.bulk_create([
+        AuthorStats(author_id=row['author_id'], posts=row['posts'], views=row['views'])
+        for row in published.values('author_id').annotate(posts=Count('id'), views=Sum('views'))
+    ])
+    totals = published.aggregate(posts=Count('id'), views=Sum('views', default=0))
+    BlogStats.objects.create(pk=1, total_posts=totals['posts'], total_views=totals['views'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_category_published_posts_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_posts', models.PositiveIntegerField(default=0)),
+                ('total_views', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Blog stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='blog_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts', models.PositiveIntegerField(default=0)),
+                ('views', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Author stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='published_views',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_blog_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:22
+
+import trips.images
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_variants',
+            field=trips.images.ImageVariantsField(blank=True, default=dict, editable=False, image_field='image'),
+        ),
+    ]
@@ -1,12 +1,20 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from trips.images import ImageVariantsField
+from trips.mixins import DenormalizedCountersMixin
 
-class Category(models.Model):
+class Category(DenormalizedCountersMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by booking.signals as posts are published, unpublished or deleted
+    published_posts_count = models.PositiveIntegerField(default=0, editable=False)
+    # Views of the published posts, maintained by booking.stats
+    published_views = models.PositiveBigIntegerField(default=0, editable=False)
+    
+    counter_fields = ('published_posts_count', 'published_views')
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -15,7 +23,7 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class BlogPost(models.Model):
+class BlogPost(DenormalizedCountersMixin, models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -23,17 +31,53 @@ class BlogPost(models.Model):
     content = models.TextField()
     excerpt = models.TextField(max_length=300, blank=True)
     image = models.ImageField(upload_to='blog_images/', blank=True, null=True)
+    image_variants = ImageVariantsField('image')
     is_published = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     views = models.PositiveIntegerField(default=0)
     
+    # Page views are flushed in batches by booking.counters.view_counter
+    counter_fields = ('views',)
+    
     class Meta:
         ordering = ['-created_at']
+        # BlogPostListView only lists published posts, ordered by one of these
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(is_published=True), name='post_published_created_idx'),
+            models.Index(fields=['views'], condition=models.Q(is_published=True), name='post_published_views_idx'),
+            models.Index(fields=['title'], condition=models.Q(is_published=True), name='post_published_title_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
 
+class BlogStats(models.Model):
+    """
+    Single-row published post and view totals behind /api/stats/, adjusted
+    with F() updates by booking.stats from post writes and view counter flushes.
+    """
+    total_posts = models.PositiveIntegerField(default=0)
+    total_views = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = "Blog stats"
+    
+    def __str__(self):
+        return f"Blog stats ({self.total_posts} posts, {self.total_views} views)"
+
+class AuthorStats(models.Model):
+    """Published posts and their views per author, adjusted with F() updates by booking.stats"""
+    author = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='blog_stats')
+    posts = models.PositiveIntegerField(default=0)
+    views = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = "Author stats"
+    
+    def __str__(self):
+        return f"{self.author_id}: {self.posts} posts, {self.views} views"
+
 class Location(models.Model):
     name = models.CharField(max_length=255)
@@ -0,0 +1,111 @@
+"""
+Full-text search over published blog posts.
+
+On SQLite the posts are mirrored into an FTS5 virtual table (created by
+migration 0003) that is kept in sync by booking.signals and can be rebuilt with
+``manage.py rebuild_post_search_index``. Queries are ranked with BM25 and
+paginated with an opaque (rank, id) cursor. Other database vendors fall back
+to ``icontains`` lookups.
+"""
+import base64
+import json
+from django.db import connections, router
+from rest_framework import filters
+from trips import search as fts
+from trips.search import match_expression
+from .models import BlogPost
+
+FTS_TABLE = 'booking_blogpost_fts'
+# BM25 weights for the indexed columns, in table order: title, excerpt, content
+COLUMN_WEIGHTS = (10.0, 3.0, 1.0)
+
+def is_enabled(using=None):
+    using = using or router.db_for_read(BlogPost)
+    return connections[using].vendor == 'sqlite'
+
+def index_post(post, using=None):
+    """Insert, refresh or drop a post's index row depending on whether it is published"""
+    with connections[using or router.db_for_write(BlogPost)].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        if post.is_published:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, excerpt, content) VALUES (%s, %s, %s, %s)',
+                [post.pk, post.title, post.excerpt, post.content],
+            )
+
+def remove_post(post_id, using=None):
+    with connections[using or router.db_for_write(BlogPost)].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+def rebuild_index(using=None):
+    """Repopulate the index from the blog post table, returns the number of indexed posts"""
+    with connections[using or router.db_for_write(BlogPost)].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, excerpt, content) '
+            f'SELECT id, title, excerpt, content FROM {BlogPost._meta.db_table} WHERE is_published'
+        )
+        return cursor.rowcount
+
+def matching_ids(text):
+    """Subquery of the ids of posts matching ``text``, usable as ``pk__in``"""
+    return fts.matching_ids(FTS_TABLE, text)
+
+def count(text):
+    """Number of published posts matching ``text``"""
+    expression = match_expression(text)
+    if not expression:
+        return 0
+    with connections[router.db_for_read(BlogPost)].cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        return cursor.fetchone()[0]
+
+def encode_cursor(rank, post_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, post_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        rank, post_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(post_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def search(text, cursor=None, limit=10):
+    """
+    Return ``(hits, next_cursor)`` where ``hits`` is a list of
+    ``(post_id, rank, snippet)`` ordered by relevance (lower rank is better).
+    """
+    expression = match_expression(text)
+    if not expression:
+        return [], None
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    sql = (
+        f'SELECT id, score, snippet FROM ('
+        f'SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score, '
+        f"snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', 16) AS snippet "
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)'
+    )
+    params = [expression]
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor)
+        sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+        params += [last_rank, last_rank, last_id]
+    sql += ' ORDER BY score, id LIMIT %s'
+    params.append(limit + 1)
+    with connections[router.db_for_read(BlogPost)].cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        hits = db_cursor.fetchall()
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor(hits[-1][1], hits[-1][0])
+    return hits, next_cursor
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """SearchFilter that answers ``?search=`` from the FTS index when it is available"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not match_expression(terms) or not is_enabled(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        return queryset.filter(pk__in=matching_ids(terms))
@@ -0,0 +1,64 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .counters import counters_flushed
+from .models import BlogPost, Category
+from . import search, stats
+
+def adjust_published_posts_count(category_id, delta):
+    Category.objects.filter(pk=category_id).update(published_posts_count=F('published_posts_count') + delta)
+
+@receiver(pre_save, sender=BlogPost)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    instance._state_before = None
+    if raw or instance._state.adding:
+        return
+    instance._state_before = BlogPost.objects.filter(pk=instance.pk).values(*stats.POST_FIELDS).first()
+
+@receiver(post_save, sender=BlogPost)
+def update_category_post_count(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_state_before', None)
+    if before is not None and (before['is_published'], before['category_id']) == (
+            instance.is_published, instance.category_id):
+        return
+    if before is not None and before['is_published']:
+        adjust_published_posts_count(before['category_id'], -1)
+    if instance.is_published:
+        adjust_published_posts_count(instance.category_id, 1)
+
+@receiver(post_save, sender=BlogPost)
+def update_blog_stats_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    after = stats.post_state(instance)
+    before = getattr(instance, '_state_before', None)
+    if before is not None:
+        # Views are never written by save(), the stored value is the current one
+        after['views'] = before['views']
+    stats.post_saved(before, after)
+
+@receiver(post_save, sender=BlogPost)
+def index_blog_post(sender, instance, raw=False, using=None, **kwargs):
+    if not raw and search.is_enabled(using):
+        search.index_post(instance, using=using)
+
+@receiver(post_delete, sender=BlogPost)
+def unindex_blog_post(sender, instance, using=None, **kwargs):
+    if search.is_enabled(using):
+        search.remove_post(instance.pk, using=using)
+
+@receiver(post_delete, sender=BlogPost)
+def decrement_category_post_count(sender, instance, **kwargs):
+    if instance.is_published:
+        adjust_published_posts_count(instance.category_id, -1)
+
+@receiver(post_delete, sender=BlogPost)
+def update_blog_stats_on_delete(sender, instance, **kwargs):
+    stats.post_deleted(stats.post_state(instance))
+
+@receiver(counters_flushed)
+def update_blog_stats_on_views_flush(sender, model, increments, **kwargs):
+    if model is BlogPost:
+        stats.views_flushed(increments)
@@ -0,0 +1,145 @@
+"""
+Incrementally maintained blog statistics.
+
+``/api/stats/`` is read from counter columns: the BlogStats row holds the
+totals, ``Category.published_posts_count``/``published_views`` and
+AuthorStats the per-category and per-author figures, and the most viewed
+posts come off the partial index on ``BlogPost.views``. Post writes and view
+counter flushes apply their deltas as F() UPDATEs of the few rows they touch
+(see booking.signals), so no write rewrites more than those rows.
+
+Reads never build anything. The counters are filled by migration 0005 and
+recomputed on the primary by ``manage.py rebuild_blog_stats``. A missing
+BlogStats or AuthorStats row stands for zeros and is created by the first
+write that needs it.
+"""
+import asyncio
+from collections import Counter, defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import AuthorStats, BlogPost, BlogStats, Category
+
+TOP_POSTS = 10
+POST_FIELDS = ('id', 'title', 'slug', 'category_id', 'author_id', 'views', 'is_published')
+STATS_PK = 1
+
+def post_state(post):
+    """The fields of a post the statistics depend on, as stored by the pre_save handler"""
+    return {field: getattr(post, field) for field in POST_FIELDS}
+
+def rebuild():
+    """Recompute every counter from the posts; run it on the primary"""
+    published = BlogPost.objects.filter(is_published=True).order_by()
+    per_category = published.filter(category=OuterRef('pk')).values('category')
+    with transaction.atomic():
+        Category.objects.update(
+            published_posts_count=Coalesce(Subquery(per_category.annotate(n=Count('pk')).values('n')), Value(0)),
+            published_views=Coalesce(Subquery(per_category.annotate(n=Sum('views')).values('n')), Value(0)),
+        )
+        AuthorStats.objects.all().delete()
+        AuthorStats.objects.bulk_create([
+            AuthorStats(author_id=row['author_id'], posts=row['posts'], views=row['views'])
+            for row in published.values('author_id').annotate(posts=Count('id'), views=Sum('views'))
+        ])
+        totals = published.aggregate(posts=Count('id'), views=Sum('views', default=0))
+        stats, _ = BlogStats.objects.update_or_create(
+            pk=STATS_PK, defaults={'total_posts': totals['posts'], 'total_views': totals['views']})
+    return stats
+
+def _reads():
+    """The four independent reads behind the payload: the totals row and the three lists"""
+    totals = BlogStats.objects.filter(pk=STATS_PK).values('total_posts', 'total_views')
+    categories = Category.objects.order_by('name').values(
+        'id', 'name', 'slug', posts=F('published_posts_count'), views=F('published_views'))
+    authors = (AuthorStats.objects.filter(posts__gt=0).order_by('-views', 'author_id')
+               .values('author_id', 'author__username', 'posts', 'views'))
+    top_posts = (BlogPost.objects.filter(is_published=True).order_by('-views', 'id')
+                 .values('id', 'title', 'slug', 'views')[:TOP_POSTS])
+    return totals, categories, authors, top_posts
+
+def _payload(totals, categories, authors, top_posts):
+    totals = totals or {'total_posts': 0, 'total_views': 0}
+    return {
+        'total_posts': totals['total_posts'],
+        'total_categories': len(categories),
+        'total_views': totals['total_views'],
+        'categories': categories,
+        'authors': [
+            {'id': row['author_id'], 'username': row['author__username'], 'posts': row['posts'], 'views': row['views']}
+            for row in authors
+        ],
+        'top_posts': top_posts,
+    }
+
+def load():
+    """The /api/stats/ payload"""
+    totals, *lists = _reads()
+    return _payload(totals.first(), *map(list, lists))
+
+async def aload():
+    """load() on the async ORM, awaiting the four reads together"""
+    totals, *lists = _reads()
+
+    async def fetch(queryset):
+        return [row async for row in queryset]
+    return _payload(*await asyncio.gather(totals.afirst(), *map(fetch, lists)))
+
+def _add(model, pk, deltas):
+    """F() increments of ``deltas`` on row ``pk`` of ``model``, creating a stats row on first use"""
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(pk=pk).update(**changes):
+        return
+    if model is Category or min(deltas.values()) < 0:
+        # Categories are not ours to create, and a missing row has nothing to take away
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(pk=pk, **deltas)
+    except IntegrityError:
+        # Created by a concurrent write in the meantime
+        model.objects.filter(pk=pk).update(**changes)
+
+def _apply(changes):
+    """Write ``{(model, pk): Counter of field deltas}``, skipping what adds up to nothing"""
+    with transaction.atomic():
+        # In a fixed order, so concurrent writers lock rows in the same order
+        for (model, pk), deltas in sorted(changes.items(), key=lambda item: (item[0][0]._meta.label, item[0][1])):
+            deltas = {field: delta for field, delta in deltas.items() if delta}
+            if deltas:
+                _add(model, pk, deltas)
+
+def _count_post(changes, post, sign):
+    views = sign * post['views']
+    changes[(BlogStats, STATS_PK)].update(total_posts=sign, total_views=views)
+    changes[(AuthorStats, post['author_id'])].update(posts=sign, views=views)
+    # published_posts_count is kept by booking.signals
+    changes[(Category, post['category_id'])].update(published_views=views)
+
+def post_saved(before, after):
+    """Apply a post write, ``before``/``after`` being post_state() dicts (``before`` None on create)"""
+    if before == after:
+        return
+    changes = defaultdict(Counter)
+    if before is not None and before['is_published']:
+        _count_post(changes, before, -1)
+    if after['is_published']:
+        _count_post(changes, after, 1)
+    _apply(changes)
+
+def post_deleted(state):
+    if state['is_published']:
+        changes = defaultdict(Counter)
+        _count_post(changes, state, -1)
+        _apply(changes)
+
+def views_flushed(increments):
+    """Apply a view counter flush, ``increments`` mapping post ids to added views"""
+    changes = defaultdict(Counter)
+    for post in BlogPost.objects.filter(pk__in=increments, is_published=True).values('id', 'author_id',
+                                                                                     'category_id'):
+        added = increments[post['id']]
+        changes[(BlogStats, STATS_PK)]['total_views'] += added
+        changes[(AuthorStats, post['author_id'])]['views'] += added
+        changes[(Category, post['category_id'])]['published_views'] += added
+    _apply(changes)
@@ -1,3 +1,369 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from booking import stats
+from booking.counters import BufferedCounter, counters_flushed, view_counter
+from booking.models import AuthorStats, BlogPost, BlogStats, Category
+from serializer.booking_serializers import BlogPostListSerializer
 
-# Create your tests here.
+class BlogSearchTests(TestCase):
+    """search_posts ranks posts with the FTS index, which follows every post write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.category = Category.objects.create(name='Trails', slug='trails')
+
+    def create_post(self, title, content='Trail notes', excerpt='', is_published=True):
+        return BlogPost.objects.create(title=title, slug=title.lower().replace(' ', '-'), author=self.author,
+                                       category=self.category, content=content, excerpt=excerpt,
+                                       is_published=is_published)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def titles(self, query):
+        return [post['title'] for post in self.search(query)['data']]
+
+    def test_ranking(self):
+        self.create_post('Packing list', content='What to bring up a glacier')
+        self.create_post('Glacier crossings', content='Ropes and crampons')
+        self.create_post('Summit day', excerpt='Dawn on the glacier')
+        # Title matches first, then the excerpt, then the body
+        self.assertEqual(self.titles('glacier'), ['Glacier crossings', 'Summit day', 'Packing list'])
+        # Every term must match, as a prefix
+        self.assertEqual(self.titles('glac rope'), ['Glacier crossings'])
+        self.assertIn('<mark>', self.search('crampons')['data'][0]['snippet'])
+
+    def test_index_follows_writes(self):
+        post = self.create_post('Monsoon treks', is_published=False)
+        self.assertEqual(self.titles('monsoon'), [])
+        post.is_published = True
+        post.save()
+        self.assertEqual(self.titles('monsoon'), ['Monsoon treks'])
+        post.title = 'Winter treks'
+        post.save()
+        self.assertEqual(self.titles('monsoon'), [])
+        self.assertEqual(self.titles('winter'), ['Winter treks'])
+        post.delete()
+        self.assertEqual(self.titles('winter'), [])
+
+    def test_cursor_pages_and_total_count(self):
+        for i in range(5):
+            self.create_post(f'Ridge walk {i}')
+        seen, cursor = [], None
+        while True:
+            data = self.search('ridge', page_size=2, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(data['count'], 5)
+            self.assertLessEqual(len(data['data']), 2)
+            seen += [post['title'] for post in data['data']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), [f'Ridge walk {i}' for i in range(5)])
+        self.assertEqual(self.client.get('/api/search/', {'q': 'ridge', 'cursor': 'nope'}).status_code, 400)
+
+class CategoryPostCountTests(TestCase):
+    """Category.published_posts_count follows posts being published, moved and deleted"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.categories = [Category.objects.create(name=f'Topic {i}', slug=f'topic-{i}') for i in range(2)]
+
+    def counts(self):
+        return list(Category.objects.order_by('pk').values_list('published_posts_count', flat=True))
+
+    def test_post_writes(self):
+        draft = BlogPost.objects.create(title='Draft', slug='draft', author=self.author, category=self.categories[0],
+                                        content='Notes')
+        post = BlogPost.objects.create(title='Live', slug='live', author=self.author, category=self.categories[0],
+                                       content='Notes', is_published=True)
+        self.assertEqual(self.counts(), [1, 0])
+        draft.is_published = True
+        draft.save()
+        post.category = self.categories[1]
+        post.save()
+        self.assertEqual(self.counts(), [1, 1])
+        draft.is_published = False
+        draft.save()
+        self.assertEqual(self.counts(), [0, 1])
+        post.delete()
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_rebuild_and_listed_counts(self):
+        BlogPost.objects.create(title='Live', slug='live', author=self.author, category=self.categories[1],
+                                content='Notes', is_published=True)
+        Category.objects.update(published_posts_count=5)
+        call_command('rebuild_category_post_counts', stdout=StringIO())
+        self.assertEqual(self.counts(), [0, 1])
+        # Post payloads read the counter, the category list counts
+        self.assertEqual(self.client.get('/api/posts/').json()['results'][0]['category']['post_count'], 1)
+        categories = self.client.get('/api/categories/').json()['results']
+        self.assertEqual(sorted(category['post_count'] for category in categories), [0, 1])
+
+class BlogStatsTests(TestCase):
+    """/api/stats/ reads counters that every post write and view flush keeps equal to a rebuild"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [User.objects.create(username=f'author{i}') for i in range(2)]
+        cls.categories = [Category.objects.create(name=f'Topic {i}', slug=f'topic-{i}') for i in range(3)]
+
+    def create_post(self, i, author=0, category=0, is_published=True, views=0):
+        return BlogPost.objects.create(title=f'Post {i}', slug=f'post-{i}', author=self.authors[author],
+                                       category=self.categories[category], content='Notes',
+                                       is_published=is_published, views=views)
+
+    def assertMatchesRebuild(self):
+        maintained = stats.load()
+        stats.rebuild()
+        self.assertEqual(maintained, stats.load())
+        return maintained
+
+    def test_counters_follow_writes(self):
+        posts = [self.create_post(i, author=i % 2, category=i % 3, views=i * 10) for i in range(6)]
+        draft = self.create_post(6, is_published=False, views=99)
+        data = self.assertMatchesRebuild()
+        self.assertEqual((data['total_posts'], data['total_views'], data['total_categories']), (6, 150, 3))
+        self.assertEqual([post['id'] for post in data['top_posts'][:2]], [posts[5].pk, posts[4].pk])
+
+        counter = BufferedCounter(BlogPost, 'views', flush_interval=60)
+        counter.increment(posts[0].pk, 100)
+        counter.increment(draft.pk, 5)
+        counter.flush()
+        data = self.assertMatchesRebuild()
+        self.assertEqual(data['top_posts'][0]['id'], posts[0].pk)
+
+        post = BlogPost.objects.get(pk=posts[0].pk)
+        post.category = self.categories[2]
+        post.author = self.authors[1]
+        post.save()
+        draft.is_published = True
+        draft.save()
+        posts[1].is_published = False
+        posts[1].save()
+        self.assertMatchesRebuild()
+
+        posts[2].delete()
+        self.authors[1].delete()
+        self.categories[1].delete()
+        data = self.assertMatchesRebuild()
+        self.assertEqual([author['username'] for author in data['authors']], ['author0'])
+
+    def test_async_load(self):
+        self.assertEqual(async_to_sync(stats.aload)(), stats.load())
+        for i in range(4):
+            self.create_post(i, author=i % 2, category=i % 3, views=i * 10)
+        self.create_post(4, is_published=False)
+        data = async_to_sync(stats.aload)()
+        self.assertEqual(data, stats.load())
+        self.assertEqual(self.client.get('/api/async/stats/').json()['data'], data)
+
+    def test_reads_never_write(self):
+        self.create_post(1)
+        BlogStats.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/stats/')
+        self.assertEqual(response.json()['data']['total_posts'], 0)
+        self.assertFalse([query for query in queries if not query['sql'].startswith('SELECT')])
+        # The first write creates the row from zero
+        self.create_post(2)
+        self.assertEqual(BlogStats.objects.get().total_posts, 1)
+
+    def test_writes_only_touch_their_rows(self):
+        post = self.create_post(1)
+        for i in range(20):
+            Category.objects.create(name=f'Extra {i}', slug=f'extra-{i}')
+        view_counter.increment(post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            view_counter.flush()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        # The post, the totals, its author and its category
+        self.assertEqual(len(updates), 4)
+        self.assertEqual(AuthorStats.objects.get(pk=self.authors[0].pk).views, 1)
+
+class SparseFieldsetTests(TestCase):
+    """?fields=/?expand= on blog posts render only what is asked for and join only what they render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', first_name='Tenzing')
+        cls.category = Category.objects.create(name='Trails', slug='trails')
+        cls.post = BlogPost.objects.create(title='Spring on the trail', slug='spring', author=cls.author,
+                                           category=cls.category, content='Long notes', excerpt='Short',
+                                           is_published=True)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_list(self):
+        data, queries = self.get('/api/posts/', fields='id,title,author')
+        self.assertEqual(data['results'], [{'id': self.post.pk, 'title': 'Spring on the trail',
+                                            'author': self.author.pk}])
+        self.assertFalse([sql for sql in queries if 'JOIN' in sql])
+        data, queries = self.get('/api/posts/', expand='author')
+        self.assertEqual(data['results'][0]['author']['first_name'], 'Tenzing')
+        self.assertEqual(data['results'][0]['category'], self.category.pk)
+        self.assertNotIn('"booking_category"', queries[-1])
+
+    def test_detail(self):
+        self.addCleanup(view_counter.discard)
+        data, queries = self.get('/api/posts/spring/', fields='title,content')
+        self.assertEqual(data, {'title': 'Spring on the trail', 'content': 'Long notes'})
+        self.assertNotIn('"excerpt"', queries[-1])
+        full, _ = self.get('/api/posts/spring/')
+        expanded, _ = self.get('/api/posts/spring/', expand='author,category')
+        # Buffered views aside, expanding everything is the full representation
+        self.assertEqual({**expanded, 'views': 0}, {**full, 'views': 0})
+
+class ViewCounterTests(TestCase):
+    """Page views are buffered in memory and written as batched F() updates"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author')
+        category = Category.objects.create(name='Trails', slug='trails')
+        cls.posts = [BlogPost.objects.create(title=f'Post {i}', slug=f'post-{i}', author=author, category=category,
+                                             content='Trail notes', is_published=True) for i in range(4)]
+
+    def setUp(self):
+        self.counter = BufferedCounter(BlogPost, 'views', flush_interval=60, max_pending=3)
+        self.addCleanup(self.counter.discard)
+
+    def views(self):
+        return [post.views for post in BlogPost.objects.order_by('pk')]
+
+    def test_flush_batches_increments(self):
+        flushed = []
+        counters_flushed.connect(lambda increments, **kwargs: flushed.append(increments), weak=False,
+                                 dispatch_uid='test-view-counter')
+        self.addCleanup(counters_flushed.disconnect, dispatch_uid='test-view-counter')
+        for pk, n in ((self.posts[0].pk, 2), (self.posts[1].pk, 2), (self.posts[2].pk, 1)):
+            for _ in range(n):
+                self.counter.increment(pk)
+        # The third pending row reached max_pending
+        self.assertEqual(self.views(), [2, 2, 1, 0])
+        self.assertEqual(flushed, [{self.posts[0].pk: 2, self.posts[1].pk: 2, self.posts[2].pk: 1}])
+
+        self.counter.increment(self.posts[3].pk, 5)
+        self.assertEqual(self.views(), [2, 2, 1, 0])
+        self.assertEqual(self.counter.total(self.posts[3]), 5)
+        with CaptureQueriesContext(connection) as queries:
+            self.counter.flush()
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "booking_blogpost"')]), 1)
+        self.assertEqual(self.views(), [2, 2, 1, 5])
+
+    def test_failed_flush_keeps_increments(self):
+        self.counter.increment(self.posts[0].pk, 3)
+        with mock.patch.object(BlogPost.objects, 'filter', side_effect=RuntimeError('locked')), \
+                self.assertLogs('booking.counters', 'ERROR'):
+            self.counter.flush()
+        self.assertEqual(self.counter.pending(self.posts[0].pk), 3)
+        self.counter.flush()
+        self.assertEqual(self.views()[0], 3)
+
+    def test_saving_a_post_keeps_concurrent_views(self):
+        post = BlogPost.objects.get(pk=self.posts[0].pk)
+        self.counter.increment(post.pk, 4)
+        self.counter.flush()
+        post.title = 'Renamed'
+        post.save()
+        self.assertEqual(self.views()[0], 4)
+
+    def test_detail_counts_views(self):
+        self.addCleanup(view_counter.discard)
+        for _ in range(2):
+            response = self.client.get(f'/api/posts/{self.posts[0].slug}/')
+        self.assertEqual(response.json()['views'], 2)
+        view_counter.flush()
+        self.assertEqual(self.views()[0], 2)
+
+class BlogPostFastPathParityTests(TestCase):
+    """The fast read path must render BlogPostListView exactly like BlogPostListSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [User.objects.create(username=f'author{i}', first_name='Ada', last_name=f'{i}') for i in range(2)]
+        categories = [Category.objects.create(name=f'Topic {i}', slug=f'topic-{i}') for i in range(3)]
+        cls.posts = [
+            BlogPost.objects.create(
+                title=f'Post {i}', slug=f'post-{i}', author=authors[i % 2], category=categories[i % 3],
+                content='Trail notes', excerpt='Ünïcode ✓', image=f'blog_images/{i}.jpg' if i % 2 else None,
+                is_published=i != 7, views=i * 10,
+            )
+            for i in range(15)
+        ]
+
+    def assertSameOutput(self, url):
+        responses = []
+        for fast in (False, True):
+            with override_settings(FAST_READ_PATH=fast):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            responses.append(response)
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(responses[0].content, responses[1].content)
+        return responses[1].json()
+
+    def test_list(self):
+        data = self.assertSameOutput('/api/posts/?page_size=20')
+        self.assertEqual(len(data['results']), 14)
+
+    def test_ordering_filters_and_search(self):
+        self.assertSameOutput('/api/posts/?ordering=-views')
+        self.assertSameOutput(f'/api/posts/?category={self.posts[1].category_id}')
+        self.assertSameOutput('/api/posts/?search=Post')
+
+    def test_cursor_pages(self):
+        data = self.assertSameOutput('/api/posts/?page_size=4&ordering=title')
+        self.assertSameOutput(data['next'])
+
+    def test_pending_views(self):
+        view_counter.increment(self.posts[0].pk)
+        try:
+            data = self.assertSameOutput('/api/posts/?ordering=views')
+        finally:
+            view_counter.flush()
+        self.assertEqual(data['results'][0]['views'], 1)
+
+    @override_settings(FAST_READ_PATH=True)
+    def test_fast_path_skips_the_serializer(self):
+        with mock.patch.object(BlogPostListSerializer, 'to_representation', side_effect=AssertionError):
+            self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+class AsyncEndpointTests(TestCase):
+    """The /api/async/ variants return what the synchronous endpoints do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BlogPostFastPathParityTests.setUpTestData()
+        cls.posts = BlogPostFastPathParityTests.posts
+
+    def assertSameAsSync(self, sync_url, async_url):
+        expected = self.client.get(sync_url)
+        response = self.client.get(async_url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content.replace(b'/api/posts/', b'/api/async/posts/'))
+
+    def test_lists_and_stats(self):
+        self.assertSameAsSync('/api/posts/?page_size=4&ordering=title', '/api/async/posts/?page_size=4&ordering=title')
+        self.assertSameAsSync('/api/categories/', '/api/async/categories/')
+        self.assertSameAsSync('/api/stats/', '/api/async/stats/')
+
+    def test_detail_counts_the_view(self):
+        post = self.posts[0]
+        response = self.client.get(f'/api/async/posts/{post.slug}/')
+        self.assertEqual(response.json()['views'], post.views + 1)
+        view_counter.flush()
+        self.assertEqual(self.client.get('/api/async/posts/post-7/').status_code, 404)
@@ -5,13 +5,19 @@ from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import BrowsableAPIRenderer
+from trips.fastpath import FastJSONRenderer, FastPath
+from trips.pagination import KeysetPagination
+from trips.routers import ReadReplicaMixin, replica_reads
 from rest_framework.exceptions import NotFound, ValidationError
 from django.shortcuts import get_object_or_404
 from django.http import Http404
-from django.db.models import Q
+from django.db.models import Count, Q
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import BlogPost, Category
+from . import search
+from . import stats
+from .counters import view_counter
 from serializer.booking_serializers import (
     BlogPostListSerializer, 
     BlogPostDetailSerializer,
@@ -22,40 +28,63 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-class StandardResultsSetPagination(PageNumberPagination):
+def sparse_posts(queryset, serializer_class, request, *columns):
+    """Join author/category unless ?fields=/?expand= leave them out, and load only rendered ``columns``"""
+    requested = serializer_class.requested(request)
+    if requested is None:
+        return queryset.select_related('author', 'category')
+    if requested[1]:
+        # select_related() without names would follow every foreign key
+        queryset = queryset.select_related(*requested[1])
+    return queryset.only(*serializer_class.model_columns(requested), *columns)
+
+class StandardResultsSetPagination(KeysetPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = ('-created_at', '-id')
 
-class BlogPostListView(generics.ListAPIView):
+class BlogPostListView(ReadReplicaMixin, generics.ListAPIView):
     serializer_class = BlogPostListSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, search.FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'author']
     search_fields = ['title', 'content', 'excerpt']
     ordering_fields = ['created_at', 'views', 'title']
     ordering = ['-created_at']
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    fast_path = FastPath(BlogPostListSerializer, overrides={
+        'views': (['views'], lambda row: row['views'] + view_counter.pending(row['id'])),
+        'category.post_count': (['category__published_posts_count'],
+                                lambda row: row['category__published_posts_count']),
+    })
+    
+    def list(self, request, *args, **kwargs):
+        if not self.fast_path.applies(request):
+            return super().list(request, *args, **kwargs)
+        return self.fast_path.list_response(self, self.filter_queryset(self.get_queryset()))
     
     def get_queryset(self):
         try:
-            queryset = BlogPost.objects.filter(is_published=True).select_related('author', 'category')
-            return queryset
+            queryset = BlogPost.objects.filter(is_published=True)
+            return sparse_posts(queryset, self.serializer_class, self.request, *self.ordering_fields)
         except Exception as e:
             logger.error(f"Error in BlogPostListView: {e}")
             raise ValidationError("Error retrieving blog posts")
 
-class BlogPostDetailView(generics.RetrieveAPIView):
+class BlogPostDetailView(ReadReplicaMixin, generics.RetrieveAPIView):
+    queryset = BlogPost.objects.filter(is_published=True)
     serializer_class = BlogPostDetailSerializer
     lookup_field = 'slug'
     
     def get_object(self):
         try:
             slug = self.kwargs.get('slug')
-            obj = get_object_or_404(BlogPost, slug=slug, is_published=True)
+            queryset = sparse_posts(self.get_queryset(), self.serializer_class, self.request)
+            obj = get_object_or_404(queryset, slug=slug)
             
-            # Increment view count
-            obj.views += 1
-            obj.save(update_fields=['views'])
+            # Buffered increment, flushed in batches by the view counter
+            view_counter.increment(obj.pk)
             
             return obj
         except Http404:
@@ -102,32 +131,30 @@ class BlogPostDeleteView(generics.DestroyAPIView):
         except Http404:
             raise NotFound("Blog post not found or you don't have permission to delete it")
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(ReadReplicaMixin, generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     
     def get_queryset(self):
         try:
-            return Category.objects.all()
+            return Category.objects.annotate(
+                post_count=Count('blogpost', filter=Q(blogpost__is_published=True))
+            )
         except Exception as e:
             logger.error(f"Error in CategoryListView: {e}")
             raise ValidationError("Error retrieving categories")
 
 @api_view(['GET'])
+@replica_reads()
 def blog_stats(request):
     """
     Get blog statistics
     """
     try:
-        stats = {
-            'total_posts': BlogPost.objects.filter(is_published=True).count(),
-            'total_categories': Category.objects.count(),
-            'total_views': sum(BlogPost.objects.filter(is_published=True).values_list('views', flat=True)),
-        }
         return Response({
             'error': False,
             'message': 'Blog statistics retrieved successfully',
-            'data': stats
+            'data': stats.load()
         })
     except Exception as e:
         logger.error(f"Error getting blog stats: {e}")
@@ -137,9 +164,11 @@ def blog_stats(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
+@replica_reads()
 def search_posts(request):
     """
-    Search blog posts
+    Search blog posts, ranked by relevance and paginated with ``cursor``.
+    ``count`` is the number of matching posts, not the size of the page.
     """
     try:
         query = request.GET.get('q', '')
@@ -149,19 +178,46 @@ def search_posts(request):
                 'message': 'Search query is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        posts = BlogPost.objects.filter(
-            Q(title__icontains=query) | 
-            Q(content__icontains=query) | 
-            Q(excerpt__icontains=query),
-            is_published=True
-        )
+        try:
+            page_size = min(int(request.GET.get('page_size', StandardResultsSetPagination.page_size)),
+                            StandardResultsSetPagination.max_page_size)
+        except ValueError:
+            page_size = StandardResultsSetPagination.page_size
+        
+        if search.is_enabled():
+            try:
+                hits, next_cursor = search.search(query, cursor=request.GET.get('cursor'), limit=max(page_size, 1))
+            except ValueError:
+                return Response({
+                    'error': True,
+                    'message': 'Invalid cursor'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            posts = BlogPost.objects.select_related('author', 'category').in_bulk([hit[0] for hit in hits])
+            data = []
+            for post_id, rank, snippet in hits:
+                if post_id in posts:
+                    item = BlogPostListSerializer(posts[post_id], context={'request': request}).data
+                    item['snippet'] = snippet
+                    data.append(item)
+            # A lone page holds every match, only later or partial pages need counting
+            total = len(hits) if next_cursor is None and 'cursor' not in request.GET else search.count(query)
+        else:
+            posts = BlogPost.objects.filter(
+                Q(title__icontains=query) | 
+                Q(content__icontains=query) | 
+                Q(excerpt__icontains=query),
+                is_published=True
+            ).select_related('author', 'category')
+            total = posts.count()
+            data = BlogPostListSerializer(posts[:page_size], many=True, context={'request': request}).data
+            next_cursor = None
         
-        serializer = BlogPostListSerializer(posts, many=True)
         return Response({
             'error': False,
             'message': 'Search completed successfully',
-            'data': serializer.data,
-            'count': posts.count()
+            'data': data,
+            'count': total,
+            'next_cursor': next_cursor
         })
     except Exception as e:
         logger.error(f"Error in search: {e}")
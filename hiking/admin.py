@@ -18,10 +18,12 @@ class LocationAdmin(admin.ModelAdmin):
 
 @admin.register(Tour)
 class TourAdmin(admin.ModelAdmin):
-    list_display = ['title', 'category', 'location', 'difficulty', 'price', 'featured', 'active']
+    list_display = ['title', 'category', 'location', 'difficulty', 'price', 'average_rating',
+                    'reviews_count', 'featured', 'active']
     list_filter = ['category', 'difficulty', 'featured', 'active', 'created_at']
     search_fields = ['title', 'description']
     list_editable = ['featured', 'active']
+    readonly_fields = ['average_rating', 'reviews_count', 'rating_histogram']
 
 @admin.register(TourDate)
 class TourDateAdmin(admin.ModelAdmin):
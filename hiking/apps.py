@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class HikingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hiking'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,19 @@
+"""Async variants of the catalog read endpoints (see trips.asyncviews)"""
+from trips.asyncviews import detail_response, endpoint, list_response
+from .views import CategoryViewSet, TourDateViewSet, TourViewSet
+
+@endpoint
+async def category_list(request):
+    return await list_response(CategoryViewSet, request)
+
+@endpoint
+async def tour_list(request):
+    return await list_response(TourViewSet, request)
+
+@endpoint
+async def tour_detail(request, pk):
+    return await detail_response(TourViewSet, request, pk=pk)
+
+@endpoint
+async def tour_date_list(request):
+    return await list_response(TourDateViewSet, request)
@@ -0,0 +1,143 @@
+"""
+Compact per-day availability calendars for tours.
+
+A month of one tour is encoded as::
+
+    {"days": [[3, 5, 12], [27, 31, 4]],  # [first day, last day, spots left] runs
+     "starts": [3, 27], "ends": [5]}      # days a departure starts/ends
+
+Each run covers consecutive days with the same number of seats left on the
+departures running them (summed when several overlap); days without a
+departure are left out. Months are built
+with one aggregate query over TourDate for everything missing from the cache
+and stored per (tour, month) in the ``AVAILABILITY_CACHE_ALIAS`` cache, keyed
+on a per-tour version. hiking.signals bumps the version of a tour once one of
+its dates is saved, deleted or has seats taken or returned. The versions are
+read before anything is built, so months built while an invalidation commits
+are stored against the old version and never served.
+"""
+import calendar as calendar_module
+import datetime
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Sum
+from .models import TourDate
+
+MAX_MONTHS = 12
+MAX_TOURS = 50
+
+def _cache():
+    return caches[getattr(settings, 'AVAILABILITY_CACHE_ALIAS', 'default')]
+
+def _timeout():
+    return getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 24 * 60 * 60)
+
+def months_between(first, last):
+    """First days of the months from ``first`` to ``last`` inclusive"""
+    month = first.replace(day=1)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+    return months
+
+def month_end(month):
+    return month.replace(day=calendar_module.monthrange(month.year, month.month)[1])
+
+def cache_key(tour_id, version, month):
+    return f'availability:{tour_id}:{version}:{month:%Y-%m}'
+
+def version_key(tour_id):
+    return f'availability:{tour_id}:version'
+
+def _versions(cache, tour_ids):
+    """``{tour_id: version}``, seeding missing versions like trips.cache.SharedTagVersions"""
+    keys = {tour_id: version_key(tour_id) for tour_id in tour_ids}
+    found = cache.get_many(list(keys.values()))
+    for key in keys.values() - found.keys():
+        # A clock value, so a version that was evicted never matches the months stored before
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key)
+    return {tour_id: found[key] for tour_id, key in keys.items()}
+
+def _encode_month(month, departures):
+    days = month_end(month).day
+    spots = [None] * days
+    starts, ends = [], []
+    for start_date, end_date, available in departures:
+        if start_date.year == month.year and start_date.month == month.month:
+            starts.append(start_date.day)
+        if end_date.year == month.year and end_date.month == month.month:
+            ends.append(end_date.day)
+        first = max(start_date, month).day
+        last = min(end_date, month_end(month)).day
+        for day in range(first - 1, last):
+            spots[day] = (spots[day] or 0) + available
+    runs = []
+    for day, available in enumerate(spots, 1):
+        if available is None:
+            continue
+        if runs and runs[-1][1] == day - 1 and runs[-1][2] == available:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day, available])
+    return {'days': runs, 'starts': sorted(set(starts)), 'ends': sorted(set(ends))}
+
+def build(tour_ids, months):
+    """Encode ``months`` of ``tour_ids`` from the database in one query"""
+    rows = (TourDate.objects
+            .filter(tour_id__in=tour_ids, start_date__lte=month_end(months[-1]), end_date__gte=months[0])
+            .order_by()
+            .values('tour_id', 'start_date', 'end_date')
+            .annotate(spots=Sum('available_spots')))
+    departures = {}
+    for row in rows:
+        departures.setdefault(row['tour_id'], []).append((row['start_date'], row['end_date'], row['spots']))
+    return {
+        (tour_id, month): _encode_month(month, [
+            departure for departure in departures.get(tour_id, ())
+            if departure[0] <= month_end(month) and departure[1] >= month
+        ])
+        for tour_id in tour_ids for month in months
+    }
+
+def calendar(tour_ids, first_month, last_month):
+    """``{tour_id: {'YYYY-MM': month}}`` for the months from ``first_month`` to ``last_month``"""
+    months = months_between(first_month, last_month)
+    cache = _cache()
+    # Before building: an invalidation committing meanwhile bumps past these
+    versions = _versions(cache, tour_ids)
+    keys = {(tour_id, month): cache_key(tour_id, versions[tour_id], month)
+            for tour_id in tour_ids for month in months}
+    cached = cache.get_many(list(keys.values()))
+    missing = [item for item, key in keys.items() if key not in cached]
+    if missing:
+        built = build(sorted({tour_id for tour_id, _ in missing}),
+                      sorted({month for _, month in missing}))
+        fresh = {keys[item]: built[item] for item in missing}
+        cache.set_many(fresh, _timeout())
+        cached.update(fresh)
+    result = {}
+    for (tour_id, month), key in keys.items():
+        result.setdefault(str(tour_id), {})[f'{month:%Y-%m}'] = cached[key]
+    return result
+
+def invalidate(tour_ids):
+    """Bump the calendar versions of ``tour_ids`` once committed"""
+    keys = sorted({version_key(tour_id) for tour_id in tour_ids})
+    if not keys:
+        return
+
+    def bump():
+        cache = _cache()
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), None)
+    transaction.on_commit(bump)
+
+def invalidate_tour_dates(tour_date_ids):
+    invalidate(TourDate.objects.filter(pk__in=tour_date_ids).values_list('tour_id', flat=True))
@@ -0,0 +1,117 @@
+"""
+Streaming CSV/NDJSON exports of bookings and reviews for reporting.
+
+Rows are read with ``values()`` projections (joined with tour, date and
+user) through ``iterator(chunk_size=...)`` and rendered a chunk at a time,
+so exports of millions of rows never hold more than one chunk in memory.
+Used by the staff-only export endpoints and ``manage.py export_data``.
+"""
+import csv
+import datetime
+import io
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+from .models import Booking, Review
+
+CHUNK_SIZE = 2000
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# {column: lookup}
+BOOKING_COLUMNS = {
+    'id': 'id',
+    'booking_reference': 'booking_reference',
+    'status': 'status',
+    'participants': 'participants',
+    'total_price': 'total_price',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'user_id': 'user_id',
+    'username': 'user__username',
+    'email': 'user__email',
+    'tour_id': 'tour_date__tour_id',
+    'tour_title': 'tour_date__tour__title',
+    'tour_date_id': 'tour_date_id',
+    'start_date': 'tour_date__start_date',
+    'end_date': 'tour_date__end_date',
+}
+REVIEW_COLUMNS = {
+    'id': 'id',
+    'rating': 'rating',
+    'comment': 'comment',
+    'created_at': 'created_at',
+    'user_id': 'user_id',
+    'username': 'user__username',
+    'tour_id': 'tour_id',
+    'tour_title': 'tour__title',
+}
+
+def _parse_date(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a YYYY-MM-DD date')
+
+def _created_between(queryset, start, end):
+    """Rows created on ``start`` through ``end`` (inclusive days, current time zone)"""
+    if start:
+        start = _parse_date(start, 'start')
+        queryset = queryset.filter(created_at__gte=timezone.make_aware(
+            datetime.datetime.combine(start, datetime.time.min)))
+    if end:
+        end = _parse_date(end, 'end') + datetime.timedelta(days=1)
+        queryset = queryset.filter(created_at__lt=timezone.make_aware(
+            datetime.datetime.combine(end, datetime.time.min)))
+    return queryset
+
+def _project(queryset, columns):
+    # Plain fields keep their name, joined ones are aliased to their column name
+    aliases = {column: F(lookup) for column, lookup in columns.items() if column != lookup}
+    return queryset.order_by('id').values(*(column for column, lookup in columns.items() if column == lookup),
+                                          **aliases)
+
+def bookings(start=None, end=None, status=None):
+    """Booking rows created between ``start`` and ``end`` (ISO dates), optionally with one ``status``"""
+    queryset = _created_between(Booking.objects.all(), start, end)
+    if status:
+        valid = dict(Booking.STATUS_CHOICES)
+        if status not in valid:
+            raise ValueError(f'status must be one of {", ".join(valid)}')
+        queryset = queryset.filter(status=status)
+    return _project(queryset, BOOKING_COLUMNS), list(BOOKING_COLUMNS)
+
+def reviews(start=None, end=None, rating=None):
+    """Review rows created between ``start`` and ``end`` (ISO dates), optionally with one ``rating``"""
+    queryset = _created_between(Review.objects.all(), start, end)
+    if rating:
+        if rating not in {'1', '2', '3', '4', '5'}:
+            raise ValueError('rating must be between 1 and 5')
+        queryset = queryset.filter(rating=int(rating))
+    return _project(queryset, REVIEW_COLUMNS), list(REVIEW_COLUMNS)
+
+EXPORTS = {'bookings': bookings, 'reviews': reviews}
+
+def render(queryset, columns, format='csv', chunk_size=CHUNK_SIZE):
+    """Yield the export as text chunks of ``chunk_size`` rows each"""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for count, row in enumerate(rows, 1):
+            writer.writerow([row[column] for column in columns])
+            if count % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        lines = []
+        for row in rows:
+            lines.append(encoder.encode({column: row[column] for column in columns}))
+            if len(lines) == chunk_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
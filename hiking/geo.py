@@ -0,0 +1,104 @@
+"""
+Proximity search over Location coordinates.
+
+Every location stores the id of the grid cell its coordinates fall in
+(``Location.geo_cell``, indexed). Cells are ``CELL_DEGREES`` wide and numbered
+row by row, so the cells covering a bounding box are one contiguous id range
+per row: a radius query becomes a handful of ``geo_cell BETWEEN a AND b``
+index range scans, and only those candidates are refined with an exact
+haversine distance (vectorized with numpy when it is installed).
+"""
+import math
+from django.db.models import Q
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_DEGREES = 0.25
+ROWS = int(180 / CELL_DEGREES)
+COLUMNS = int(360 / CELL_DEGREES)
+MAX_RADIUS_KM = 2000
+
+def cell_for(latitude, longitude):
+    """Grid cell id of a coordinate, None when it is incomplete"""
+    if latitude is None or longitude is None:
+        return None
+    row = min(ROWS - 1, int((float(latitude) + 90) // CELL_DEGREES))
+    column = int(((float(longitude) + 180) % 360) // CELL_DEGREES)
+    return row * COLUMNS + column
+
+def cell_ranges(latitude, longitude, radius_km):
+    """Inclusive ``(first, last)`` cell id ranges covering a circle"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(-90.0, latitude - lat_delta), min(90.0, latitude + lat_delta)
+    first_row = cell_for(south, 0) // COLUMNS
+    last_row = cell_for(north, 0) // COLUMNS
+
+    # The box gets widest at the latitude furthest from the equator
+    widest = max(abs(south), abs(north))
+    if widest >= 89.9 or radius_km >= EARTH_RADIUS_KM * math.pi / 2:
+        columns = [(0, COLUMNS - 1)]
+    else:
+        lon_delta = min(180.0, lat_delta / math.cos(math.radians(widest)))
+        if lon_delta >= 180:
+            columns = [(0, COLUMNS - 1)]
+        else:
+            west = cell_for(0, longitude - lon_delta) % COLUMNS
+            east = cell_for(0, longitude + lon_delta) % COLUMNS
+            # Split boxes that cross the antimeridian
+            columns = [(west, east)] if west <= east else [(west, COLUMNS - 1), (0, east)]
+
+    if columns == [(0, COLUMNS - 1)]:
+        # Whole rows are contiguous with each other too
+        return [(first_row * COLUMNS, last_row * COLUMNS + COLUMNS - 1)]
+    return [(row * COLUMNS + first, row * COLUMNS + last)
+            for row in range(first_row, last_row + 1) for first, last in columns]
+
+def cells_filter(latitude, longitude, radius_km, field='geo_cell'):
+    """Q object keeping rows whose ``field`` lies in a cell covering the circle"""
+    condition = Q()
+    for first, last in cell_ranges(latitude, longitude, radius_km):
+        condition |= Q(**{f'{field}__range': (first, last)})
+    return condition
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances in km from one point to sequences of points"""
+    if numpy is not None:
+        lat1 = numpy.radians(latitude)
+        lat2 = numpy.radians(numpy.asarray(latitudes, dtype=float))
+        dlat = lat2 - lat1
+        dlon = numpy.radians(numpy.asarray(longitudes, dtype=float) - longitude)
+        a = numpy.sin(dlat / 2) ** 2 + math.cos(lat1) * numpy.cos(lat2) * numpy.sin(dlon / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))).tolist()
+    lat1 = math.radians(latitude)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat, lon in zip(latitudes, longitudes):
+        lat2 = math.radians(lat)
+        a = (math.sin((lat2 - lat1) / 2) ** 2
+             + cos_lat1 * math.cos(lat2) * math.sin(math.radians(lon - longitude) / 2) ** 2)
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+def nearest(rows, latitude, longitude, radius_km, limit):
+    """
+    Refine ``(pk, latitude, longitude)`` candidates to the ``limit`` closest
+    within ``radius_km``, as ``[(pk, distance_km), ...]`` sorted by distance
+    """
+    rows = [row for row in rows if row[1] is not None and row[2] is not None]
+    if not rows:
+        return []
+    distances = haversine(latitude, longitude, [float(row[1]) for row in rows], [float(row[2]) for row in rows])
+    hits = sorted((distance, row[0]) for row, distance in zip(rows, distances) if distance <= radius_km)
+    return [(pk, distance) for distance, pk in hits[:limit]]
+
+def locations_near(latitude, longitude, radius_km, limit, queryset=None):
+    """``[(location_id, distance_km), ...]`` for the closest locations, using the cell index"""
+    from .models import Location
+    queryset = Location.objects.all() if queryset is None else queryset
+    candidates = queryset.filter(cells_filter(latitude, longitude, radius_km)).values_list(
+        'pk', 'latitude', 'longitude')
+    return nearest(candidates, latitude, longitude, radius_km, limit)
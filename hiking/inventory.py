@@ -0,0 +1,57 @@
+"""
+Seat inventory for tour dates.
+
+Seats are taken and returned with conditional atomic UPDATEs
+(``available_spots = available_spots - n WHERE available_spots >= n``), so
+concurrent bookings can never oversell a date regardless of how many
+processes hit it. Callers run these inside the same transaction as the
+booking insert/update so that a failed insert gives the seats back.
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+from .models import TourDate
+
+# Sent once the transaction that changed seat counts commits, with ``tour_date_ids``
+spots_changed = Signal()
+
+class SeatsUnavailable(Exception):
+    def __init__(self, tour_date_id, seats):
+        self.tour_date_id = tour_date_id
+        self.seats = seats
+        super().__init__(f"Tour date {tour_date_id} does not have {seats} available spots")
+
+def _notify(tour_date_ids):
+    tour_date_ids = sorted(set(tour_date_ids))
+    transaction.on_commit(lambda: spots_changed.send(sender=TourDate, tour_date_ids=tour_date_ids))
+
+def reserve_seats(tour_date_id, seats):
+    """Take ``seats`` from a tour date or raise SeatsUnavailable"""
+    updated = TourDate.objects.filter(pk=tour_date_id, available_spots__gte=seats).update(
+        available_spots=F('available_spots') - seats
+    )
+    if not updated:
+        raise SeatsUnavailable(tour_date_id, seats)
+    _notify([tour_date_id])
+
+def release_seats(tour_date_id, seats):
+    """Return ``seats`` to a tour date, e.g. when a booking is cancelled"""
+    TourDate.objects.filter(pk=tour_date_id).update(available_spots=F('available_spots') + seats)
+    _notify([tour_date_id])
+
+def reserve_many(requests):
+    """
+    All-or-nothing reservation of many ``(tour_date_id, seats)`` requests.
+
+    Requests for the same date are summed so that a burst of bookings for one
+    popular date costs a single UPDATE; dates are updated in id order so
+    concurrent batches always take row locks in the same order.
+    """
+    totals = Counter()
+    for tour_date_id, seats in requests:
+        totals[tour_date_id] += seats
+    with transaction.atomic():
+        for tour_date_id in sorted(totals):
+            reserve_seats(tour_date_id, totals[tour_date_id])
+    return dict(totals)
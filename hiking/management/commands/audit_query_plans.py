@@ -0,0 +1,116 @@
+import re
+from collections import Counter
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+from booking.counters import view_counter
+from trips.routes import call, discover, sample_requests
+
+# EXPLAIN QUERY PLAN details worth an index: a table read row by row rather
+# than through an index, and a sort (or grouping) the query has to do itself
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?! USING)(?: VIRTUAL TABLE)?$')
+TEMP_B_TREE = re.compile(r'^USE TEMP B-TREE FOR (.+)$')
+# Subqueries the plan evaluates on their own; scanning their result is expected
+SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\S+)')
+
+class Command(BaseCommand):
+    help = ('Run representative requests against every GET endpoint of the API and flag the queries whose '
+            'SQLite query plan scans a whole table or sorts in a temporary b-tree')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to make the requests as (default: the first superuser)')
+        parser.add_argument('--route', help='Only audit endpoints whose label contains this text')
+        parser.add_argument('--min-rows', type=int, default=0,
+                            help='Ignore full scans of tables with fewer rows than this')
+        parser.add_argument('--fail-on-issues', action='store_true', help='Exit with an error if anything is flagged')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'EXPLAIN QUERY PLAN output is SQLite specific, the database is {connection.vendor}')
+        user = self._user(options['user'])
+        self._row_counts = {}
+        issues = Counter()
+        requests = 0
+        plans = {}
+        for route in discover():
+            if options['route'] and options['route'] not in route.label:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(route.label))
+            for url, params in list(sample_requests(route, self._request(user))):
+                queries = self._run(route, url, params, user)
+                requests += 1
+                flagged = []
+                for sql in queries:
+                    if sql not in plans:
+                        plans[sql] = self._issues(sql, options['min_rows'])
+                    flagged.extend(plans[sql])
+                query_string = '&'.join(f'{key}={value}' for key, value in params.items())
+                line = f'  {url}{"?" + query_string if query_string else ""}  ({len(queries)} queries)'
+                if flagged:
+                    issues.update(flagged)
+                    line += ': ' + self.style.WARNING(', '.join(sorted(set(flagged))))
+                self.stdout.write(line)
+
+        self.stdout.write('')
+        for issue, count in issues.most_common():
+            self.stdout.write(f'{count:5}  {issue}')
+        summary = f'{requests} requests, {len(plans)} distinct queries, {sum(issues.values())} flagged'
+        if issues and options['fail_on_issues']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.WARNING(summary) if issues else self.style.SUCCESS(summary))
+
+    def _user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {username!r}')
+        return User.objects.filter(is_superuser=True).order_by('pk').first() or User.objects.order_by('pk').first()
+
+    def _request(self, user):
+        request = APIRequestFactory().get('/')
+        if user is not None:
+            force_authenticate(request, user)
+        return request
+
+    def _run(self, route, url, params, user):
+        """The SELECTs one request to ``route`` runs"""
+        response, queries = call(route, url, params, user)
+        # Keep dry runs out of the post view counts
+        view_counter.discard()
+        if response.status_code >= 400:
+            self.stdout.write(self.style.ERROR(f'  {url} {params}: HTTP {response.status_code}'))
+        return [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+
+    def _issues(self, sql, min_rows):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        subqueries = {match.group(1) for match in map(SUBQUERY.match, details) if match}
+        issues = []
+        for detail in details:
+            if (match := FULL_SCAN.match(detail)) and match.group(1) not in subqueries:
+                table, rows = match.group(1), self._rows(match.group(1))
+                if rows is None:
+                    issues.append(f'full scan of {table}')
+                elif rows >= min_rows:
+                    issues.append(f'full scan of {table} ({rows} rows)')
+            elif match := TEMP_B_TREE.match(detail):
+                issues.append(f'temp b-tree for {match.group(1)} ({_main_table(sql)})')
+        return issues
+
+    def _rows(self, table):
+        if table not in self._row_counts:
+            with connection.cursor() as cursor:
+                try:
+                    cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                    self._row_counts[table] = cursor.fetchone()[0]
+                except DatabaseError:
+                    # Aliases of tables in subqueries
+                    self._row_counts[table] = None
+        return self._row_counts[table]
+
+def _main_table(sql):
+    match = re.search(r'\bFROM "?(\w+)"?', sql)
+    return match.group(1) if match else '?'
@@ -0,0 +1,35 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from hiking import exports
+
+class Command(BaseCommand):
+    help = 'Stream bookings or reviews as CSV or NDJSON, to stdout or a file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--output', '-o', default='-', help='file to write, - for stdout')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS),
+                            help='default: from the output file extension, else csv')
+        parser.add_argument('--start', help='first creation day, YYYY-MM-DD')
+        parser.add_argument('--end', help='last creation day, YYYY-MM-DD')
+        parser.add_argument('--status', help='bookings only: pending, confirmed, cancelled or completed')
+        parser.add_argument('--rating', help='reviews only: 1 to 5')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, kind, output, **options):
+        format = options['format'] or ('ndjson' if output.endswith(('.ndjson', '.jsonl')) else 'csv')
+        value = options['status'] if kind == 'bookings' else options['rating']
+        try:
+            queryset, columns = exports.EXPORTS[kind](options['start'], options['end'], value)
+        except ValueError as e:
+            raise CommandError(e)
+
+        stream = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+        try:
+            for chunk in exports.render(queryset, columns, format, options['chunk_size']):
+                stream.write(chunk)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        if output != '-':
+            self.stderr.write(self.style.SUCCESS(f'Exported {kind} to {output}'))
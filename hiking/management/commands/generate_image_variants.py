@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.core.management.base import BaseCommand, CommandError
+from booking.models import BlogPost
+from hiking.models import Tour
+from trips import images
+
+MODELS = {'tours': Tour, 'posts': BlogPost}
+
+class Command(BaseCommand):
+    help = ('Generate the missing or stale image variants of tours and blog posts in a process pool; '
+            'images whose content was already processed are not rendered again')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), action='append',
+                            help='Only these models (default: all of them)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes (default: one per CPU)')
+        parser.add_argument('--force', action='store_true',
+                            help='Render every image again, even when its variants exist')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            for name in options['model'] or sorted(MODELS):
+                self.backfill(executor, MODELS[name], options['workers'], options['force'])
+
+    def backfill(self, executor, model, workers, force):
+        field = 'image_variants'
+        storage = model._meta.get_field(field).storage
+        rows = (model._default_manager.exclude(image='').exclude(image__isnull=True)
+                .order_by('pk').values_list('pk', 'image', field))
+        counts = dict.fromkeys(('rendered', 'reused', 'current', 'missing', 'failed'), 0)
+        pending = {}
+
+        def collect(done):
+            for future in done:
+                pk, name = pending.pop(future)
+                try:
+                    result = future.result()
+                except FileNotFoundError:
+                    counts['missing'] += 1
+                    continue
+                except Exception as error:
+                    counts['failed'] += 1
+                    self.stderr.write(f'{model.__name__} {pk} ({name}): {error}')
+                    continue
+                if images.store(model, field, pk, name, result):
+                    counts['rendered' if result[2] else 'reused'] += 1
+
+        # Keep a bounded number of images in flight, the queryset is streamed
+        for pk, name, value in rows.iterator(chunk_size=2000):
+            if not force and value.get('source') == name:
+                counts['current'] += 1
+                continue
+            try:
+                arguments = images.job(storage, name, force=force)
+            except NotImplementedError:
+                raise CommandError(f'{type(storage).__name__} has no local paths, image variants need them')
+            pending[executor.submit(images.render, *arguments)] = (pk, name)
+            if len(pending) >= workers * 4:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+        collect(wait(pending).done)
+        self.stdout.write(self.style.SUCCESS(
+            f'{model._meta.verbose_name_plural}: ' + ', '.join(f'{count} {state}' for state, count in counts.items())))
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from hiking import availability, geo, search
+from hiking.models import Category, Location, Tour, TourDate
+from trips.cache import response_cache
+from trips.importing import Importer, natural_keys, read_rows
+
+class LocationImporter(Importer):
+    model = Location
+
+    def build(self, row):
+        location = super().build(row)
+        # What Location.save() would have computed
+        location.geo_cell = geo.cell_for(location.latitude, location.longitude)
+        return location
+
+    def update_fields(self, columns):
+        fields = super().update_fields(columns)
+        return sorted({*fields, 'geo_cell'}) if {'latitude', 'longitude'} & set(columns) else fields
+
+class CategoryImporter(Importer):
+    model = Category
+
+class TourImporter(Importer):
+    model = Tour
+    foreign_keys = {'category': 'category_id', 'location': 'location_id'}
+
+    def lookup_maps(self):
+        return {
+            'category': natural_keys(Category.objects.all(), 'name'),
+            'location': natural_keys(Location.objects.all(), 'name'),
+        }
+
+class TourDateImporter(Importer):
+    model = TourDate
+    unique_fields = ('tour', 'start_date')
+    foreign_keys = {'tour': 'tour_id', 'guide': 'guide_id'}
+
+    def lookup_maps(self):
+        return {
+            'tour': natural_keys(Tour.objects.all()),
+            'guide': natural_keys(User.objects.all(), 'username'),
+        }
+
+    def after_batch(self, instances):
+        availability.invalidate(date.tour_id for date in instances)
+
+class Command(BaseCommand):
+    help = ('Stream locations, categories, tours or tour dates from a CSV/JSONL file into the catalog, '
+            'upserting on id (tour dates: on tour and start_date)')
+
+    importers = {
+        'locations': LocationImporter,
+        'categories': CategoryImporter,
+        'tours': TourImporter,
+        'tour-dates': TourDateImporter,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(self.importers))
+        parser.add_argument('path', help='CSV or JSONL file, - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per INSERT transaction')
+        parser.add_argument('--progress-every', type=int, default=50000)
+        parser.add_argument('--strict', action='store_true', help='abort on the first invalid row')
+
+    def handle(self, *args, kind, path, **options):
+        importer = self.importers[kind](
+            batch_size=options['batch_size'], progress_every=options['progress_every'],
+            stdout=self.stdout, stderr=self.stderr, strict=options['strict'],
+        )
+        message = importer.run(read_rows(path, options['format']))
+
+        # bulk_create skipped the signals that keep these in sync
+        response_cache.invalidate(importer.model)
+        if kind in ('categories', 'tours'):
+            call_command('rebuild_category_tour_counts', stdout=self.stdout)
+        if kind != 'tour-dates' and search.is_enabled():
+            call_command('rebuild_tour_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(message))
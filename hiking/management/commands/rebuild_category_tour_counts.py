@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef
+from hiking.models import Category, Tour, count_subquery
+from trips.cache import response_cache
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized active tour count of every tour category'
+
+    def handle(self, *args, **options):
+        updated = Category.objects.update(active_tours_count=count_subquery(
+            Tour.objects.filter(category=OuterRef('pk'), active=True), 'category'))
+        response_cache.invalidate(Category)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt tour counts for {updated} categories'))
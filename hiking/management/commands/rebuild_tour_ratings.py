@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from hiking.models import Tour
+from hiking.ratings import rebuild_tour_ratings
+from trips.cache import response_cache
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized rating aggregates of every tour from its reviews'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_tour_ratings()
+            response_cache.invalidate(Tour)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} tours'))
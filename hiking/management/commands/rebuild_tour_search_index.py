@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from hiking import search
+from hiking.models import Tour
+from trips.cache import response_cache
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents of every tour'
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError('Full-text search index is only available on SQLite')
+        with transaction.atomic():
+            indexed = search.rebuild_index()
+            response_cache.invalidate(Tour)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} tours'))
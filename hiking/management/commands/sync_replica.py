@@ -0,0 +1,50 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from hiking.signals import CACHED_MODELS
+from trips.cache import response_cache
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database onto the read replica files (TRIPS_DB_REPLICAS) with the '
+            'online backup API, once or every --interval seconds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', action='append', help='Replica alias to refresh (default: all of them)')
+        parser.add_argument('--interval', type=float, default=0, help='Keep copying every this many seconds')
+
+    def handle(self, *args, **options):
+        aliases = options['alias'] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('No replicas configured, set TRIPS_DB_REPLICAS')
+        for alias in aliases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError(f'{alias} is not one of the replicas: {", ".join(settings.DATABASE_REPLICAS)}')
+            if connections[alias].vendor != 'sqlite' or connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+                raise CommandError("sync_replica only copies SQLite databases, use the database's own replication")
+
+        while True:
+            for alias in aliases:
+                started = time.perf_counter()
+                self.copy(alias)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Copied the primary to {alias} in {(time.perf_counter() - started) * 1000:.0f} ms'))
+            # Responses cached while the replicas lagged were built from the old copy
+            for model in CACHED_MODELS:
+                response_cache.invalidate(model)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, alias):
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        target = sqlite3.connect(connections[alias].settings_dict['NAME'], timeout=20)
+        try:
+            # Readers of the replica keep seeing the previous copy until the
+            # backup commits; WAL keeps them from blocking it
+            primary.connection.backup(target)
+            target.execute('PRAGMA journal_mode=WAL')
+        finally:
+            target.close()
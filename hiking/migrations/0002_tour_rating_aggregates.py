@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:22
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Tour = apps.get_model('hiking', 'Tour')
+    Review = apps.get_model('hiking', 'Review')
+    histogram = {f'rating_{star}_count': Count('pk', filter=Q(rating=star)) for star in range(1, 6)}
+    rows = Review.objects.values('tour').annotate(rating_sum=Sum('rating'), reviews_count=Count('pk'), **histogram)
+    for row in rows:
+        tour_id = row.pop('tour')
+        row['average_rating'] = row['rating_sum'] / row['reviews_count']
+        Tour.objects.filter(pk=tour_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hiking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='average_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS hiking_tour_fts "
+        "USING fts5(title, description, location, category, tokenize='porter unicode61')"
+    )
+    schema_editor.execute(
+        "INSERT INTO hiking_tour_fts (rowid, title, description, location, category) "
+        "SELECT t.id, t.title, t.description, "
+        "l.name || ' ' || l.country || ' ' || l.state || ' ' || l.city, c.name "
+        "FROM hiking_tour t "
+        "JOIN hiking_location l ON l.id = t.location_id "
+        "JOIN hiking_category c ON c.id = t.category_id"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS hiking_tour_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hiking', '0002_tour_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
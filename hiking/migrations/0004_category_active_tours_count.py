@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:28
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_active_tours_count(apps, schema_editor):
+    Category = apps.get_model('hiking', 'Category')
+    counts = Category.objects.annotate(n=Count('tours', filter=Q(tours__active=True)))
+    for category in counts.filter(n__gt=0):
+        Category.objects.filter(pk=category.pk).update(active_tours_count=category.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hiking', '0003_tour_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_tours_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_active_tours_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:32
+
+from django.db import migrations, models
+
+# hiking.geo.cell_for as of this migration, frozen so later changes to the
+# grid do not change what this migration writes
+CELL_DEGREES = 0.25
+ROWS = int(180 / CELL_DEGREES)
+COLUMNS = int(360 / CELL_DEGREES)
+
+
+def cell_for(latitude, longitude):
+    row = min(ROWS - 1, int((float(latitude) + 90) // CELL_DEGREES))
+    column = int(((float(longitude) + 180) % 360) // CELL_DEGREES)
+    return row * COLUMNS + column
+
+
+def backfill_geo_cell(apps, schema_editor):
+    Location = apps.get_model('hiking', 'Location')
+    locations = list(Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+                     .only('latitude', 'longitude'))
+    for location in locations:
+        location.geo_cell = cell_for(location.latitude, location.longitude)
+    Location.objects.bulk_update(locations, ['geo_cell'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hiking', '0004_category_active_tours_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geo_cell',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_geo_cell, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hiking', '0005_location_geo_cell'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'updated_at'], name='booking_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at'], name='review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['tour', 'created_at'], name='review_tour_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', 'created_at'], name='review_rating_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('active', True)), fields=['created_at'], name='tour_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('active', True)), fields=['featured', 'created_at'], name='tour_active_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('active', True)), fields=['price'], name='tour_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('active', True)), fields=['duration_days'], name='tour_active_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('active', True)), fields=['average_rating'], name='tour_active_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('active', True)), fields=['reviews_count'], name='tour_active_reviews_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tourdate',
+            index=models.Index(fields=['start_date'], name='tourdate_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tourdate',
+            index=models.Index(condition=models.Q(('available_spots__gt', 0)), fields=['start_date'], name='tourdate_available_start_idx'),
+        ),
+    ]
@@ -2,13 +2,22 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from trips.images import ImageVariantsField
+from trips.mixins import DenormalizedCountersMixin
+from . import geo
 
-class Category(models.Model):
+class Category(DenormalizedCountersMixin, models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by hiking.signals as tours are activated, deactivated or deleted
+    active_tours_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    counter_fields = ('active_tours_count',)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -25,11 +34,63 @@ class Location(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Grid cell of the coordinates, see hiking.geo
+    geo_cell = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
     
     def __str__(self):
         return f"{self.name}, {self.country}"
+    
+    def save(self, *args, **kwargs):
+        self.geo_cell = geo.cell_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geo_cell'}
+        super().save(*args, **kwargs)
+
+def count_subquery(queryset, group_by):
+    """Correlated COUNT(*) over ``queryset`` grouped by ``group_by``, 0 when empty"""
+    counts = queryset.order_by().values(group_by).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts), Value(0))
+
+class TourQuerySet(models.QuerySet):
+    # Explicit order of the prefetched dates/reviews (the fast read path relies on it too).
+    # Leading with tour_id lets SQLite read them in order off the tour_id index
+    # instead of sorting the whole ``tour_id IN (...)`` result.
+    dates_ordering = ('tour_id', 'id')
+    reviews_ordering = ('tour_id', 'id')
+    
+    def with_related(self):
+        """Join category/location and prefetch dates with guides and reviews with users"""
+        return self.with_expanded({'category', 'location', 'dates', 'reviews'})
+    
+    def with_expanded(self, relations):
+        """Join or prefetch only ``relations`` (those TourSerializer embeds, see SparseFieldsetMixin)"""
+        queryset = self
+        joined = [name for name in ('category', 'location') if name in relations]
+        if joined:
+            queryset = queryset.select_related(*joined)
+        if 'dates' in relations:
+            queryset = queryset.prefetch_related(Prefetch(
+                'dates', queryset=TourDate.objects.select_related('guide').order_by(*self.dates_ordering)))
+        if 'reviews' in relations:
+            queryset = queryset.prefetch_related(Prefetch(
+                'reviews', queryset=Review.objects.select_related('user').order_by(*self.reviews_ordering)))
+        return queryset
+    
+    def with_stats(self):
+        """Annotate the location tour count read by TourSerializer (categories keep their own)"""
+        return self.annotate(
+            location_tours_count=count_subquery(
+                Tour.objects.filter(location=OuterRef('location_id'), active=True), 'location'),
+        )
+    
+    def with_details(self, relations=('category', 'location', 'dates', 'reviews')):
+        """Everything TourSerializer needs for ``relations``, in a fixed number of queries"""
+        queryset = self.with_expanded(relations)
+        # The location tour count is only rendered inside an embedded location
+        return queryset.with_stats() if 'location' in relations else queryset
 
-class Tour(models.Model):
+class Tour(DenormalizedCountersMixin, models.Model):
     DIFFICULTY_CHOICES = [
         ('easy', 'Easy'),
         ('moderate', 'Moderate'),
@@ -46,16 +107,46 @@ class Tour(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     max_participants = models.PositiveIntegerField()
     image = models.ImageField(upload_to='tours/', blank=True, null=True)
+    image_variants = ImageVariantsField('image')
     featured = models.BooleanField(default=False)
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Review aggregates, maintained by hiking.ratings on every review write
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    reviews_count = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    counter_fields = ('rating_sum', 'reviews_count', 'average_rating', 'rating_1_count', 'rating_2_count',
+                      'rating_3_count', 'rating_4_count', 'rating_5_count')
+    
+    objects = TourQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        # The public list only shows active tours, ordered by the ordering
+        # filter's fields (ties broken on id, which every SQLite index carries)
+        indexes = [
+            models.Index(fields=['created_at'], condition=Q(active=True), name='tour_active_created_idx'),
+            models.Index(fields=['featured', 'created_at'], condition=Q(active=True), name='tour_active_featured_idx'),
+            models.Index(fields=['price'], condition=Q(active=True), name='tour_active_price_idx'),
+            models.Index(fields=['duration_days'], condition=Q(active=True), name='tour_active_duration_idx'),
+            models.Index(fields=['average_rating'], condition=Q(active=True), name='tour_active_rating_idx'),
+            models.Index(fields=['reviews_count'], condition=Q(active=True), name='tour_active_reviews_idx'),
+        ]
     
     def __str__(self):
         return self.title
+    
+    @property
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in range(1, 6)}
 
 class TourDate(models.Model):
     tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='dates')
@@ -67,6 +158,11 @@ class TourDate(models.Model):
     
     class Meta:
         unique_together = ['tour', 'start_date']
+        indexes = [
+            models.Index(fields=['start_date'], name='tourdate_start_idx'),
+            # TourDateViewSet.available
+            models.Index(fields=['start_date'], condition=Q(available_spots__gt=0), name='tourdate_available_start_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tour.title} - {self.start_date}"
@@ -88,6 +184,13 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        # BookingViewSet only lists the requesting user's bookings
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
+            models.Index(fields=['user', 'updated_at'], name='booking_user_updated_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.booking_reference} - {self.user.username}"
 
@@ -100,6 +203,11 @@ class Review(models.Model):
     
     class Meta:
         unique_together = ['tour', 'user']
+        indexes = [
+            models.Index(fields=['created_at'], name='review_created_idx'),
+            models.Index(fields=['tour', 'created_at'], name='review_tour_created_idx'),
+            models.Index(fields=['rating', 'created_at'], name='review_rating_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tour.title} - {self.rating}/5"
\ No newline at end of file
@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from .models import Tour, Review, count_subquery
+
+STARS = range(1, 6)
+
+def _average(rating_sum, reviews_count):
+    """SQL expression for rating_sum / reviews_count, 0 when there are no reviews"""
+    return Coalesce(
+        Cast(rating_sum, FloatField()) / NullIf(reviews_count, Value(0)),
+        Value(0.0),
+    )
+
+def adjust_tour_rating(tour_id, rating, delta):
+    """
+    Add (delta=1) or remove (delta=-1) a single ``rating`` from a tour's aggregates
+    with one atomic UPDATE, so concurrent review writes never lose an increment.
+    """
+    rating_sum = F('rating_sum') + delta * rating
+    reviews_count = F('reviews_count') + delta
+    Tour.objects.filter(pk=tour_id).update(
+        rating_sum=rating_sum,
+        reviews_count=reviews_count,
+        average_rating=_average(rating_sum, reviews_count),
+        **{f'rating_{rating}_count': F(f'rating_{rating}_count') + delta},
+    )
+
+def review_changed(before, after):
+    """
+    Move a review's contribution from ``before`` to ``after``, each a
+    ``(tour_id, rating)`` pair or None for a created/deleted review.
+    """
+    if before == after:
+        return
+    with transaction.atomic():
+        if before is not None:
+            adjust_tour_rating(*before, -1)
+        if after is not None:
+            adjust_tour_rating(*after, 1)
+
+def rebuild_tour_ratings(queryset=None):
+    """Recompute every aggregate from the Review table in a single UPDATE"""
+    if queryset is None:
+        queryset = Tour.objects.all()
+    reviews = Review.objects.filter(tour=OuterRef('pk'))
+    rating_sum = Coalesce(
+        Subquery(reviews.order_by().values('tour').annotate(total=Sum('rating')).values('total')),
+        Value(0),
+    )
+    reviews_count = count_subquery(reviews, 'tour')
+    histogram = {
+        f'rating_{star}_count': count_subquery(reviews.filter(rating=star), 'tour')
+        for star in STARS
+    }
+    return queryset.update(
+        rating_sum=rating_sum,
+        reviews_count=reviews_count,
+        average_rating=_average(rating_sum, reviews_count),
+        **histogram,
+    )
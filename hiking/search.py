@@ -0,0 +1,88 @@
+"""
+Full-text search over the tour catalog.
+
+Each tour has one denormalized search document in an FTS5 table (created by
+migration 0003) holding its title, description, location (name, country,
+state, city) and category name, so ``?search=`` no longer LIKE-scans three
+joined tables. Documents are refreshed by hiking.signals whenever a Tour,
+Location or Category changes and can be rebuilt with
+``manage.py rebuild_tour_search_index``.
+"""
+from django.db import connections, router
+from rest_framework import filters
+from rest_framework.settings import api_settings
+from trips import search as fts
+from trips.search import match_expression
+from .models import Tour
+
+FTS_TABLE = 'hiking_tour_fts'
+# BM25 weights for the indexed columns, in table order: title, description, location, category
+COLUMN_WEIGHTS = (10.0, 1.0, 4.0, 4.0)
+
+DOCUMENT_SQL = (
+    f'INSERT INTO {FTS_TABLE} (rowid, title, description, location, category) '
+    "SELECT t.id, t.title, t.description, "
+    "l.name || ' ' || l.country || ' ' || l.state || ' ' || l.city, c.name "
+    'FROM hiking_tour t '
+    'JOIN hiking_location l ON l.id = t.location_id '
+    'JOIN hiking_category c ON c.id = t.category_id'
+)
+
+def is_enabled(using=None):
+    using = using or router.db_for_read(Tour)
+    return connections[using].vendor == 'sqlite'
+
+def _reindex(column=None, value=None, using=None):
+    """Rebuild the documents of the tours whose ``column`` equals ``value`` (all tours when None)"""
+    with connections[using or router.db_for_write(Tour)].cursor() as cursor:
+        if column is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(DOCUMENT_SQL)
+        else:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT id FROM hiking_tour WHERE {column} = %s)',
+                [value],
+            )
+            cursor.execute(f'{DOCUMENT_SQL} WHERE t.{column} = %s', [value])
+        return cursor.rowcount
+
+def index_tour(tour_id, using=None):
+    _reindex('id', tour_id, using)
+
+def index_location_tours(location_id, using=None):
+    _reindex('location_id', location_id, using)
+
+def index_category_tours(category_id, using=None):
+    _reindex('category_id', category_id, using)
+
+def remove_tour(tour_id, using=None):
+    with connections[using or router.db_for_write(Tour)].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [tour_id])
+
+def rebuild_index(using=None):
+    """Repopulate every search document, returns the number of indexed tours"""
+    return _reindex(using=using)
+
+def search(queryset, text):
+    """
+    Restrict a Tour queryset to full-text matches of ``text`` and annotate each
+    tour with ``search_rank`` (BM25, lower is more relevant).
+    """
+    return queryset.filter(pk__in=fts.matching_ids(FTS_TABLE, text)).annotate(
+        search_rank=fts.bm25(FTS_TABLE, COLUMN_WEIGHTS, text, Tour))
+
+class TourSearchFilter(filters.SearchFilter):
+    """
+    Answers ``?search=`` from the tour search index. It runs after
+    OrderingFilter so that, unless the client asked for an explicit
+    ``?ordering=``, results come back most relevant first.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not match_expression(terms) or not is_enabled(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        queryset = search(queryset, terms)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('search_rank', '-created_at')
+        return queryset
@@ -0,0 +1,129 @@
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from trips.cache import response_cache
+from .models import Category, Location, Tour, TourDate, Review
+from .inventory import spots_changed
+from .ratings import review_changed
+from . import availability, search
+
+# Models the cached catalog responses are built from (trips.cache)
+CACHED_MODELS = (Category, Location, Tour, TourDate, Review)
+# User fields rendered by the catalog (guides of tour dates, authors of reviews)
+RENDERED_USER_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+def adjust_active_tours_count(category_id, delta):
+    Category.objects.filter(pk=category_id).update(active_tours_count=F('active_tours_count') + delta)
+
+@receiver(pre_save, sender=Tour)
+def remember_tour_state(sender, instance, raw=False, **kwargs):
+    instance._state_before = None
+    if raw or instance._state.adding:
+        return
+    instance._state_before = Tour.objects.filter(pk=instance.pk).values_list('active', 'category_id').first()
+
+@receiver(post_save, sender=Tour)
+def update_category_tour_count(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_state_before', None)
+    if before == (instance.active, instance.category_id):
+        return
+    if before is not None and before[0]:
+        adjust_active_tours_count(before[1], -1)
+    if instance.active:
+        adjust_active_tours_count(instance.category_id, 1)
+
+@receiver(post_delete, sender=Tour)
+def decrement_category_tour_count(sender, instance, **kwargs):
+    if instance.active:
+        adjust_active_tours_count(instance.category_id, -1)
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    instance._rating_before = None
+    if raw or instance._state.adding:
+        return
+    instance._rating_before = Review.objects.filter(pk=instance.pk).values_list('tour_id', 'rating').first()
+
+@receiver(post_save, sender=Review)
+def update_tour_rating_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    review_changed(getattr(instance, '_rating_before', None), (instance.tour_id, instance.rating))
+
+@receiver(post_delete, sender=Review)
+def update_tour_rating_on_delete(sender, instance, **kwargs):
+    review_changed((instance.tour_id, instance.rating), None)
+
+@receiver(post_save, sender=Tour)
+def index_tour(sender, instance, raw=False, using=None, **kwargs):
+    if not raw and search.is_enabled(using):
+        search.index_tour(instance.pk, using=using)
+
+@receiver(post_delete, sender=Tour)
+def unindex_tour(sender, instance, using=None, **kwargs):
+    if search.is_enabled(using):
+        search.remove_tour(instance.pk, using=using)
+
+@receiver(post_save, sender=Location)
+def reindex_location_tours(sender, instance, created=False, raw=False, using=None, **kwargs):
+    if not created and not raw and search.is_enabled(using):
+        search.index_location_tours(instance.pk, using=using)
+
+@receiver(post_save, sender=Category)
+def reindex_category_tours(sender, instance, created=False, raw=False, using=None, **kwargs):
+    if not created and not raw and search.is_enabled(using):
+        search.index_category_tours(instance.pk, using=using)
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_responses(sender, instance, raw=False, **kwargs):
+    if sender in CACHED_MODELS and not raw:
+        response_cache.invalidate(sender, [instance.pk])
+
+@receiver(pre_save, sender=User)
+def remember_rendered_user_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._rendered_before = None
+    if raw or instance._state.adding or (update_fields is not None and
+                                         not set(update_fields) & set(RENDERED_USER_FIELDS)):
+        return
+    instance._rendered_before = User.objects.filter(pk=instance.pk).values_list(*RENDERED_USER_FIELDS).first()
+
+@receiver(post_save, sender=User)
+def invalidate_guide_and_reviewer_responses(sender, instance, raw=False, **kwargs):
+    # Logins and other saves that leave the rendered fields alone keep the cache
+    before = getattr(instance, '_rendered_before', None)
+    if raw or before is None or before == tuple(getattr(instance, name) for name in RENDERED_USER_FIELDS):
+        return
+    for model, field in ((TourDate, 'guide'), (Review, 'user')):
+        pks = list(model.objects.filter(**{field: instance}).values_list('pk', flat=True))
+        if pks:
+            response_cache.invalidate(model, pks)
+
+@receiver(spots_changed)
+def invalidate_cached_tour_dates(sender, tour_date_ids, **kwargs):
+    response_cache.invalidate(TourDate, tour_date_ids)
+
+@receiver(pre_save, sender=TourDate)
+def remember_tour_date_tour(sender, instance, raw=False, **kwargs):
+    instance._tour_before = None
+    if raw or instance._state.adding:
+        return
+    instance._tour_before = TourDate.objects.filter(pk=instance.pk).values_list('tour_id', flat=True).first()
+
+@receiver(post_save, sender=TourDate)
+def invalidate_availability_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_tour_before', None)
+    availability.invalidate([instance.tour_id] + ([before] if before else []))
+
+@receiver(post_delete, sender=TourDate)
+def invalidate_availability_on_delete(sender, instance, **kwargs):
+    availability.invalidate([instance.tour_id])
+
+@receiver(spots_changed)
+def invalidate_availability_on_spots_changed(sender, tour_date_ids, **kwargs):
+    availability.invalidate_tour_dates(tour_date_ids)
@@ -1,3 +1,922 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from benchmarks import datagen
+from booking.counters import view_counter
+from hiking import availability, exports, geo
+from hiking.models import Booking, Category, Location, Review, Tour, TourDate
+from serializer.hiking_serializers import TourSerializer
+from trips import images
+from trips.cache import response_cache
+from trips.routes import call, discover, sample_requests
 
-# Create your tests here.
+def create_tour(category, location, title='Tour', **fields):
+    return Tour.objects.create(**{
+        'title': title, 'description': 'Trail notes', 'category': category, 'location': location,
+        'duration_days': 3, 'difficulty': 'moderate', 'price': '100.00', 'max_participants': 10, **fields,
+    })
+
+class CatalogTestData:
+    """A guide, two categories and locations, two active tours and an inactive one, with dates"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guide = User.objects.create(username='guide')
+        cls.categories = [Category.objects.create(name=f'Category {i}') for i in range(2)]
+        cls.locations = [Location.objects.create(name=f'Location {i}', country='Nepal') for i in range(2)]
+        cls.tours = [
+            create_tour(cls.categories[0], cls.locations[0], 'Annapurna Circuit'),
+            create_tour(cls.categories[0], cls.locations[1], 'Everest Base Camp'),
+            create_tour(cls.categories[1], cls.locations[0], 'Closed Route', active=False),
+        ]
+        cls.dates = [TourDate.objects.create(tour=tour, start_date=datetime.date(2030, 5, 1),
+                                             end_date=datetime.date(2030, 5, 3), available_spots=8, guide=cls.guide)
+                     for tour in cls.tours]
+
+    def setUp(self):
+        response_cache.clear()
+
+class TourQuerySetTests(CatalogTestData, TestCase):
+    """TourViewSet reads a fixed number of queries, however many tours it renders"""
+
+    def count_queries(self, url):
+        with response_cache.bypassed(), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def add_tours(self, count):
+        for i in range(count):
+            tour = create_tour(self.categories[i % 2], self.locations[i % 2], f'Extra {i}')
+            TourDate.objects.create(tour=tour, start_date=datetime.date(2030, 6, 1),
+                                    end_date=datetime.date(2030, 6, 2), available_spots=4, guide=self.guide)
+            Review.objects.create(tour=tour, user=User.objects.create(username=f'reviewer-{i}'), rating=4,
+                                  comment='Fine')
+
+    def test_list_queries_do_not_grow_with_tours(self):
+        before = self.count_queries('/api/api/v1/tours/')
+        self.add_tours(5)
+        self.assertEqual(self.count_queries('/api/api/v1/tours/'), before)
+
+    def test_retrieve_queries_do_not_grow_with_dates_and_reviews(self):
+        url = f'/api/api/v1/tours/{self.tours[0].pk}/'
+        before = self.count_queries(url)
+        for i in range(3):
+            TourDate.objects.create(tour=self.tours[0], start_date=datetime.date(2030, 7, i + 1),
+                                    end_date=datetime.date(2030, 7, i + 2), available_spots=4, guide=self.guide)
+            Review.objects.create(tour=self.tours[0], user=User.objects.create(username=f'reviewer-{i}'),
+                                  rating=5, comment='Great')
+        self.assertEqual(self.count_queries(url), before)
+
+    def test_inactive_tours_are_hidden_and_not_counted(self):
+        data = self.client.get('/api/api/v1/tours/').json()
+        self.assertEqual({tour['title'] for tour in data['results']}, {'Annapurna Circuit', 'Everest Base Camp'})
+        tour = next(tour for tour in data['results'] if tour['title'] == 'Annapurna Circuit')
+        # Location 0 has the inactive tour too
+        self.assertEqual(tour['location']['tours_count'], 1)
+        self.assertEqual(tour['category']['tours_count'], 2)
+        locations = {item['name']: item['tours_count']
+                     for item in self.client.get('/api/api/v1/locations/').json()['results']}
+        self.assertEqual(locations, {'Location 0': 1, 'Location 1': 1})
+        categories = {item['name']: item['tours_count']
+                      for item in self.client.get('/api/api/v1/categories/').json()['results']}
+        self.assertEqual(categories, {'Category 0': 2, 'Category 1': 0})
+
+class RatingAggregateTests(CatalogTestData, TestCase):
+    """Tour rating aggregates follow every review write and match a rebuild"""
+
+    def aggregates(self, tour):
+        tour.refresh_from_db()
+        return (tour.rating_sum, tour.reviews_count, tour.average_rating, tour.rating_histogram)
+
+    def assertRebuildAgrees(self):
+        expected = [self.aggregates(tour) for tour in self.tours]
+        Tour.objects.update(rating_sum=0, reviews_count=0, average_rating=0, rating_5_count=0)
+        call_command('rebuild_tour_ratings', stdout=StringIO())
+        self.assertEqual([self.aggregates(tour) for tour in self.tours], expected)
+
+    def test_review_writes(self):
+        tour = self.tours[0]
+        hikers = [User.objects.create(username=f'hiker-{i}') for i in range(3)]
+        review = Review.objects.create(tour=tour, user=hikers[0], rating=5, comment='Superb')
+        Review.objects.create(tour=tour, user=hikers[1], rating=2, comment='Wet')
+        self.assertEqual(self.aggregates(tour), (7, 2, 3.5, {'1': 0, '2': 1, '3': 0, '4': 0, '5': 1}))
+
+        review.rating = 3
+        review.save()
+        self.assertEqual(self.aggregates(tour), (5, 2, 2.5, {'1': 0, '2': 1, '3': 1, '4': 0, '5': 0}))
+
+        # Moving a review moves its rating
+        review.tour = self.tours[1]
+        review.save()
+        self.assertEqual(self.aggregates(tour), (2, 1, 2.0, {'1': 0, '2': 1, '3': 0, '4': 0, '5': 0}))
+        self.assertEqual(self.aggregates(self.tours[1])[:3], (3, 1, 3.0))
+
+        review.delete()
+        hikers[1].delete()  # cascades to the review
+        self.assertEqual(self.aggregates(tour), (0, 0, 0.0, {str(star): 0 for star in range(1, 6)}))
+        self.assertEqual(self.aggregates(self.tours[1])[:3], (0, 0, 0.0))
+        Review.objects.create(tour=tour, user=hikers[2], rating=5, comment='Again')
+        self.assertRebuildAgrees()
+
+    def test_api_writes(self):
+        hiker = User.objects.create(username='hiker')
+        self.client.force_login(hiker)
+        response = self.client.post('/api/api/v1/reviews/', {'tour': self.tours[0].pk, 'rating': 4,
+                                                             'comment': 'Good'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('tour', response.json())
+        self.assertEqual(response.json()['user']['username'], 'hiker')
+        self.assertEqual(self.aggregates(self.tours[0])[:3], (4, 1, 4.0))
+        for data in ({'tour': self.tours[0].pk, 'rating': 5, 'comment': 'Twice'},
+                     {'tour': self.tours[2].pk, 'rating': 5, 'comment': 'Inactive tour'}, {'rating': 5, 'comment': ''}):
+            with self.subTest(data=data):
+                response = self.client.post('/api/api/v1/reviews/', data, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Review.objects.count(), 1)
+        url = f'/api/api/v1/reviews/{Review.objects.get().pk}/'
+        # The tour of a review is fixed
+        self.client.patch(url, {'tour': self.tours[1].pk}, content_type='application/json')
+        self.assertEqual(Review.objects.get().tour, self.tours[0])
+        self.client.delete(url)
+
+        review = Review.objects.create(tour=self.tours[1], user=hiker, rating=4, comment='Good')
+        url = f'/api/api/v1/reviews/{review.pk}/'
+        self.assertEqual(self.client.patch(url, {'rating': 1}, content_type='application/json').status_code, 200)
+        self.assertEqual(self.aggregates(self.tours[1])[:3], (1, 1, 1.0))
+        self.assertEqual(self.client.get(f'/api/api/v1/tours/{self.tours[1].pk}/').json()['average_rating'], 1.0)
+        self.assertRebuildAgrees()
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.aggregates(self.tours[1])[:2], (0, 0))
+
+class TourSearchTests(CatalogTestData, TestCase):
+    """?search= is answered from the tour FTS index, most relevant first"""
+
+    def titles(self, query, **params):
+        with response_cache.bypassed():
+            response = self.client.get('/api/api/v1/tours/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [tour['title'] for tour in response.json()['results']]
+
+    def test_ranking(self):
+        create_tour(self.categories[1], self.locations[1], 'Glacier Traverse', price='300.00')
+        create_tour(self.categories[1], self.locations[1], 'Valley Walk', description='Views of the glacier',
+                    price='50.00')
+        self.assertEqual(self.titles('glacier'), ['Glacier Traverse', 'Valley Walk'])
+        # An explicit ordering wins over relevance
+        self.assertEqual(self.titles('glacier', ordering='price'), ['Valley Walk', 'Glacier Traverse'])
+        self.assertEqual(self.titles('glac trav'), ['Glacier Traverse'])
+
+    def test_location_and_category_names(self):
+        self.assertEqual(self.titles('nepal annapurna'), ['Annapurna Circuit'])
+        # The inactive tour shares location 0 but is not listed
+        self.assertEqual(set(self.titles('location')), {'Annapurna Circuit', 'Everest Base Camp'})
+        self.locations[1].name = 'Khumbu'
+        self.locations[1].save()
+        self.categories[0].name = 'Trekking'
+        self.categories[0].save()
+        self.assertEqual(self.titles('khumbu'), ['Everest Base Camp'])
+        self.assertEqual(set(self.titles('trekking')), {'Annapurna Circuit', 'Everest Base Camp'})
+
+    def test_index_follows_tour_writes(self):
+        tour = self.tours[0]
+        tour.title = 'Manaslu Circuit'
+        tour.save()
+        self.assertEqual(self.titles('annapurna'), [])
+        self.assertEqual(self.titles('manaslu'), ['Manaslu Circuit'])
+        tour.delete()
+        self.assertEqual(self.titles('manaslu'), [])
+        Tour.objects.update(title='Stale')
+        call_command('rebuild_tour_search_index', stdout=StringIO())
+        self.assertEqual(self.titles('stale'), ['Stale'])
+
+class BookingInventoryTests(CatalogTestData, TestCase):
+    """Every booking write keeps the date's available_spots and the booking's total_price in step"""
+
+    def setUp(self):
+        super().setUp()
+        self.hiker = User.objects.create(username='hiker')
+        self.client.force_login(self.hiker)
+        self.date = self.dates[0]
+
+    def spots(self):
+        self.date.refresh_from_db()
+        return self.date.available_spots
+
+    def book(self, participants, **fields):
+        return self.client.post('/api/api/v1/bookings/', {'tour_date_id': self.date.pk, 'participants': participants,
+                                                          **fields}, content_type='application/json')
+
+    def patch(self, booking_id, data):
+        return self.client.patch(f'/api/api/v1/bookings/{booking_id}/', data, content_type='application/json')
+
+    def test_create(self):
+        response = self.book(3, status='cancelled')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertEqual(response.json()['total_price'], '300.00')
+        self.assertEqual(self.spots(), 5)
+        self.assertEqual(self.book(6).status_code, 400)
+        self.assertEqual(self.spots(), 5)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_update(self):
+        booking_id = self.book(3).json()['id']
+        response = self.patch(booking_id, {'participants': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_price'], '500.00')
+        self.assertEqual(self.spots(), 3)
+        response = self.patch(booking_id, {'participants': 1})
+        self.assertEqual(response.json()['total_price'], '100.00')
+        self.assertEqual(self.spots(), 7)
+
+        # More than what is left is refused and changes nothing
+        self.assertEqual(self.patch(booking_id, {'participants': 50}).status_code, 400)
+        self.assertEqual(self.spots(), 7)
+        self.assertEqual(Booking.objects.get(pk=booking_id).participants, 1)
+
+        # Neither the status nor the date can be changed this way
+        response = self.patch(booking_id, {'status': 'cancelled', 'tour_date_id': self.dates[1].pk})
+        self.assertEqual(response.status_code, 200)
+        booking = Booking.objects.get(pk=booking_id)
+        self.assertEqual((booking.status, booking.tour_date_id), ('pending', self.date.pk))
+        self.assertEqual(self.spots(), 7)
+
+    def test_cancel(self):
+        booking_id = self.book(3).json()['id']
+        self.assertEqual(self.client.post(f'/api/api/v1/bookings/{booking_id}/cancel/').status_code, 200)
+        self.assertEqual(self.spots(), 8)
+        self.assertEqual(self.client.post(f'/api/api/v1/bookings/{booking_id}/cancel/').status_code, 400)
+        self.assertEqual(self.spots(), 8)
+        # A cancelled booking holds no seats to adjust
+        self.patch(booking_id, {'participants': 6})
+        self.assertEqual(self.spots(), 8)
+
+    def test_delete(self):
+        booking_id = self.book(3).json()['id']
+        cancelled_id = self.book(2).json()['id']
+        self.client.post(f'/api/api/v1/bookings/{cancelled_id}/cancel/')
+        self.assertEqual(self.spots(), 5)
+        self.assertEqual(self.client.delete(f'/api/api/v1/bookings/{booking_id}/').status_code, 204)
+        self.assertEqual(self.spots(), 8)
+        self.assertEqual(self.client.delete(f'/api/api/v1/bookings/{cancelled_id}/').status_code, 204)
+        self.assertEqual(self.spots(), 8)
+
+    def test_other_users_bookings_are_out_of_reach(self):
+        booking_id = self.book(3).json()['id']
+        self.client.force_login(User.objects.create(username='stranger'))
+        self.assertEqual(self.client.delete(f'/api/api/v1/bookings/{booking_id}/').status_code, 404)
+        self.assertEqual(self.spots(), 5)
+
+class BulkBookingTests(CatalogTestData, TestCase):
+    """Bulk bookings take seats like single ones, all or none in atomic mode, item by item in partial mode"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create(username='hiker'))
+
+    def bulk(self, bookings, mode=None):
+        data = {'bookings': bookings, **({'mode': mode} if mode else {})}
+        return self.client.post('/api/api/v1/bookings/bulk/', data, content_type='application/json')
+
+    def spots(self):
+        return [date.available_spots for date in TourDate.objects.order_by('pk')]
+
+    def test_atomic(self):
+        response = self.bulk([{'tour_date_id': self.dates[0].pk, 'participants': 3},
+                              {'tour_date_id': self.dates[0].pk, 'participants': 2},
+                              {'tour_date_id': self.dates[1].pk, 'participants': 8}])
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (3, 0))
+        self.assertEqual([item['index'] for item in data['results']], [0, 1, 2])
+        self.assertEqual([item['status'] for item in data['results']], [201] * 3)
+        booking = data['results'][0]['booking']
+        self.assertEqual((booking['participants'], booking['total_price'], booking['status']), (3, '300.00', 'pending'))
+        self.assertEqual(booking['tour_date']['available_spots'], 3)
+        self.assertEqual(self.spots(), [3, 0, 8])
+
+    def test_atomic_seat_exhaustion_creates_nothing(self):
+        response = self.bulk([{'tour_date_id': self.dates[0].pk, 'participants': 5},
+                              {'tour_date_id': self.dates[0].pk, 'participants': 4},
+                              {'tour_date_id': self.dates[1].pk, 'participants': 1}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([item['status'] for item in response.json()['results']], [409, 409, 424])
+        self.assertEqual(self.spots(), [8, 8, 8])
+        self.assertFalse(Booking.objects.exists())
+
+    def test_atomic_invalid_item_creates_nothing(self):
+        response = self.bulk([{'tour_date_id': self.dates[0].pk, 'participants': 1},
+                              {'tour_date_id': 0, 'participants': 1},
+                              {'tour_date_id': self.dates[0].pk}])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([item['status'] for item in results], [424, 400, 400])
+        self.assertIn('tour_date_id', results[1]['errors'])
+        self.assertIn('participants', results[2]['errors'])
+        self.assertFalse(Booking.objects.exists())
+
+    def test_partial(self):
+        response = self.bulk([{'tour_date_id': self.dates[0].pk, 'participants': 5},
+                              {'tour_date_id': self.dates[0].pk, 'participants': 4},
+                              {'tour_date_id': 0, 'participants': 1},
+                              {'tour_date_id': self.dates[0].pk, 'participants': 3}], mode='partial')
+        self.assertEqual(response.status_code, 207)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 2))
+        self.assertEqual([item['status'] for item in data['results']], [201, 409, 400, 201])
+        self.assertEqual(self.spots(), [0, 8, 8])
+        self.assertEqual(sorted(Booking.objects.values_list('participants', flat=True)), [3, 5])
+
+        # Nothing left to take
+        response = self.bulk([{'tour_date_id': self.dates[0].pk, 'participants': 1}], mode='partial')
+        self.assertEqual(response.status_code, 409)
+
+    def test_items_cannot_choose_their_status(self):
+        response = self.bulk([{'tour_date_id': self.dates[0].pk, 'participants': 2, 'status': 'cancelled'}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['results'][0]['booking']['status'], 'pending')
+        booking = Booking.objects.get()
+        self.assertEqual(booking.status, 'pending')
+        # Cancelling gives the seats back, once
+        for _ in range(2):
+            self.client.post(f'/api/api/v1/bookings/{booking.pk}/cancel/')
+        self.assertEqual(self.spots()[0], 8)
+
+class ImportCatalogTests(CatalogTestData, TestCase):
+    """Rerunning an import updates what the first run created instead of adding to it"""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def run_import(self, kind, lines, extension='csv'):
+        path = os.path.join(self.directory, f'{kind}.{extension}')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        stdout, stderr = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', kind, path, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_rerun_is_idempotent(self):
+        category, location = self.categories[0], self.locations[1]
+        lines = ['id,title,description,category,location,duration_days,difficulty,price,max_participants',
+                 f'9001,Manaslu Circuit,Remote,{category.pk},{location.name},14,hard,1400.00,12',
+                 f'{self.tours[0].pk},Annapurna Circuit,Updated notes,{category.pk},{location.pk},15,hard,'
+                 '1250.00,12']
+        self.run_import('tours', lines)
+        tours = Tour.objects.count()
+        stdout, _ = self.run_import('tours', lines)
+        self.assertIn('Imported 2 tours (0 skipped)', stdout)
+        self.assertEqual(Tour.objects.count(), tours)
+        self.assertEqual(Tour.objects.get(pk=9001).location, location)
+        updated = Tour.objects.get(pk=self.tours[0].pk)
+        self.assertEqual((updated.description, updated.duration_days), ('Updated notes', 15))
+
+        lines = ['tour,start_date,end_date,available_spots,guide', '9001,2030-09-01,2030-09-14,12,guide']
+        self.run_import('tour-dates', lines)
+        self.run_import('tour-dates', lines[:1] + ['9001,2030-09-01,2030-09-14,10,guide'])
+        self.assertEqual(list(TourDate.objects.filter(tour=9001).values_list('available_spots', flat=True)), [10])
+
+    def test_omitted_columns_keep_their_value(self):
+        tour = self.tours[0]
+        lines = [json.dumps({'id': 9005, 'title': 'Manaslu Circuit', 'description': 'Remote',
+                             'category': self.categories[0].pk, 'location': self.locations[0].pk,
+                             'duration_days': 14, 'difficulty': 'hard', 'price': '1400.00',
+                             'max_participants': 12}),
+                 json.dumps({'id': tour.pk, 'title': 'Annapurna Circuit', 'category': tour.category_id,
+                             'location': tour.location_id, 'duration_days': 16, 'difficulty': 'hard',
+                             'price': '1250.00', 'max_participants': 12})]
+        stdout, _ = self.run_import('tours', lines, extension='jsonl')
+        self.assertIn('Imported 2 tours (0 skipped)', stdout)
+        updated = Tour.objects.get(pk=tour.pk)
+        self.assertEqual((updated.description, updated.duration_days), (tour.description, 16))
+        self.assertEqual(Tour.objects.get(pk=9005).description, 'Remote')
+
+    def test_rows_need_their_unique_fields(self):
+        stdout, stderr = self.run_import('categories', ['id,name', ',Canyoning', '9002,Climbing'])
+        self.assertIn('Imported 1 categories (1 skipped)', stdout)
+        self.assertIn('line 2: id is required, rows are upserted on it, skipped', stderr)
+        _, stderr = self.run_import('tour-dates', ['tour,end_date,available_spots,guide',
+                                                   f'{self.tours[0].pk},2030-09-14,12,guide'])
+        self.assertIn('start_date is required', stderr)
+        self.assertFalse(Category.objects.filter(name='Canyoning').exists())
+
+    def test_ambiguous_natural_keys_are_refused(self):
+        Location.objects.create(name=self.locations[0].name, country='India')
+        lines = ['id,title,description,category,location,duration_days,difficulty,price,max_participants',
+                 f'9003,Ambiguous,Notes,{self.categories[0].pk},{self.locations[0].name},3,easy,100,10',
+                 f'9004,By id,Notes,{self.categories[0].pk},{self.locations[0].pk},3,easy,100,10']
+        _, stderr = self.run_import('tours', lines)
+        self.assertIn(f"location '{self.locations[0].name}' matches several rows, use its id", stderr)
+        self.assertEqual(list(Tour.objects.filter(pk__in=[9003, 9004]).values_list('pk', flat=True)), [9004])
+
+    def test_invalidates_cached_responses(self):
+        self.assertEqual(self.client.get('/api/api/v1/categories/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/api/v1/categories/')['X-Cache'], 'HIT')
+        self.run_import('categories', ['id,name', f'{self.categories[0].pk},Renamed'])
+        response = self.client.get('/api/api/v1/categories/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renamed', [category['name'] for category in response.json()['results']])
+
+class ExportTests(CatalogTestData, TestCase):
+    """Staff exports stream every matching booking and review, one row per line, a chunk at a time"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hiker = User.objects.create(username='hiker', email='hiker@example.com')
+        for i, status in enumerate(['pending', 'confirmed', 'cancelled', 'confirmed', 'pending']):
+            Booking.objects.create(user=cls.hiker, tour_date=cls.dates[i % 2], participants=i + 1, status=status,
+                                   total_price=f'{100 * (i + 1)}.00', booking_reference=f'REF{i}')
+        Booking.objects.filter(booking_reference='REF0').update(
+            created_at=datetime.datetime(2020, 1, 1, 12, tzinfo=datetime.timezone.utc))
+        for rating in (5, 3, 5):
+            Review.objects.create(tour=cls.tours[0], user=User.objects.create(username=f'reviewer{rating}-'
+                                  f'{Review.objects.count()}'), rating=rating, comment='Fine, "really"\nfine')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+
+    def export(self, kind, expected=200, **params):
+        response = self.client.get(f'/api/api/v1/exports/{kind}/', params)
+        self.assertEqual(response.status_code, expected)
+        return response
+
+    def test_csv(self):
+        response = self.export('bookings')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="bookings-', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['booking_reference'] for row in rows], [f'REF{i}' for i in range(5)])
+        self.assertEqual(rows[1], {**rows[1], 'username': 'hiker', 'email': 'hiker@example.com', 'participants': '2',
+                                   'tour_title': 'Everest Base Camp', 'start_date': '2030-05-01'})
+        # Commas, quotes and newlines survive the round trip
+        rows = list(csv.DictReader(StringIO(b''.join(self.export('reviews').streaming_content).decode())))
+        self.assertEqual([row['comment'] for row in rows], ['Fine, "really"\nfine'] * 3)
+
+    def test_ndjson_and_filters(self):
+        def lines(kind, **params):
+            content = b''.join(self.export(kind, output='ndjson', **params).streaming_content).decode()
+            return [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual([row['status'] for row in lines('bookings', status='confirmed')], ['confirmed'] * 2)
+        self.assertEqual([row['booking_reference'] for row in lines('bookings', end='2020-01-01')], ['REF0'])
+        self.assertEqual(len(lines('bookings', start='2020-01-02')), 4)
+        self.assertEqual([row['rating'] for row in lines('reviews', rating='5')], [5, 5])
+        for kind, params in (('bookings', {'status': 'lost'}), ('bookings', {'start': '01/02/2020'}),
+                             ('reviews', {'rating': '6'}), ('reviews', {'output': 'xml'})):
+            with self.subTest(kind=kind, params=params):
+                self.export(kind, expected=400, **params)
+
+    def test_staff_only(self):
+        self.client.force_login(self.hiker)
+        self.export('bookings', expected=403)
+        self.client.logout()
+        self.export('reviews', expected=403)
+
+    def test_render_yields_chunks(self):
+        queryset, columns = exports.bookings()
+        for output in ('csv', 'ndjson'):
+            with self.subTest(output=output):
+                chunks = list(exports.render(queryset, columns, output, chunk_size=2))
+                self.assertEqual(len(chunks), 3)
+                self.assertEqual(''.join(chunks).count('\n'), 6 if output == 'csv' else 5)
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bookings.ndjson')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_data', 'bookings', output=path, status='pending', chunk_size=1, stderr=StringIO())
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['booking_reference'] for line in f], ['REF0', 'REF4'])
+        stdout = StringIO()
+        with mock.patch('sys.stdout', stdout):
+            call_command('export_data', 'reviews', rating='3')
+        self.assertEqual([row['rating'] for row in csv.DictReader(StringIO(stdout.getvalue()))], ['3'])
+
+class SparseFieldsetTests(CatalogTestData, TestCase):
+    """?fields=/?expand= render only what is asked for and query only what they render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hiker = User.objects.create(username='hiker')
+        for tour in cls.tours[:2]:
+            Review.objects.create(tour=tour, user=cls.hiker, rating=4, comment='Good')
+        Booking.objects.create(user=cls.hiker, tour_date=cls.dates[0], participants=2, total_price='200.00',
+                               booking_reference='REF1')
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_tour_fields(self):
+        data, queries = self.get('/api/api/v1/tours/', fields='id,title,price,category')
+        self.assertEqual(set(data['results'][0]), {'id', 'title', 'price', 'category'})
+        # Not expanded: the id, without joining the category or prefetching anything
+        self.assertEqual(data['results'][0]['category'], self.categories[0].pk)
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"hiking_category"', queries[-1])
+        self.assertNotIn('"description"', queries[-1])
+
+    def test_tour_expand(self):
+        data, queries = self.get(f'/api/api/v1/tours/{self.tours[0].pk}/', expand='location,reviews')
+        self.assertEqual(data['location']['name'], 'Location 0')
+        self.assertEqual(data['category'], self.categories[0].pk)
+        self.assertEqual([review['rating'] for review in data['reviews']], [4])
+        self.assertNotIn('dates', data)
+        self.assertFalse([sql for sql in queries if '"hiking_tourdate"' in sql])
+        # Expanding outside of fields expands nothing
+        data, _ = self.get(f'/api/api/v1/tours/{self.tours[0].pk}/', fields='id,title', expand='location')
+        self.assertEqual(set(data), {'id', 'title'})
+
+    def test_full_representation_unchanged(self):
+        full, _ = self.get(f'/api/api/v1/tours/{self.tours[0].pk}/')
+        expanded, _ = self.get(f'/api/api/v1/tours/{self.tours[0].pk}/', expand='category,location,dates,reviews')
+        self.assertEqual(expanded, full)
+
+    def test_booking_fields(self):
+        self.client.force_login(self.hiker)
+        data, queries = self.get('/api/api/v1/bookings/', fields='id,participants,tour_date')
+        self.assertEqual(data['results'], [{'id': Booking.objects.get().pk, 'participants': 2,
+                                            'tour_date': self.dates[0].pk}])
+        self.assertFalse([sql for sql in queries if '"hiking_tourdate"' in sql])
+        data, _ = self.get('/api/api/v1/bookings/', expand='tour_date')
+        self.assertEqual(data['results'][0]['tour_date']['guide']['username'], 'guide')
+        self.assertEqual(data['results'][0]['user'], self.hiker.pk)
+        # Writes always answer with the full representation
+        response = self.client.post('/api/api/v1/bookings/?fields=id', {'tour_date_id': self.dates[1].pk,
+                                                                        'participants': 1},
+                                    content_type='application/json')
+        self.assertIn('tour_date', response.json())
+
+class AvailabilityCalendarTests(CatalogTestData, TestCase):
+    """Calendars encode every departure's seats and are rebuilt once a seat change commits"""
+
+    def setUp(self):
+        super().setUp()
+        availability._cache().clear()
+        self.tour = self.tours[0]
+        # Overlaps the first date and runs into June
+        TourDate.objects.create(tour=self.tour, start_date=datetime.date(2030, 5, 3),
+                                end_date=datetime.date(2030, 6, 2), available_spots=4, guide=self.guide)
+
+    def calendar(self, status=200, **params):
+        response = self.client.get('/api/api/v1/tour-dates/calendar/', params)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_encoding(self):
+        data = self.calendar(tour=f'{self.tour.pk},{self.tours[1].pk}', start='2030-05', end='2030-06')
+        self.assertEqual(data['end'], '2030-06-30')
+        months = data['tours'][str(self.tour.pk)]
+        self.assertEqual(months['2030-05'], {'days': [[1, 2, 8], [3, 3, 12], [4, 31, 4]], 'starts': [1, 3],
+                                             'ends': [3]})
+        self.assertEqual(months['2030-06'], {'days': [[1, 2, 4]], 'starts': [], 'ends': [2]})
+        self.assertEqual(data['tours'][str(self.tours[1].pk)]['2030-06'], {'days': [], 'starts': [], 'ends': []})
+
+    def test_cached_until_seats_change(self):
+        params = {'tour': self.tour.pk, 'start': '2030-05'}
+        self.calendar(**params)
+        with self.assertNumQueries(0):
+            self.calendar(**params)
+        user = User.objects.create(username='hiker')
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/api/v1/bookings/', {'tour_date_id': self.dates[0].pk,
+                                                                  'participants': 3},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.client.logout()
+        self.assertEqual(self.calendar(**params)['tours'][str(self.tour.pk)]['2030-05']['days'][:2],
+                         [[1, 2, 5], [3, 3, 9]])
+
+    def test_invalidation_while_building(self):
+        params = {'tour': self.tour.pk, 'start': '2030-05'}
+        build = availability.build
+
+        def build_then_take_seats(*args):
+            built = build(*args)
+            # Another request's seat change commits before this one stores what it built
+            with self.captureOnCommitCallbacks(execute=True):
+                tour_date = TourDate.objects.get(pk=self.dates[0].pk)
+                tour_date.available_spots -= 3
+                tour_date.save()
+            return built
+        with mock.patch.object(availability, 'build', side_effect=build_then_take_seats):
+            stale = self.calendar(**params)
+        self.assertEqual(stale['tours'][str(self.tour.pk)]['2030-05']['days'][:2], [[1, 2, 8], [3, 3, 12]])
+        self.assertEqual(self.calendar(**params)['tours'][str(self.tour.pk)]['2030-05']['days'][:2],
+                         [[1, 2, 5], [3, 3, 9]])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'tour': 'x'}, {'tour': self.tour.pk, 'start': '2030-13'},
+                       {'tour': self.tour.pk, 'start': '2030-05', 'end': '2030-04'},
+                       {'tour': self.tour.pk, 'start': '2030-01', 'end': '2031-01'}):
+            with self.subTest(params=params):
+                self.calendar(status=400, **params)
+
+class CategoryCounterTests(CatalogTestData, TestCase):
+    """Category.active_tours_count follows tours being activated, moved and deleted"""
+
+    def counts(self):
+        return list(Category.objects.order_by('pk').values_list('active_tours_count', flat=True))
+
+    def test_tour_writes(self):
+        self.assertEqual(self.counts(), [2, 0])
+        closed = self.tours[2]
+        closed.active = True
+        closed.save()
+        self.assertEqual(self.counts(), [2, 1])
+        tour = Tour.objects.get(pk=self.tours[0].pk)
+        tour.category = self.categories[1]
+        tour.save()
+        self.assertEqual(self.counts(), [1, 2])
+        tour.active = False
+        tour.save()
+        self.assertEqual(self.counts(), [1, 1])
+        tour.delete()  # inactive
+        closed.delete()
+        self.assertEqual(self.counts(), [1, 0])
+        self.locations[1].delete()  # cascades to the last active tour
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_saving_a_category_keeps_its_counter(self):
+        category = Category.objects.get(pk=self.categories[0].pk)
+        create_tour(category, self.locations[0], 'Langtang Valley')
+        category.description = 'Multi-day treks'
+        category.save()
+        self.assertEqual(self.counts(), [3, 0])
+
+    def test_rebuild(self):
+        Category.objects.update(active_tours_count=7)
+        call_command('rebuild_category_tour_counts', stdout=StringIO())
+        self.assertEqual(self.counts(), [2, 0])
+
+class ProximitySearchTests(TestCase):
+    """``near`` finds what a full haversine scan finds, closest first, across the antimeridian"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Trekking')
+        cls.places = {}
+        for name, latitude, longitude in (('Kathmandu', '27.717245', '85.323961'),
+                                          ('Lukla', '27.688611', '86.731389'),
+                                          ('Pokhara', '28.209538', '83.959038'),
+                                          ('Delhi', '28.613939', '77.209021'),
+                                          ('Suva', '-18.124809', '178.450079'),
+                                          ('Taveuni', '-16.833333', '-179.966667')):
+            location = Location.objects.create(name=name, country='Somewhere', latitude=latitude,
+                                               longitude=longitude)
+            cls.places[name] = location
+            create_tour(category, location, title=f'{name} trek')
+        Location.objects.create(name='Nowhere', country='Somewhere')
+
+    def setUp(self):
+        response_cache.clear()
+
+    def near(self, path, **params):
+        response = self.client.get(f'/api/api/v1/{path}/near/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_matches_a_full_scan(self):
+        locations = Location.objects.exclude(latitude=None).values_list('pk', 'latitude', 'longitude')
+        for latitude, longitude, radius in ((27.7, 85.3, 250), (27.7, 85.3, 1200), (-17.5, 179.9, 300),
+                                            (-17.5, -179.9, 300)):
+            with self.subTest(latitude=latitude, longitude=longitude, radius=radius):
+                expected = geo.nearest(locations, latitude, longitude, radius, 100)
+                self.assertEqual(geo.locations_near(latitude, longitude, radius, 100), expected)
+                results = self.near('locations', lat=latitude, lon=longitude, radius=radius)
+                self.assertEqual([location['id'] for location in results], [pk for pk, _ in expected])
+
+    def test_tours_closest_first(self):
+        results = self.near('tours', lat=28.0, lon=84.5, radius=200, limit=2)
+        self.assertEqual([tour['title'] for tour in results], ['Pokhara trek', 'Kathmandu trek'])
+        self.assertLess(results[0]['distance_km'], results[1]['distance_km'])
+        # Both sides of the antimeridian
+        results = self.near('tours', lat=-17.5, lon=179.9, radius=300)
+        self.assertEqual({tour['title'] for tour in results}, {'Suva trek', 'Taveuni trek'})
+
+    def test_moving_a_location_moves_its_cell(self):
+        lukla = self.places['Lukla']
+        lukla.latitude, lukla.longitude = '-18.0', '178.5'
+        lukla.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(Location.objects.get(pk=lukla.pk).geo_cell, geo.cell_for(-18.0, 178.5))
+        results = self.near('locations', lat=-17.5, lon=179.9, radius=300)
+        self.assertIn(lukla.pk, [location['id'] for location in results])
+
+    def test_invalid_parameters(self):
+        for params in ({'lon': 85}, {'lat': 'north', 'lon': 85}, {'lat': 95, 'lon': 85},
+                       {'lat': 27, 'lon': 85, 'radius': geo.MAX_RADIUS_KM + 1}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/api/v1/locations/near/', params).status_code, 400)
+
+class TourFastPathParityTests(TestCase):
+    """The fast read path must render TourViewSet.list exactly like TourSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        guide = User.objects.create(username='guide', first_name='Ang', last_name='Sherpa')
+        categories = [Category.objects.create(name=f'Category {i}', description='Ünïcode ✓') for i in range(3)]
+        locations = [Location.objects.create(name=f'Location {i}', country='Nepal', latitude=27.9 + i,
+                                             longitude=86.9) for i in range(2)]
+        for i in range(12):
+            tour = Tour.objects.create(
+                title=f'Tour {i}', description='Trail notes', category=categories[i % 3],
+                location=locations[i % 2], duration_days=i % 5 + 1, difficulty='moderate', price=f'{100 + i}.50',
+                max_participants=10, image=f'tours/{i}.jpg' if i % 2 else '', featured=i % 4 == 0,
+            )
+            for week in range(2):
+                start = datetime.date(2030, 1, 1) + datetime.timedelta(days=7 * week + i)
+                TourDate.objects.create(tour=tour, start_date=start, end_date=start + datetime.timedelta(days=2),
+                                        available_spots=week * 3, guide=guide)
+            for stars in range(i % 3):
+                Review.objects.create(tour=tour, user=User.objects.create(username=f'hiker-{i}-{stars}'),
+                                      rating=stars + 3, comment='Great')
+        card = {'width': 640, 'height': 427, 'jpeg': 'card.jpg', 'webp': 'card.webp'}
+        Tour.objects.filter(title='Tour 1').update(
+            image_variants=images.stored_value('tours/1.jpg', ('0' * 64, {'card': card}, True)))
+
+    def setUp(self):
+        response_cache.clear()
+
+    def assertSameOutput(self, url):
+        responses = []
+        for fast in (False, True):
+            response_cache.clear()
+            with override_settings(FAST_READ_PATH=fast):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            responses.append(response)
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(responses[0].content, responses[1].content)
+        return responses[1].json()
+
+    def test_list(self):
+        data = self.assertSameOutput('/api/api/v1/tours/')
+        self.assertEqual(len(data['results']), 12)
+
+    def test_ordering_filters_and_search(self):
+        self.assertSameOutput('/api/api/v1/tours/?ordering=-price')
+        self.assertSameOutput('/api/api/v1/tours/?ordering=average_rating&featured=false')
+        self.assertSameOutput('/api/api/v1/tours/?search=Tour')
+
+    def test_cursor_pages(self):
+        data = self.assertSameOutput('/api/api/v1/tours/?page_size=5&ordering=price')
+        self.assertSameOutput(data['next'])
+
+    def test_sparse_requests_use_the_serializer(self):
+        self.assertSameOutput('/api/api/v1/tours/?fields=id,title,category&expand=category')
+
+    @override_settings(FAST_READ_PATH=True)
+    def test_fast_path_skips_the_serializer(self):
+        with mock.patch.object(TourSerializer, 'to_representation', side_effect=AssertionError):
+            self.assertEqual(self.client.get('/api/api/v1/tours/').status_code, 200)
+
+class AsyncEndpointTests(TestCase):
+    """The /api/async/ variants return what the synchronous endpoints do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        TourFastPathParityTests.setUpTestData()
+
+    def setUp(self):
+        response_cache.clear()
+
+    def assertSameAsSync(self, sync_url, async_url):
+        expected = self.client.get(sync_url)
+        response = self.client.get(async_url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content.replace(b'/api/api/v1/', b'/api/async/v1/'))
+
+    def test_lists(self):
+        for fast in (False, True):
+            with override_settings(FAST_READ_PATH=fast):
+                self.assertSameAsSync('/api/api/v1/tours/?page_size=5&ordering=price',
+                                      '/api/async/v1/tours/?page_size=5&ordering=price')
+        tour = Tour.objects.first()
+        self.assertSameAsSync(f'/api/api/v1/tour-dates/?tour={tour.pk}', f'/api/async/v1/tour-dates/?tour={tour.pk}')
+        self.assertSameAsSync('/api/api/v1/categories/', '/api/async/v1/categories/')
+
+    def test_detail(self):
+        tour = Tour.objects.first()
+        self.assertSameAsSync(f'/api/api/v1/tours/{tour.pk}/', f'/api/async/v1/tours/{tour.pk}/')
+        self.assertSameAsSync('/api/api/v1/tours/0/', '/api/async/v1/tours/0/')
+
+    def test_read_only(self):
+        self.assertEqual(self.client.post('/api/async/v1/tours/').status_code, 405)
+
+    def test_url_names(self):
+        self.assertEqual(reverse('async-tour-category-list'), '/api/async/v1/categories/')
+        self.assertEqual(reverse('async-blog-category-list'), '/api/async/categories/')
+
+class QueryPlanAuditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        TourFastPathParityTests.setUpTestData()
+
+    def audit(self, route):
+        out = StringIO()
+        call_command('audit_query_plans', route=route, stdout=out)
+        return out.getvalue()
+
+    def test_tour_list_orderings_use_indexes(self):
+        output = self.audit('TourViewSet.list')
+        self.assertIn('?ordering=-price', output)
+        self.assertNotIn('full scan of hiking_tour', output)
+        self.assertNotIn('temp b-tree for ORDER BY (hiking_tourdate)', output)
+
+    def test_detail_routes_are_audited(self):
+        self.assertRegex(self.audit('TourViewSet.retrieve'), r'/api/api/v1/tours/\d+/  \(\d+ queries\)')
+
+QUERY_BUDGETS = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+
+SAVEPOINT = re.compile(r'(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT) ')
+
+def _statement(sql):
+    """``sql`` with its literals replaced, so repeats of one statement compare equal"""
+    return re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', sql)
+
+# The availability cache is shared between processes by default; keep it local and empty
+@override_settings(AVAILABILITY_CACHE_ALIAS='default')
+class QueryCountTests(TestCase):
+    """
+    No statement of a GET endpoint, with each of the parameter variants of
+    the query plan audit, repeats more often on a dataset four times larger,
+    and no endpoint runs more queries than its budget in query_budgets.json.
+    When an endpoint legitimately needs more queries, or a new one appears,
+    rerun with UPDATE_QUERY_BUDGETS=1 and commit the file.
+    """
+    # Under a page of everything, so that an N+1 shows at the larger size
+    SMALL = dict(users=4, categories=2, locations=2, tours=3, tour_dates=5, reviews=4, bookings=5,
+                 blog_categories=1, posts=3)
+
+    def measure(self, scale):
+        """``{(route label, variant): [statements]}`` on a generated dataset ``scale`` times SMALL"""
+        measured = {}
+        with transaction.atomic():
+            datagen.generate(seed=1, log=lambda *args: None,
+                             **{name: count * scale for name, count in self.SMALL.items()})
+            user = User.objects.get(username=datagen.ADMIN)
+            sample = RequestFactory().get('/')
+            sample.user = user
+            for route in discover():
+                for variant, (url, params) in enumerate(sample_requests(route, sample)):
+                    caches['default'].clear()
+                    response, queries = call(route, url, params, user)
+                    view_counter.discard()
+                    self.assertLess(response.status_code, 400, f'{route.label} {url} {params}')
+                    # Leave out the savepoints, call() wraps every request in one
+                    measured[route.label, variant] = [query['sql'] for query in queries
+                                                      if not SAVEPOINT.match(query['sql'])]
+            transaction.set_rollback(True)
+        return measured
+
+    def test_query_counts(self):
+        small, large = self.measure(1), self.measure(4)
+        self.assertEqual(small.keys(), large.keys())
+        growing = []
+        for key, statements in large.items():
+            # A statement repeating more often on more rows is an N+1; one
+            # that only runs once the result is not empty (a prefetch) is not
+            before, after = Counter(map(_statement, small[key])), Counter(map(_statement, statements))
+            repeated = [(count, sql) for sql, count in after.items() if count > 1 and count > before[sql]]
+            if repeated:
+                growing.append(f'{key[0]} (variant {key[1]}): {len(small[key])} -> {len(statements)} queries\n'
+                               + '\n'.join(f'  x{count} {sql}' for count, sql in sorted(repeated, reverse=True)))
+        self.assertFalse(growing, 'Query counts grow with the number of rows:\n' + '\n'.join(growing))
+
+        counts = {}
+        for (label, _), statements in large.items():
+            counts[label] = max(counts.get(label, 0), len(statements))
+        if os.environ.get('UPDATE_QUERY_BUDGETS'):
+            with open(QUERY_BUDGETS, 'w') as file:
+                json.dump(dict(sorted(counts.items())), file, indent=2)
+                file.write('\n')
+        with open(QUERY_BUDGETS) as file:
+            budgets = json.load(file)
+        over = [f'{label}: {count} queries, budget {budgets.get(label)}' for label, count in sorted(counts.items())
+                if count > budgets.get(label, -1)]
+        self.assertFalse(over, 'Over the query budget (UPDATE_QUERY_BUDGETS=1 rewrites query_budgets.json):\n'
+                         + '\n'.join(over))
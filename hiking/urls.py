@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'categories', views.CategoryViewSet)
@@ -12,4 +12,11 @@ router.register(r'reviews', views.ReviewViewSet)
 
 urlpatterns = [
     path('api/v1/', include(router.urls)),
-    path('api-auth/', include('rest_framework.urls')),]
\ No newline at end of file
+    path('api/v1/exports/bookings/', views.ExportView.as_view(export='bookings'), name='export-bookings'),
+    path('api/v1/exports/reviews/', views.ExportView.as_view(export='reviews'), name='export-reviews'),
+    path('api-auth/', include('rest_framework.urls')),
+    # Async variants of the read endpoints (ASGI)
+    path('async/v1/categories/', async_views.category_list, name='async-tour-category-list'),
+    path('async/v1/tours/', async_views.tour_list, name='async-tour-list'),
+    path('async/v1/tours/<int:pk>/', async_views.tour_detail, name='async-tour-detail'),
+    path('async/v1/tour-dates/', async_views.tour_date_list, name='async-tourdate-list'),]
\ No newline at end of file
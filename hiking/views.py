@@ -4,47 +4,133 @@ from django.shortcuts import render
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg
-from .models import Category, Location, Tour, TourDate, Booking, Review
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.db.models import Q, Avg, Count, Exists, OuterRef
+from django.utils import timezone
+from .models import Category, Location, Tour, TourDate, TourQuerySet, Booking, Review
+from . import availability, exports, geo, search
+from .inventory import SeatsUnavailable, release_seats, reserve_many, reserve_seats
 from serializer.hiking_serializers import (CategorySerializer, LocationSerializer, TourSerializer,
-                         TourDateSerializer, BookingSerializer, ReviewSerializer)
+                         TourDateSerializer, BookingSerializer, BulkBookingSerializer, ReviewSerializer)
+from trips.cache import CachedResponseMixin
+from trips.fastpath import FastJSONRenderer, FastPath
+from trips.pagination import KeysetPagination, PaginatedActionMixin
+from trips.routers import ReadReplicaMixin
+import datetime
 import uuid
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Category.objects.all()
+def near_params(request):
+    """``(lat, lon, radius_km, limit)`` from the query string of a ``near`` action"""
+    params = request.query_params
+    try:
+        latitude = float(params['lat'])
+        longitude = float(params['lon'])
+        radius = float(params.get('radius', 25))
+        limit = int(params.get('limit', 20))
+    except KeyError as e:
+        raise ValidationError({e.args[0]: 'This parameter is required.'})
+    except ValueError:
+        raise ValidationError('lat, lon and radius must be numbers and limit an integer.')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValidationError('lat must be within [-90, 90] and lon within [-180, 180].')
+    if not 0 < radius <= geo.MAX_RADIUS_KM:
+        raise ValidationError(f'radius must be between 0 and {geo.MAX_RADIUS_KM} km.')
+    return latitude, longitude, radius, min(max(limit, 1), 100)
+
+def near_response(serializer, objects, hits):
+    """Serialize ``objects`` in distance order with a ``distance_km`` field"""
+    data = []
+    for pk, distance in hits:
+        item = serializer(objects[pk]).data
+        item['distance_km'] = round(distance, 3)
+        data.append(item)
+    return Response({'count': len(data), 'results': data})
+
+class CategoryViewSet(ReadReplicaMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.annotate(tours_count=Count('tours', filter=Q(tours__active=True)))
     serializer_class = CategorySerializer
+    cache_dependencies = [Tour]
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'description']
 
-class LocationViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Location.objects.all()
+class LocationViewSet(ReadReplicaMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Location.objects.annotate(tours_count=Count('tours', filter=Q(tours__active=True)))
     serializer_class = LocationSerializer
+    cache_dependencies = [Tour]
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['name', 'country', 'state', 'city']
     filterset_fields = ['country', 'state']
+    
+    @action(detail=False, methods=['get'])
+    def near(self, request):
+        """Locations within ``radius`` km of ``lat``/``lon``, closest first"""
+        latitude, longitude, radius, limit = near_params(request)
+        
+        def compute():
+            candidates = self.filter_queryset(Location.objects.all())
+            hits = geo.locations_near(latitude, longitude, radius, limit, candidates)
+            objects = self.get_queryset().in_bulk([pk for pk, _ in hits])
+            return near_response(self.get_serializer, objects, hits)
+        return self.cached_response(request, compute)
 
-class TourViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Tour.objects.filter(active=True)
+class TourViewSet(ReadReplicaMixin, CachedResponseMixin, PaginatedActionMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Tour.objects.filter(active=True).with_details()
     serializer_class = TourSerializer
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    cache_dependencies = [Category, Location, TourDate, Review]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, search.TourSearchFilter]
     search_fields = ['title', 'description', 'location__name', 'category__name']
-    filterset_fields = ['category', 'location', 'difficulty', 'featured']
-    ordering_fields = ['price', 'duration_days', 'created_at']
+    filterset_fields = {
+        'category': ['exact'],
+        'location': ['exact'],
+        'difficulty': ['exact'],
+        'featured': ['exact'],
+        'average_rating': ['gte', 'lte'],
+        'reviews_count': ['gte'],
+    }
+    ordering_fields = ['price', 'duration_days', 'created_at', 'average_rating', 'reviews_count']
     ordering = ['-created_at']
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    # TourSerializer's method fields and the counts it reads from annotations
+    fast_path = FastPath(TourSerializer, overrides={
+        'category.tours_count': (['category__active_tours_count'], lambda row: row['category__active_tours_count']),
+        'location.tours_count': (['location_tours_count'], lambda row: row['location_tours_count']),
+        'average_rating': (['average_rating', 'reviews_count'],
+                           lambda row: row['average_rating'] if row['reviews_count'] else 0),
+        'rating_histogram': ([f'rating_{stars}_count' for stars in range(1, 6)],
+                             lambda row: {str(stars): row[f'rating_{stars}_count'] for stars in range(1, 6)}),
+    }, orderings={'dates': TourQuerySet.dates_ordering, 'reviews': TourQuerySet.reviews_ordering})
+    
+    def list(self, request, *args, **kwargs):
+        if not self.fast_path.applies(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.cached_response(request, lambda: self.fast_path.list_response(self, queryset))
+    
+    def get_queryset(self):
+        requested = TourSerializer.requested(self.request)
+        if requested is None:
+            return super().get_queryset()
+        # ?fields=/?expand=: load only the relations and columns that are rendered
+        queryset = Tour.objects.filter(active=True).with_details(requested[1])
+        return queryset.only(*TourSerializer.model_columns(requested), *self.ordering_fields)
     
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """Get featured tours"""
-        featured_tours = self.queryset.filter(featured=True)
-        serializer = self.get_serializer(featured_tours, many=True)
-        return Response(serializer.data)
+        featured_tours = self.filter_queryset(self.get_queryset()).filter(featured=True)
+        return self.cached_response(request, lambda: self.paginated_response(featured_tours))
     
     @action(detail=False, methods=['get'])
     def search(self, request):
         """Advanced search with filters"""
-        queryset = self.queryset
+        queryset = self.filter_queryset(self.get_queryset())
         
         # Filter by price range
         min_price = request.query_params.get('min_price')
@@ -65,14 +151,31 @@ class TourViewSet(viewsets.ReadOnlyModelViewSet):
         # Filter by availability
         available_only = request.query_params.get('available_only', 'false').lower() == 'true'
         if available_only:
-            queryset = queryset.filter(dates__available_spots__gt=0).distinct()
+            queryset = queryset.filter(Exists(TourDate.objects.filter(tour=OuterRef('pk'), available_spots__gt=0)))
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.cached_response(request, lambda: self.paginated_response(queryset))
+    
+    @action(detail=False, methods=['get'])
+    def near(self, request):
+        """Active tours whose location is within ``radius`` km of ``lat``/``lon``, closest first"""
+        latitude, longitude, radius, limit = near_params(request)
+        
+        def compute():
+            candidates = self.filter_queryset(Tour.objects.filter(active=True)).filter(
+                geo.cells_filter(latitude, longitude, radius, field='location__geo_cell')
+            ).values_list('pk', 'location__latitude', 'location__longitude')
+            hits = geo.nearest(candidates, latitude, longitude, radius, limit)
+            objects = self.get_queryset().in_bulk([pk for pk, _ in hits])
+            return near_response(self.get_serializer, objects, hits)
+        return self.cached_response(request, compute)
+
+class TourDatePagination(KeysetPagination):
+    ordering = ('start_date', 'id')
 
-class TourDateViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = TourDate.objects.all()
+class TourDateViewSet(ReadReplicaMixin, CachedResponseMixin, PaginatedActionMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = TourDate.objects.select_related('guide')
     serializer_class = TourDateSerializer
+    pagination_class = TourDatePagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['tour', 'guide']
     ordering_fields = ['start_date', 'end_date']
@@ -81,63 +184,287 @@ class TourDateViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def available(self, request):
         """Get available tour dates"""
-        available_dates = self.queryset.filter(available_spots__gt=0)
-        serializer = self.get_serializer(available_dates, many=True)
-        return Response(serializer.data)
+        available_dates = self.filter_queryset(self.get_queryset()).filter(available_spots__gt=0)
+        return self.cached_response(request, lambda: self.paginated_response(available_dates))
+    
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """
+        Per-day availability of ``tour`` (comma separated ids) for the months
+        ``start`` to ``end`` (YYYY-MM, default the current month)
+        """
+        params = request.query_params
+        try:
+            tour_ids = sorted({int(pk) for pk in params.get('tour', '').split(',') if pk.strip()})
+            today = timezone.localdate()
+            first = datetime.datetime.strptime(params['start'], '%Y-%m').date() if 'start' in params \
+                else today.replace(day=1)
+            last = datetime.datetime.strptime(params['end'], '%Y-%m').date() if 'end' in params else first
+        except ValueError:
+            raise ValidationError('tour must be a comma separated list of ids and start/end YYYY-MM months.')
+        if not tour_ids:
+            raise ValidationError({'tour': 'This parameter is required.'})
+        if len(tour_ids) > availability.MAX_TOURS:
+            raise ValidationError(f'At most {availability.MAX_TOURS} tours per request.')
+        months = len(availability.months_between(first, last))
+        if not 1 <= months <= availability.MAX_MONTHS:
+            raise ValidationError(f'end must be between start and {availability.MAX_MONTHS} months after it.')
+        return Response({
+            'start': first,
+            'end': availability.month_end(last),
+            'tours': availability.calendar(tour_ids, first, last),
+        })
 
 class BookingViewSet(viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status', 'tour_date__tour']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+    NO_SPOTS = {'participants': ['Not enough available spots for this tour date']}
     
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
+        queryset = Booking.objects.filter(user=self.request.user)
+        requested = BookingSerializer.requested(self.request)
+        if requested is None:
+            return queryset.select_related('user', 'tour_date__guide')
+        related = [{'user': 'user', 'tour_date': 'tour_date__guide'}[name] for name in requested[1]]
+        if related:
+            # select_related() without names would follow every foreign key
+            queryset = queryset.select_related(*related)
+        return queryset.only(*BookingSerializer.model_columns(requested), *self.ordering_fields)
     
     def perform_create(self, serializer):
         # Generate booking reference
         booking_ref = str(uuid.uuid4())[:8].upper()
         
-        # Calculate total price
         tour_date = serializer.validated_data['tour_date_id']
-        tour_date_obj = TourDate.objects.get(id=tour_date)
+        try:
+            tour_date_obj = TourDate.objects.select_related('tour', 'guide').get(id=tour_date)
+        except TourDate.DoesNotExist:
+            raise ValidationError({'tour_date_id': 'Tour date not found'})
+        
+        # Calculate total price
         participants = serializer.validated_data['participants']
         total_price = tour_date_obj.tour.price * participants
         
-        serializer.save(
-            user=self.request.user,
-            booking_reference=booking_ref,
-            total_price=total_price,
-            tour_date=tour_date_obj
-        )
+        # Take the seats and insert the booking in one transaction; the seat
+        # UPDATE goes first so the transaction starts by taking the write lock
+        try:
+            with transaction.atomic():
+                reserve_seats(tour_date_obj.pk, participants)
+                serializer.save(
+                    user=self.request.user,
+                    booking_reference=booking_ref,
+                    total_price=total_price,
+                    tour_date=tour_date_obj
+                )
+        except SeatsUnavailable:
+            raise ValidationError({'participants': 'Not enough available spots for this tour date'})
+        tour_date_obj.available_spots -= participants
+    
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # The stored row, not the instance loaded before validation, is what holds seats
+            stored = Booking.objects.select_for_update().select_related('tour_date__tour').get(
+                pk=serializer.instance.pk)
+            participants = serializer.validated_data.get('participants', stored.participants)
+            delta = participants - stored.participants
+            if not delta:
+                serializer.save()
+                return
+            if stored.status != 'cancelled':
+                try:
+                    if delta > 0:
+                        reserve_seats(stored.tour_date_id, delta)
+                    else:
+                        release_seats(stored.tour_date_id, -delta)
+                except SeatsUnavailable:
+                    raise ValidationError(self.NO_SPOTS)
+            serializer.save(total_price=stored.tour_date.tour.price * participants)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            stored = Booking.objects.select_for_update().filter(pk=instance.pk).values(
+                'status', 'participants', 'tour_date_id').first()
+            instance.delete()
+            # Cancelled bookings gave their seats back already
+            if stored is not None and stored['status'] != 'cancelled':
+                release_seats(stored['tour_date_id'], stored['participants'])
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many bookings at once.
+        
+        ``mode=atomic`` (the default) creates every booking or none of them,
+        ``mode=partial`` creates those that are valid and have seats left and
+        answers 207 when some of them failed. ``results`` holds the outcome of
+        every item, in request order.
+        """
+        envelope = BulkBookingSerializer(data=request.data)
+        envelope.is_valid(raise_exception=True)
+        atomic = envelope.validated_data['mode'] == 'atomic'
+        items = envelope.validated_data['bookings']
+        
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = self._bulk_failure(index, status.HTTP_400_BAD_REQUEST, serializer.errors)
+        
+        # Every referenced date with its tour (for pricing) and guide (for the response) in one query
+        tour_dates = TourDate.objects.select_related('tour', 'guide').in_bulk(
+            {data['tour_date_id'] for _, data in valid})
+        pending = []
+        for index, data in valid:
+            if data['tour_date_id'] in tour_dates:
+                pending.append((index, data))
+            else:
+                results[index] = self._bulk_failure(index, status.HTTP_400_BAD_REQUEST,
+                                                    {'tour_date_id': ['Tour date not found']})
+        if atomic and len(pending) < len(items):
+            return self._bulk_rejected(results, pending, status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            if atomic:
+                try:
+                    reserve_many([(data['tour_date_id'], data['participants']) for _, data in pending])
+                except SeatsUnavailable as e:
+                    for index, data in pending:
+                        if data['tour_date_id'] == e.tour_date_id:
+                            results[index] = self._bulk_failure(index, status.HTTP_409_CONFLICT, self.NO_SPOTS)
+                    return self._bulk_rejected(results, pending, status.HTTP_409_CONFLICT)
+                reserved = pending
+            else:
+                # One conditional UPDATE per booking, in date order so concurrent
+                # batches lock rows in the same order; a failed UPDATE changes nothing
+                reserved = []
+                for index, data in sorted(pending, key=lambda entry: (entry[1]['tour_date_id'], entry[0])):
+                    try:
+                        reserve_seats(data['tour_date_id'], data['participants'])
+                    except SeatsUnavailable:
+                        results[index] = self._bulk_failure(index, status.HTTP_409_CONFLICT, self.NO_SPOTS)
+                    else:
+                        reserved.append((index, data))
+                reserved.sort(key=lambda entry: entry[0])
+            
+            bookings = []
+            for index, data in reserved:
+                tour_date = tour_dates[data['tour_date_id']]
+                bookings.append(Booking(
+                    user=request.user,
+                    tour_date=tour_date,
+                    participants=data['participants'],
+                    # status is read-only: every new booking holds its seats until cancelled
+                    status='pending',
+                    total_price=tour_date.tour.price * data['participants'],
+                    booking_reference=str(uuid.uuid4())[:8].upper(),
+                ))
+            Booking.objects.bulk_create(bookings)
+        
+        for booking in bookings:
+            booking.tour_date.available_spots -= booking.participants
+        for (index, _), booking in zip(reserved, bookings):
+            results[index] = {'index': index, 'status': status.HTTP_201_CREATED,
+                              'booking': self.get_serializer(booking).data}
+        if len(bookings) == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif bookings:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_409_CONFLICT if pending else status.HTTP_400_BAD_REQUEST
+        return Response({'created': len(bookings), 'failed': len(items) - len(bookings), 'results': results},
+                        status=response_status)
+    
+    @staticmethod
+    def _bulk_failure(index, status_code, errors):
+        return {'index': index, 'status': status_code, 'errors': errors}
+    
+    def _bulk_rejected(self, results, pending, status_code):
+        """Response of an atomic batch that was rolled back because of the items already failed"""
+        for index, _ in pending:
+            if results[index] is None:
+                results[index] = self._bulk_failure(index, status.HTTP_424_FAILED_DEPENDENCY, {
+                    'non_field_errors': ['Not created because another booking in the batch failed']})
+        return Response({'created': 0, 'failed': len(results), 'results': results}, status=status_code)
     
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel a booking"""
         booking = self.get_object()
-        if booking.status == 'pending':
-            booking.status = 'cancelled'
-            booking.save()
+        with transaction.atomic():
+            # Conditional UPDATE so concurrent cancels release the seats only once
+            cancelled = Booking.objects.filter(pk=booking.pk, status='pending').update(
+                status='cancelled', updated_at=timezone.now()
+            )
+            if cancelled:
+                # Read after the UPDATE, which holds the row: a concurrent update may have changed it
+                participants = Booking.objects.filter(pk=booking.pk).values_list('participants', flat=True).get()
+                release_seats(booking.tour_date_id, participants)
+        if cancelled:
             return Response({'message': 'Booking cancelled successfully'})
         return Response({'error': 'Cannot cancel this booking'}, 
                        status=status.HTTP_400_BAD_REQUEST)
 
 class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.all()
+    queryset = Review.objects.select_related('user')
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['tour', 'rating']
     ordering_fields = ['created_at', 'rating']
     ordering = ['-created_at']
     
+    # Review writes also adjust the tour's rating aggregates (hiking.signals),
+    # so each write and its aggregate update commit together.
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+    
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+    
     def get_queryset(self):
         queryset = super().get_queryset()
         if self.action in ['update', 'partial_update', 'destroy']:
             return queryset.filter(user=self.request.user)
         return queryset
+
+class ExportView(APIView):
+    """
+    Staff-only streaming export of bookings or reviews.
+    
+    ``?output=csv|ndjson`` (default csv), ``start``/``end`` (YYYY-MM-DD,
+    inclusive, on created_at), ``status`` for bookings and ``rating`` for reviews.
+    """
+    permission_classes = [IsAdminUser]
+    export = None
+    filter_param = {'bookings': 'status', 'reviews': 'rating'}
+    
+    def get(self, request):
+        params = request.query_params
+        output = params.get('output', 'csv')
+        if output not in exports.FORMATS:
+            raise ValidationError({'output': f'Must be one of {", ".join(exports.FORMATS)}.'})
+        name = self.filter_param[self.export]
+        try:
+            queryset, columns = exports.EXPORTS[self.export](params.get('start'), params.get('end'), params.get(name))
+        except ValueError as e:
+            raise ValidationError(str(e))
+        response = StreamingHttpResponse(exports.render(queryset, columns, output),
+                                         content_type=exports.FORMATS[output])
+        filename = f'{self.export}-{timezone.now():%Y%m%d-%H%M%S}.{output}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from booking.models import BlogPost, Category
+from booking.counters import view_counter
 from django.contrib.auth.models import User
+from .images import ImageVariantsField
+from .sparse import SparseFieldsetMixin
 
 class CategorySerializer(serializers.ModelSerializer):
     post_count = serializers.SerializerMethodField()
@@ -10,30 +13,46 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'post_count']
     
     def get_post_count(self, obj):
-        return obj.blogpost_set.filter(is_published=True).count()
+        if hasattr(obj, 'post_count'):
+            return obj.post_count
+        return obj.published_posts_count
 
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name']
 
-class BlogPostListSerializer(serializers.ModelSerializer):
+class BlogPostListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
+    views = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
     
     class Meta:
         model = BlogPost
         fields = ['id', 'title', 'slug', 'author', 'category', 'excerpt', 
-                 'image', 'created_at', 'views']
+                 'image', 'image_variants', 'created_at', 'views']
+    
+    expandable_fields = {'author': 'author_id', 'category': 'category_id'}
+    
+    def get_views(self, obj):
+        return view_counter.total(obj)
 
-class BlogPostDetailSerializer(serializers.ModelSerializer):
+class BlogPostDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
+    views = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
     
     class Meta:
         model = BlogPost
         fields = ['id', 'title', 'slug', 'author', 'category', 'content', 
-                 'excerpt', 'image', 'created_at', 'updated_at', 'views']
+                 'excerpt', 'image', 'image_variants', 'created_at', 'updated_at', 'views']
+    
+    expandable_fields = {'author': 'author_id', 'category': 'category_id'}
+    
+    def get_views(self, obj):
+        return view_counter.total(obj)
 
 class BlogPostCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from hiking.models import Category, Location, Tour, TourDate, Booking, Review
 from django.contrib.auth.models import User
+from .images import ImageVariantsField
+from .sparse import SparseFieldsetMixin
 
 class CategorySerializer(serializers.ModelSerializer):
     tours_count = serializers.SerializerMethodField()
@@ -10,7 +12,9 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'tours_count', 'created_at']
     
     def get_tours_count(self, obj):
-        return obj.tours.filter(active=True).count()
+        if hasattr(obj, 'tours_count'):
+            return obj.tours_count
+        return obj.active_tours_count
 
 class LocationSerializer(serializers.ModelSerializer):
     tours_count = serializers.SerializerMethodField()
@@ -21,6 +25,8 @@ class LocationSerializer(serializers.ModelSerializer):
                  'description', 'tours_count', 'created_at']
     
     def get_tours_count(self, obj):
+        if hasattr(obj, 'tours_count'):
+            return obj.tours_count
         return obj.tours.filter(active=True).count()
 
 class UserSerializer(serializers.ModelSerializer):
@@ -36,37 +42,56 @@ class TourDateSerializer(serializers.ModelSerializer):
         fields = ['id', 'start_date', 'end_date', 'available_spots', 'guide', 'created_at']
 
 class ReviewSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
+    # The default makes the (tour, user) uniqueness a validation error rather than an IntegrityError
+    user = UserSerializer(read_only=True, default=serializers.CurrentUserDefault())
+    # Reviews are rendered inside their tour, so the tour is only written
+    tour = serializers.PrimaryKeyRelatedField(queryset=Tour.objects.filter(active=True), write_only=True)
     
     class Meta:
         model = Review
-        fields = ['id', 'user', 'rating', 'comment', 'created_at']
+        fields = ['id', 'user', 'tour', 'rating', 'comment', 'created_at']
         read_only_fields = ['user']
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # A review cannot move to another tour
+            fields.pop('tour', None)
+        return fields
 
-class TourSerializer(serializers.ModelSerializer):
+class TourSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     location = LocationSerializer(read_only=True)
     dates = TourDateSerializer(many=True, read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
     average_rating = serializers.SerializerMethodField()
-    reviews_count = serializers.SerializerMethodField()
+    reviews_count = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    image_variants = ImageVariantsField()
     
     class Meta:
         model = Tour
         fields = ['id', 'title', 'description', 'category', 'location', 'duration_days',
-                 'difficulty', 'price', 'max_participants', 'image', 'featured', 'active',
-                 'dates', 'reviews', 'average_rating', 'reviews_count', 'created_at', 'updated_at']
+                 'difficulty', 'price', 'max_participants', 'image', 'image_variants', 'featured', 'active',
+                 'dates', 'reviews', 'average_rating', 'reviews_count', 'rating_histogram',
+                 'created_at', 'updated_at']
     
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
+    expandable_fields = {'category': 'category_id', 'location': 'location_id', 'dates': None, 'reviews': None}
+    field_sources = {
+        'average_rating': ['average_rating', 'reviews_count'],
+        'rating_histogram': [f'rating_{stars}_count' for stars in range(1, 6)],
+    }
+    
+    def to_representation(self, instance):
+        # Hand the count annotated by TourQuerySet.with_stats() to the nested location
+        if hasattr(instance, 'location_tours_count'):
+            instance.location.tours_count = instance.location_tours_count
+        return super().to_representation(instance)
     
-    def get_reviews_count(self, obj):
-        return obj.reviews.count()
+    def get_average_rating(self, obj):
+        return obj.average_rating if obj.reviews_count else 0
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     tour_date = TourDateSerializer(read_only=True)
     tour_date_id = serializers.IntegerField(write_only=True)
@@ -75,4 +100,27 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = ['id', 'user', 'tour_date', 'tour_date_id', 'participants', 'total_price',
                  'status', 'booking_reference', 'created_at', 'updated_at']
-        read_only_fields = ['user', 'booking_reference', 'total_price']
\ No newline at end of file
+        # Bookings start pending and are only cancelled through the cancel action
+        read_only_fields = ['user', 'booking_reference', 'total_price', 'status']
+    
+    expandable_fields = {'user': 'user_id', 'tour_date': 'tour_date_id'}
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # A booking cannot move to another date; participant changes are
+            # reconciled with the seat inventory by BookingViewSet.perform_update
+            fields.pop('tour_date_id', None)
+        return fields
+    
+    def validate_participants(self, value):
+        if value < 1:
+            raise serializers.ValidationError("A booking needs at least one participant.")
+        return value
+
+class BulkBookingSerializer(serializers.Serializer):
+    """Envelope of a bulk booking request; each item is validated with BookingSerializer"""
+    MAX_BOOKINGS = 200
+    
+    mode = serializers.ChoiceField(choices=['atomic', 'partial'], default='atomic')
+    bookings = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=MAX_BOOKINGS)
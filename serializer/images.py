@@ -0,0 +1,17 @@
+from rest_framework import serializers
+from trips import images
+
+class ImageVariantsField(serializers.Field):
+    """
+    The generated variants of an image (``trips.images.ImageVariantsField``)
+    as ``{size: {'width', 'height', format: URL}, 'srcset': {format: srcset}}``,
+    or None until they exist
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = self.parent.Meta.model._meta.get_field(self.source).storage
+        return images.representation(value, storage, self.context.get('request'))
@@ -0,0 +1,76 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from django.core.exceptions import FieldDoesNotExist
+
+def _split(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+class SparseFieldsetMixin:
+    """
+    ``?fields=id,title`` and ``?expand=location,dates`` for read requests.
+
+    Without either parameter the representation is unchanged. With one of
+    them only the listed ``fields`` are rendered (all when omitted), and the
+    relations in ``expandable_fields`` are only embedded when listed in
+    ``expand``: the others are collapsed to the attribute named in
+    ``expandable_fields`` (e.g. ``category_id``) or left out when it is None.
+    Only the top-level serializer is affected, never nested ones.
+    """
+    # {relation field: attribute rendered when it is not expanded, or None to leave it out}
+    expandable_fields = {}
+    # {serializer field: model fields it reads} for fields that are not model fields
+    field_sources = {}
+
+    @classmethod
+    def requested(cls, request):
+        """``(fields or None for all, expand)`` asked for by ``request``, None for the full representation"""
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        fields = _split(params.get('fields')) or None
+        expand = _split(params.get('expand')) & set(cls.expandable_fields)
+        return fields, expand if fields is None else expand & fields
+
+    @classmethod
+    def model_columns(cls, requested):
+        """Concrete model fields the sparse representation reads, for ``only()``"""
+        fields, _ = requested
+        model = cls.Meta.model
+        columns = {model._meta.pk.name}
+        for name in cls.Meta.fields:
+            if fields is not None and name not in fields:
+                continue
+            if name in cls.field_sources:
+                columns.update(cls.field_sources[name])
+                continue
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete:
+                columns.add(name)
+        return columns
+
+    def _is_root(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_root():
+            return fields
+        requested = self.requested(self.context.get('request'))
+        if requested is None:
+            return fields
+        only, expand = requested
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only}
+        for name, collapsed in self.expandable_fields.items():
+            if name in fields and name not in expand:
+                if collapsed is None:
+                    del fields[name]
+                else:
+                    fields[name] = serializers.ReadOnlyField(source=collapsed)
+        return fields
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class TripsConfig(AppConfig):
+    name = 'trips'
+
+    def ready(self):
+        from . import authentication  # noqa: F401
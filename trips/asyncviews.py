@@ -0,0 +1,96 @@
+"""
+Native async variants of the read-only API endpoints, served under ``/api/async/``.
+
+DRF views are synchronous, so these are plain Django async views. Each one
+borrows the configuration of its DRF counterpart (queryset, filter backends,
+serializer, pagination, fast path) through ``drf_view()`` and does its
+database I/O with the async ORM: ``aget()``, ``acount()`` and ``async for``,
+with independent queries of one request (a page and its count, the child
+rows of the fast path) awaited together with ``asyncio.gather``. The
+fetched objects are serialized in the event loop; serializers only read what
+was joined or prefetched, anything else fails loudly with
+SynchronousOnlyOperation.
+
+Responses carry the same JSON as the synchronous endpoints but skip the
+response cache and the browsable API, and only GET/HEAD are allowed. Like
+the synchronous read views, they read from a replica when there is one.
+"""
+import functools
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from rest_framework import exceptions, status
+from .fastpath import FastJSONRenderer
+from .routers import replica_reads
+
+renderer = FastJSONRenderer()
+
+def render(data, status=status.HTTP_200_OK):
+    return HttpResponse(renderer.render(data), status=status, content_type='application/json')
+
+def endpoint(view):
+    """
+    Allow GET/HEAD only, read from a replica (trips.routers) and turn DRF
+    exceptions and Http404 into their usual JSON responses
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = render({'detail': f'Method "{request.method}" not allowed.'},
+                              status.HTTP_405_METHOD_NOT_ALLOWED)
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            with replica_reads():
+                return await view(request, *args, **kwargs)
+        except (Http404, exceptions.APIException) as exc:
+            if isinstance(exc, Http404):
+                exc = exceptions.NotFound(*exc.args)
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return render(detail, exc.status_code)
+    return wrapper
+
+def drf_view(view_class, request, action='list', **kwargs):
+    """An instance of the DRF ``view_class`` set up for ``request`` like dispatch() would, without running it"""
+    # action_map is what ViewSet.initialize_request() reads ``action`` from
+    view = view_class(action_map={'get': action, 'head': action}, args=(), kwargs=kwargs, format_kwarg=None)
+    view.request = view.initialize_request(request, *view.args, **kwargs)
+    view.request.accepted_renderer = renderer
+    view.request.accepted_media_type = renderer.media_type
+    return view
+
+async def list_response(view_class, request):
+    """The (paginated) list response of ``view_class`` for ``request``"""
+    view = drf_view(view_class, request)
+    # Filter backends may validate against the database (e.g. ModelChoiceFilter)
+    queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+    fast_path = getattr(view, 'fast_path', None)
+    if fast_path is not None and not fast_path.applies(view.request):
+        fast_path = None
+    if fast_path is not None:
+        queryset = fast_path.values(queryset)
+
+    paginator = view.paginator
+    if paginator is None:
+        objects = [obj async for obj in queryset]
+    elif hasattr(paginator, 'apaginate_queryset'):
+        objects = await paginator.apaginate_queryset(queryset, view.request, view)
+    else:
+        objects = await sync_to_async(paginator.paginate_queryset)(queryset, view.request, view)
+
+    if fast_path is not None:
+        data = await fast_path.arender(objects, view.request)
+    else:
+        data = view.get_serializer(objects, many=True).data
+    return render(data if paginator is None else paginator.get_paginated_response(data).data)
+
+async def detail_response(view_class, request, **kwargs):
+    """The retrieve response of ``view_class`` for the object named by ``kwargs``"""
+    view = drf_view(view_class, request, action='retrieve', **kwargs)
+    lookup = view.lookup_url_kwarg or view.lookup_field
+    queryset = view.get_queryset()
+    try:
+        obj = await queryset.aget(**{view.lookup_field: kwargs[lookup]})
+    except (queryset.model.DoesNotExist, TypeError, ValueError):
+        # Same as get_object_or_404()
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+    return render(view.get_serializer(obj).data)
@@ -0,0 +1,182 @@
+"""
+Token authentication without the token/user query on every request.
+
+``CachedTokenAuthentication`` is DRF's TokenAuthentication with the lookup
+of a key cached in two tiers:
+
+1. An in-process LRU of ``MAX_ENTRIES`` keys that live ``TIMEOUT`` seconds.
+2. Optionally, the Django cache ``CACHE_ALIAS``, shared by every worker, for
+   ``SHARED_TIMEOUT`` seconds.
+
+Keys are stored hashed, and only tokens of active users are cached.
+
+Deleting a token and saving or deleting its user drop the cached entries of
+that user, in this process and in the shared cache, once the change commits
+(the receivers below, connected by TripsConfig).
+A user save covers deactivation, password changes and profile edits. Entries
+in other processes' LRUs expire within ``TIMEOUT``.
+
+Changes that skip signals (``QuerySet.update()``, e.g. a bulk deactivation)
+invalidate nothing. Without ``CACHE_ALIAS`` the stale entries are gone within
+``TIMEOUT``; with it, an expired LRU entry is filled again from the shared
+cache, so a deactivated user can keep authenticating for up to
+``SHARED_TIMEOUT`` plus ``TIMEOUT`` seconds. Deactivate users with ``save()``
+or clear the ``CACHE_ALIAS`` cache after such updates.
+
+Every request gets its own copies of the cached user and token.
+``token_cache.stats()`` gives the hit ratio of each tier.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 30,
+    # Django cache alias shared by the workers, None for the in-process LRU only
+    'CACHE_ALIAS': None,
+    'SHARED_TIMEOUT': 300,
+}
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+def _digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+class TokenCache:
+    key_prefix = 'token-auth'
+
+    def __init__(self):
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def options(self):
+        return config()
+
+    def _shared(self, options):
+        alias = options['CACHE_ALIAS']
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        """The cached ``(user, token)`` of the token ``key``, or None"""
+        digest = _digest(key)
+        with self._lock:
+            item = self._entries.get(digest)
+            if item is not None:
+                expires, value = item
+                if expires >= time.monotonic():
+                    self._entries.move_to_end(digest)
+                    self.local_hits += 1
+                    return value
+                del self._entries[digest]
+        options = self.options
+        shared = self._shared(options)
+        value = shared.get(f'{self.key_prefix}:{digest}') if shared is not None else None
+        if value is None:
+            self.misses += 1
+            return None
+        self.shared_hits += 1
+        self._remember(digest, value, options)
+        return value
+
+    def set(self, key, user, token, invalidations=None):
+        """Cache ``key``, unless there were invalidations since ``invalidations`` was read"""
+        if invalidations is not None and invalidations != self.invalidations:
+            return
+        digest, value, options = _digest(key), (user, token), self.options
+        shared = self._shared(options)
+        if shared is not None:
+            shared.set(f'{self.key_prefix}:{digest}', value, options['SHARED_TIMEOUT'])
+        self._remember(digest, value, options)
+
+    def _remember(self, digest, value, options):
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + options['TIMEOUT'], value)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > options['MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        """Forget the tokens ``keys`` once the current transaction commits"""
+        digests = [_digest(key) for key in keys]
+        if not digests:
+            return
+
+        def forget():
+            self.invalidations += 1
+            with self._lock:
+                for digest in digests:
+                    self._entries.pop(digest, None)
+            shared = self._shared(self.options)
+            if shared is not None:
+                shared.delete_many([f'{self.key_prefix}:{digest}' for digest in digests])
+        transaction.on_commit(forget)
+
+    def invalidate_user(self, user_pk):
+        """Forget the tokens of the user ``user_pk``"""
+        from rest_framework.authtoken.models import Token
+        self.invalidate(Token.objects.filter(user_id=user_pk).values_list('key', flat=True))
+
+    def clear(self):
+        """Empty the in-process LRU (the shared cache alias may hold other data)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'entries': len(self._entries),
+        }
+
+token_cache = TokenCache()
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication answering repeated keys from ``token_cache``"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            # An invalidation committing during the query may concern what it read
+            invalidations = token_cache.invalidations
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, token, invalidations)
+        else:
+            user, token = cached
+        # Views may change request.user, the cached instances stay untouched
+        user = copy.copy(user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
+
+@receiver(post_delete, sender='authtoken.Token')
+def forget_cached_token(sender, instance, **kwargs):
+    token_cache.invalidate([instance.key])
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_cached_user_tokens(sender, instance, raw=False, **kwargs):
+    # Deactivation, password changes and profile edits all go through save()
+    if not raw:
+        token_cache.invalidate_user(instance.pk)
@@ -0,0 +1,294 @@
+"""
+Tag-invalidated response cache for the read-only catalog viewsets.
+
+Cached responses are keyed on the request path, its normalized query
+parameters, the negotiated renderer and the auth-relevant vary data, and are
+tagged with the models (``hiking.tour``) and objects (``hiking.tour:5``)
+they were built from. Saving or deleting one of those models bumps the
+version of its tags, which turns every entry built against an older version
+into a miss, so entries are invalidated by model signals rather than by TTL
+alone (the TTL is only a safety net).
+
+The backend is chosen with the ``RESPONSE_CACHE`` setting. ``'django'`` (the
+default) stores entries and tag versions in the Django cache ``CACHE_ALIAS``,
+shared by every worker. ``'locmem'`` keeps entries in a per-worker LRU, but
+its tag versions still live in ``CACHE_ALIAS``. Invalidations then reach
+every worker and management commands, not only the process that wrote. Only
+without a ``CACHE_ALIAS`` are versions kept in process, which is enough for a
+single worker.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+class SharedTagVersions:
+    """Tag versions in a Django cache, seen by every process using it"""
+
+    def __init__(self, cache, key_prefix='response-cache'):
+        self.cache = cache
+        self.key_prefix = key_prefix
+
+    def get(self, tags):
+        keys = {f'{self.key_prefix}:tag:{tag}': tag for tag in tags}
+        found = self.cache.get_many(list(keys))
+        for key in keys.keys() - found.keys():
+            # Seed missing tags with a clock value rather than 0, so a tag whose
+            # version was evicted can never match entries stored before that
+            self.cache.add(key, time.time_ns(), None)
+            found[key] = self.cache.get(key)
+        return {tag: found[key] for key, tag in keys.items()}
+
+    def bump(self, tags):
+        for tag in tags:
+            key = f'{self.key_prefix}:tag:{tag}'
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, time.time_ns(), None)
+
+    def clear(self):
+        # Other processes may hold entries built against these versions
+        pass
+
+class LocalTagVersions:
+    """Per-process tag versions, keeping the ``max_tags`` most recently used"""
+
+    def __init__(self, max_tags=10000):
+        self.max_tags = max_tags
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _version(self, tag):
+        # Like SharedTagVersions, a dropped tag comes back with a clock value
+        # no entry stored before was built against
+        version = self._versions.setdefault(tag, time.monotonic_ns())
+        self._versions.move_to_end(tag)
+        return version
+
+    def _trim(self):
+        while len(self._versions) > self.max_tags:
+            self._versions.popitem(last=False)
+
+    def get(self, tags):
+        with self._lock:
+            versions = {tag: self._version(tag) for tag in tags}
+            self._trim()
+            return versions
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._version(tag) + 1
+            self._trim()
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._versions)
+
+class LRUBackend:
+    """Per-process least-recently-used store, bounded to ``max_entries``"""
+
+    def __init__(self, max_entries=1000, timeout=300, versions=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.evictions = 0
+        self.versions = versions if versions is not None else LocalTagVersions(max_entries * 10)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_versions(self, tags):
+        return self.versions.get(tags)
+
+    def bump(self, tags):
+        self.versions.bump(tags)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class DjangoCacheBackend:
+    """Store shared by every worker, backed by a Django cache alias"""
+
+    key_prefix = 'response-cache'
+
+    def __init__(self, alias='default', timeout=300):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.versions = SharedTagVersions(self.cache, self.key_prefix)
+        # Evictions happen inside the cache server and are not observable here
+        self.evictions = 0
+
+    def get(self, key):
+        return self.cache.get(f'{self.key_prefix}:{key}')
+
+    def set(self, key, value):
+        self.cache.set(f'{self.key_prefix}:{key}', value, self.timeout)
+
+    def get_versions(self, tags):
+        return self.versions.get(tags)
+
+    def bump(self, tags):
+        self.versions.bump(tags)
+
+    def clear(self):
+        self.cache.clear()
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def bypassed(self):
+        """Build every response from the database inside the block, in this thread (query audits, tests)"""
+        previous = getattr(self._local, 'bypassed', False)
+        self._local.bypassed = True
+        try:
+            yield
+        finally:
+            self._local.bypassed = previous
+
+    @staticmethod
+    def model_tag(model):
+        return model._meta.label_lower
+
+    @classmethod
+    def object_tag(cls, model, pk):
+        return f'{cls.model_tag(model)}:{pk}'
+
+    def build_key(self, request, vary=()):
+        params = sorted((name, value) for name, values in request.query_params.lists()
+                        for value in values if value != '')
+        raw = '|'.join([request.path, urlencode(params), request.accepted_renderer.format, *map(str, vary)])
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def fetch(self, request, compute, tags, vary=()):
+        """Return a cached Response for ``request``, or build it with ``compute()`` and cache it"""
+        if getattr(self._local, 'bypassed', False):
+            return compute()
+        key = self.build_key(request, vary)
+        # Read the tag versions before computing: if an invalidation lands while
+        # the response is being built, the entry is stored against the old
+        # versions and will never be served.
+        versions = self.backend.get_versions(sorted(tags))
+        entry = self.backend.get(key)
+        if entry is not None and entry['versions'] == versions:
+            self.hits += 1
+            response = Response(entry['data'], status=entry['status'])
+            response['X-Cache'] = 'HIT'
+            return response
+        self.misses += 1
+        response = compute()
+        if response.status_code == status.HTTP_200_OK:
+            self.backend.set(key, {'versions': versions, 'data': response.data, 'status': response.status_code})
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def invalidate(self, model, pks=()):
+        """Invalidate every entry built from ``model`` (or only from the objects ``pks``) once committed"""
+        tags = [self.model_tag(model)] + [self.object_tag(model, pk) for pk in pks]
+
+        def bump():
+            self.invalidations += 1
+            self.backend.bump(tags)
+        transaction.on_commit(bump)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.backend.evictions,
+            'invalidations': self.invalidations,
+        }
+
+def _build_response_cache():
+    config = getattr(settings, 'RESPONSE_CACHE', {})
+    timeout = config.get('TIMEOUT', 300)
+    alias = config.get('CACHE_ALIAS', 'default')
+    if config.get('BACKEND', 'django') == 'django':
+        backend = DjangoCacheBackend(alias, timeout)
+    else:
+        versions = SharedTagVersions(caches[alias]) if alias else None
+        backend = LRUBackend(config.get('MAX_ENTRIES', 1000), timeout, versions)
+    return ResponseCache(backend)
+
+response_cache = _build_response_cache()
+
+class CachedResponseMixin:
+    """
+    Serve ``list``/``retrieve`` (and custom actions that call
+    ``cached_response``) from the response cache.
+
+    List responses depend on the viewset's model and on every model in
+    ``cache_dependencies``; detail responses depend on their own object and on
+    the dependencies.
+    """
+    cache_dependencies = ()
+
+    def get_cache_vary(self, request):
+        user = request.user
+        return ('staff' if user.is_staff else 'user' if user.is_authenticated else 'anon',)
+
+    def cached_response(self, request, compute, pk=None):
+        model = self.get_queryset().model
+        tags = {response_cache.model_tag(dependency) for dependency in self.cache_dependencies}
+        if pk is None:
+            tags.add(response_cache.model_tag(model))
+        else:
+            tags.add(response_cache.object_tag(model, pk))
+        if request.accepted_renderer.format != 'json':
+            # The browsable API embeds per-request data such as CSRF tokens
+            return compute()
+        return response_cache.fetch(request, compute, tags, self.get_cache_vary(request))
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs), pk=pk
+        )
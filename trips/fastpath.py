@@ -0,0 +1,254 @@
+"""
+Serializer-free read path for hot list endpoints.
+
+``FastPath`` compiles a ModelSerializer once into a plan over ``values()``
+rows: plain fields copy a column (through the DRF field's own
+``to_representation`` when it is not the identity), nested serializers read
+joined ``relation__column`` lookups, many=True serializers are filled from
+one extra ``values()`` query per relation, and SerializerMethodFields (or
+anything else the plan cannot derive) are supplied as ``overrides``. The
+result matches the serializer output key for key and is rendered with
+``FastJSONRenderer`` (orjson when installed).
+
+It is opt-in with the ``FAST_READ_PATH`` setting, and only used for plain
+JSON list requests (no ``?fields=``/``?expand=``); everything else goes
+through the serializers.
+"""
+import asyncio
+import json
+from collections import namedtuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import FileField as ModelFileField
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+from rest_framework.utils import encoders
+from django.utils import timezone
+from .images import ImageVariantsField, representation as image_variants
+from .instrumentation import serializing
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Fields whose to_representation() returns native values unchanged
+IDENTITY_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                   serializers.ReadOnlyField, serializers.ChoiceField)
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer producing the same compact UTF-8 JSON with orjson, or the C json encoder"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        default = encoders.JSONEncoder().default
+        if orjson is not None:
+            # Datetimes go through DRF's encoder (millisecond precision), keys are str()'d like json does
+            ret = orjson.dumps(data, default=default,
+                               option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        else:
+            ret = json.dumps(data, default=default, ensure_ascii=False, allow_nan=not self.strict,
+                             separators=(',', ':')).encode()
+        # Same escaping as JSONRenderer: these are valid JSON but not valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+def enabled():
+    return getattr(settings, 'FAST_READ_PATH', False)
+
+class FastPath:
+    """
+    Precompiled ``serializer_class`` representation over ``values()`` rows.
+
+    ``overrides`` maps dotted field paths (``'views'``, ``'category.post_count'``,
+    ``'dates.guide'``) to ``(columns, function(row))``; the columns are
+    ``values()`` lookups from the listed model, or from the related model for
+    fields of a many=True relation, and ``function`` gets the whole row. ``orderings`` gives the
+    ordering of every many=True relation, which must match the prefetch the
+    serializer path uses.
+    """
+
+    def __init__(self, serializer_class, overrides=None, orderings=None):
+        self.serializer_class = serializer_class
+        self.overrides = overrides or {}
+        self.orderings = orderings or {}
+        self._plan = None
+
+    def applies(self, request):
+        """Whether ``request`` can be answered from the fast path"""
+        if not enabled() or request.accepted_renderer.format != 'json':
+            return False
+        requested = getattr(self.serializer_class, 'requested', None)
+        return requested is None or requested(request) is None
+
+    @property
+    def plan(self):
+        """``(columns, transform(row, request, children, tz), relations)``, compiled on first use"""
+        if self._plan is None:
+            self._plan = _Compiler(self.overrides, self.orderings).compile(
+                self.serializer_class(), self.serializer_class.Meta.model)
+        return self._plan
+
+    @property
+    def columns(self):
+        return self.plan[0]
+
+    @staticmethod
+    def _timezone():
+        # What DateTimeField.enforce_timezone() would look up for every value
+        return timezone.get_current_timezone() if settings.USE_TZ else None
+
+    @staticmethod
+    def _child_rows(relation, ids):
+        columns = relation.plan[0]
+        return (relation.model.objects.filter(**{f'{relation.fk_name}__in': ids}).order_by(*relation.ordering)
+                .values(*dict.fromkeys([*columns, relation.fk])))
+
+    @staticmethod
+    def _group(relation, rows, request, tz):
+        transform, fk = relation.plan[1], relation.fk
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[fk], []).append(transform(row, request, None, tz))
+        return grouped
+
+    def render(self, rows, request=None):
+        """The serializer output (a list of dicts) for ``values()`` rows selected with ``columns``"""
+        columns, transform, relations = self.plan
+        tz = self._timezone()
+        children = None
+        if relations:
+            ids = [row['id'] for row in rows]
+            children = {relation.name: self._group(relation, self._child_rows(relation, ids), request, tz)
+                        for relation in relations}
+        with serializing():
+            return [transform(row, request, children, tz) for row in rows]
+
+    async def arender(self, rows, request=None):
+        """render() on the async ORM, fetching the many=True relations concurrently"""
+        columns, transform, relations = self.plan
+        tz = self._timezone()
+        children = None
+        if relations:
+            ids = [row['id'] for row in rows]
+
+            async def fetch(relation):
+                rows = [row async for row in self._child_rows(relation, ids)]
+                return relation.name, self._group(relation, rows, request, tz)
+            children = dict(await asyncio.gather(*map(fetch, relations)))
+        with serializing():
+            return [transform(row, request, children, tz) for row in rows]
+
+    def values(self, queryset):
+        """``queryset`` as ``values()`` rows holding the plan's columns and its ordering columns"""
+        ordering = [term.lstrip('-') for term in queryset.query.order_by if isinstance(term, str)]
+        ordering = ['id' if name == 'pk' else name for name in ordering]
+        # The many=True relations are fetched by render() instead of prefetched
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*self.columns, 'id', *ordering]))
+
+    def list_response(self, view, queryset):
+        """Paginated (or plain) list response of ``view`` for ``queryset``"""
+        rows = self.values(queryset)
+        page = view.paginate_queryset(rows)
+        if page is None:
+            return Response(self.render(list(rows), view.request))
+        return view.get_paginated_response(self.render(page, view.request))
+
+# A many=True relation of the plan: children of ``model`` whose ``fk`` points back at the row
+_Relation = namedtuple('_Relation', 'name model fk_name fk ordering plan')
+
+def _file_url(name, storage, request):
+    # Same as DRF's FileField: None when empty, absolute when there is a request
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+def _iso_datetime(value, tz, to_representation):
+    # DateTimeField.to_representation() for ISO 8601 output, minus its per-value lookups
+    if not value:
+        return None
+    if tz is None or value.utcoffset() is None:
+        return to_representation(value)
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+class _Compiler:
+    """Generates one ``transform(row, request, children, tz)`` function per serializer"""
+
+    def __init__(self, overrides, orderings):
+        self.overrides = overrides
+        self.orderings = orderings
+
+    def compile(self, serializer, model, path=''):
+        self.namespace = {'_file_url': _file_url, '_iso_datetime': _iso_datetime, '_image_variants': image_variants}
+        columns, relations = [], []
+        expression = self._expression(serializer, model, '', path, columns, relations)
+        source = f'def transform(row, request, children, tz):\n    return {expression}\n'
+        exec(compile(source, f'<fastpath {type(serializer).__name__}>', 'exec'), self.namespace)
+        return list(dict.fromkeys(columns)), self.namespace['transform'], relations
+
+    def _bind(self, value):
+        name = f'_v{len(self.namespace)}'
+        self.namespace[name] = value
+        return name
+
+    def _expression(self, serializer, model, prefix, path, columns, relations):
+        items = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            field_path = f'{path}{name}'
+            items.append(f'{name!r}: {self._field(field, field_path, model, prefix, columns, relations)}')
+        return '{' + ', '.join(items) + '}'
+
+    def _field(self, field, field_path, model, prefix, columns, relations):
+        if field_path in self.overrides:
+            override_columns, function = self.overrides[field_path]
+            columns.extend(override_columns)
+            return f'{self._bind(function)}(row)'
+        source = field.source.replace('.', '__')
+        if isinstance(field, serializers.ListSerializer):
+            relation = model._meta.get_field(source)
+            ordering = self.orderings.get(field_path)
+            if ordering is None:
+                raise ImproperlyConfigured(f'FastPath needs an ordering for {field_path}')
+            child = _Compiler(self.overrides, self.orderings).compile(
+                field.child, relation.related_model, f'{field_path}.')
+            if child[2]:
+                raise ImproperlyConfigured(f'FastPath cannot nest many=True relations ({field_path})')
+            relations.append(_Relation(field.field_name, relation.related_model, relation.field.name,
+                                       relation.field.attname, ordering, child))
+            pk = prefix + model._meta.pk.attname
+            columns.append(pk)
+            return f'children[{field.field_name!r}].get(row[{pk!r}], [])'
+        if isinstance(field, serializers.BaseSerializer):
+            related_model = model._meta.get_field(source).related_model
+            nested_prefix = f'{prefix}{source}__'
+            nested = self._expression(field, related_model, nested_prefix, f'{field_path}.', columns, relations)
+            pk = nested_prefix + related_model._meta.pk.attname
+            columns.append(pk)
+            return f'(None if row[{pk!r}] is None else {nested})'
+        if isinstance(field, serializers.SerializerMethodField):
+            raise ImproperlyConfigured(f'FastPath needs an override for {field_path}')
+        column = prefix + source
+        columns.append(column)
+        model_field = model._meta.get_field(source)
+        if isinstance(model_field, ModelFileField):
+            return f'_file_url(row[{column!r}], {self._bind(model_field.storage)}, request)'
+        if isinstance(model_field, ImageVariantsField):
+            return f'_image_variants(row[{column!r}], {self._bind(model_field.storage)}, request)'
+        if isinstance(field, IDENTITY_FIELDS):
+            return f'row[{column!r}]'
+        convert = self._bind(field.to_representation)
+        if (isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone')
+                and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601):
+            return f'_iso_datetime(row[{column!r}], tz, {convert})'
+        return f'(None if (value := row[{column!r}]) is None else {convert}(value))'
@@ -0,0 +1,252 @@
+"""
+Resized, re-encoded variants of uploaded images.
+
+An ``ImageVariantsField`` next to an ImageField holds the variants generated
+from it. Once a save that set a new image commits, the image is sent to a
+process pool (``IMAGE_VARIANTS['WORKERS']`` processes; 0 renders in the
+saving process). There every size in ``SIZES`` is written in every format in
+``FORMATS`` (JPEG and WebP by default), beside the original:
+
+    tours/variants/<sha256 of the original>/card.webp
+
+Work is skipped by content hash: a directory that has its ``manifest.json``
+is complete, so re-uploads, copies of the same photo and backfill reruns
+cost one read of the original. Only the stored field is updated afterwards,
+with a query filtered on the image still being the same one.
+
+Changing the image empties the field when the row is saved, so stale
+variants are never served. ``manage.py generate_image_variants`` backfills
+the existing media library. This needs storage with local paths
+(FileSystemStorage).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models.signals import post_save
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # name -> bounding box; crop fills the box exactly instead of fitting in it
+    'SIZES': {
+        'thumbnail': {'width': 200, 'height': 200, 'crop': True},
+        'card': {'width': 640, 'height': 640},
+        'hero': {'width': 1600, 'height': 1600},
+    },
+    # format -> Pillow save() options
+    'FORMATS': {
+        'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+        'webp': {'quality': 80, 'method': 4},
+    },
+    'WORKERS': 2,
+}
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+MANIFEST = 'manifest.json'
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_VARIANTS', {})}
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _save(image, path, format, options):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    image.save(temporary, format=format.upper(), **options)
+    os.replace(temporary, path)
+
+def render(path, root, sizes, formats, force=False):
+    """
+    Write the variants of the image file ``path`` into ``root/<sha256>/``.
+
+    Runs in the worker processes, so it only touches files. Returns
+    ``(sha256, {size: {'width', 'height', format: file name}}, rendered)``,
+    ``rendered`` being False when an earlier run had done the work.
+    """
+    from PIL import Image, ImageOps
+
+    sha = _sha256(path)
+    directory = os.path.join(root, sha)
+    manifest = os.path.join(directory, MANIFEST)
+    if not force and os.path.exists(manifest):
+        with open(manifest) as file:
+            return sha, json.load(file), False
+
+    os.makedirs(directory, exist_ok=True)
+    variants = {}
+    with Image.open(path) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+        original = original.convert('RGBA' if has_alpha else 'RGB')
+        for name, size in sizes.items():
+            box = (size['width'], size['height'])
+            if size.get('crop'):
+                image = ImageOps.fit(original, box, Image.Resampling.LANCZOS)
+            else:
+                image = original.copy()
+                # Never upscales
+                image.thumbnail(box, Image.Resampling.LANCZOS)
+            variant = variants[name] = {'width': image.width, 'height': image.height}
+            for format, options in formats.items():
+                encoded = image
+                if format == 'jpeg' and image.mode == 'RGBA':
+                    encoded = Image.new('RGB', image.size, 'white')
+                    encoded.paste(image, mask=image.getchannel('A'))
+                file_name = f'{name}.{EXTENSIONS.get(format, format)}'
+                _save(encoded, os.path.join(directory, file_name), format, options)
+                variant[format] = file_name
+    # Written last: its presence marks the directory complete
+    with open(f'{manifest}.{os.getpid()}.tmp', 'w') as file:
+        json.dump(variants, file)
+    os.replace(f'{manifest}.{os.getpid()}.tmp', manifest)
+    return sha, variants, True
+
+def job(storage, name, options=None, force=False):
+    """``render()`` arguments for the image ``name`` of ``storage``"""
+    options = options or config()
+    # NotImplementedError for storage without local paths
+    root = storage.path(f'{os.path.dirname(name)}/variants')
+    return (storage.path(name), root, options['SIZES'], options['FORMATS'], force)
+
+def stored_value(name, result):
+    """The ImageVariantsField value for the ``render()`` result of the image ``name``"""
+    sha, variants, _ = result
+    prefix = f'{os.path.dirname(name)}/variants/{sha}/'
+    return {
+        'source': name, 'sha256': sha,
+        'variants': {size: {key: value if key in ('width', 'height') else prefix + value
+                            for key, value in variant.items()}
+                     for size, variant in variants.items()},
+    }
+
+def store(model, field, pk, name, result):
+    """Save the variants of ``name`` on row ``pk``, unless its image changed since; returns whether it saved"""
+    from .cache import response_cache
+
+    image_field = model._meta.get_field(field).image_field
+    updated = model._default_manager.filter(pk=pk, **{image_field: name}).update(
+        **{field: stored_value(name, result)})
+    if updated:
+        response_cache.invalidate(model, [pk])
+    return bool(updated)
+
+def representation(value, storage, request=None):
+    """
+    The API representation of an ImageVariantsField value: ``{size: {'width',
+    'height', format: URL}}`` plus ``'srcset'``, ``{format: srcset string}`` of
+    the uncropped sizes, or None until the variants exist. URLs are absolute
+    when there is a request.
+    """
+    if not value or not value.get('variants'):
+        return None
+
+    def url(name):
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def ratio(variant):
+        return variant['width'] / variant['height']
+
+    # srcset candidates must be the same picture at other widths: no crops
+    widest = max(value['variants'].values(), key=lambda variant: variant['width'])
+    result, srcset = {}, {}
+    for size, variant in value['variants'].items():
+        entry = result[size] = {'width': variant['width'], 'height': variant['height']}
+        for format, name in variant.items():
+            if format in ('width', 'height'):
+                continue
+            entry[format] = url(name)
+            if abs(ratio(variant) - ratio(widest)) < 0.02:
+                srcset.setdefault(format, []).append(f'{entry[format]} {variant["width"]}w')
+    result['srcset'] = {format: ', '.join(candidates) for format, candidates in srcset.items()}
+    return result
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=config()['WORKERS'])
+        return _executor
+
+def _stored(model, field, pk, name, future):
+    # Runs on the executor's result thread, which has database connections of its own
+    try:
+        store(model, field, pk, name, future.result())
+    except Exception:
+        logger.exception('Generating the image variants of %s %s (%s) failed', model.__name__, pk, name)
+    finally:
+        connections.close_all()
+
+def schedule(model, field, pk, name):
+    """Generate and store the variants of the image ``name`` of row ``pk`` in the background"""
+    options = config()
+    storage = model._meta.get_field(model._meta.get_field(field).image_field).storage
+    try:
+        arguments = job(storage, name, options)
+    except NotImplementedError:
+        logger.warning('Image variants need storage with local paths, %s has none', type(storage).__name__)
+        return
+    if not options['WORKERS']:
+        try:
+            store(model, field, pk, name, render(*arguments))
+        except Exception:
+            logger.exception('Generating the image variants of %s %s (%s) failed', model.__name__, pk, name)
+        return
+    _pool().submit(render, *arguments).add_done_callback(partial(_stored, model, field, pk, name))
+
+class ImageVariantsField(models.JSONField):
+    """
+    The generated variants of the ImageField ``image_field``: ``{'source':
+    image name, 'sha256', 'variants': {size: {'width', 'height', format: name}}}``,
+    or ``{}`` while there are none.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.setdefault('default', dict)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('editable', False)
+        super().__init__(**kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['image_field'] = self.image_field
+        return name, path, args, kwargs
+
+    @property
+    def storage(self):
+        return self.model._meta.get_field(self.image_field).storage
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_save.connect(self._image_saved, sender=cls, weak=False,
+                              dispatch_uid=f'image_variants.{cls._meta.label}.{name}')
+
+    def pre_save(self, model_instance, add):
+        # A new image makes the variants stale
+        value = getattr(model_instance, self.attname)
+        image = getattr(model_instance, self.image_field)
+        if value and value.get('source') != image.name:
+            setattr(model_instance, self.attname, {})
+        return super().pre_save(model_instance, add)
+
+    def _image_saved(self, sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+        if raw or (update_fields is not None and self.image_field not in update_fields):
+            return
+        image = getattr(instance, self.image_field)
+        if image and not getattr(instance, self.attname):
+            transaction.on_commit(partial(schedule, sender, self.name, instance.pk, image.name), using=using)
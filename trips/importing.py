@@ -0,0 +1,223 @@
+"""
+Streaming bulk import shared by the ``import_catalog`` and ``import_blog`` commands.
+
+Rows are read one at a time from CSV or JSONL files, converted into unsaved
+model instances and upserted in ``bulk_create(update_conflicts=True)``
+batches, each batch in its own transaction, so memory stays constant no
+matter how large the file is. Foreign keys are resolved through lookup maps
+loaded once before the import starts instead of one query per row.
+
+bulk_create bypasses ``save()`` and model signals: importers fill in what
+``save()`` would have computed, and the commands rebuild the denormalized
+data (counters, search indexes, caches) once the import is done.
+"""
+import csv
+import io
+import json
+import sys
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.db import DatabaseError, models, transaction
+
+TRUE_VALUES = {'true', 't', 'yes', 'y', '1'}
+FALSE_VALUES = {'false', 'f', 'no', 'n', '0'}
+
+class RowError(Exception):
+    """A row that cannot be imported; it is reported and skipped"""
+
+# Stands for a natural key shared by several rows in natural_keys() maps
+AMBIGUOUS = object()
+
+def read_rows(path, format=None):
+    """Yield ``(line_number, row_dict)`` from a CSV or JSONL file (``-`` reads stdin)"""
+    format = format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if path == '-' \
+        else open(path, newline='', encoding='utf-8')
+    with stream:
+        if format == 'csv':
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, RowError(f'invalid JSON: {e}')
+                    continue
+                yield line_number, row if isinstance(row, dict) else RowError('expected a JSON object')
+
+def lookup(mapping, value, label):
+    """Resolve a foreign key column holding either a primary key or a natural key of ``mapping``"""
+    if value is None or value == '':
+        raise RowError(f'{label} is required')
+    value = str(value).strip()
+    if value not in mapping:
+        raise RowError(f'unknown {label} {value!r}')
+    if mapping[value] is AMBIGUOUS:
+        raise RowError(f'{label} {value!r} matches several rows, use its id')
+    return mapping[value]
+
+def natural_keys(queryset, *fields):
+    """
+    ``{str(pk): pk, str(natural_key): pk}`` over ``fields``; primary keys win
+    over clashing natural keys, and natural keys of several rows map to AMBIGUOUS
+    """
+    mapping = {}
+    for pk, *values in queryset.values_list('pk', *fields).iterator():
+        for value in map(str, values):
+            mapping[value] = pk if mapping.get(value, pk) == pk else AMBIGUOUS
+    mapping.update({str(pk): pk for pk in queryset.values_list('pk', flat=True).iterator()})
+    return mapping
+
+class Importer:
+    """
+    Upserts rows of one model.
+
+    Columns named after concrete fields (``name``, ``category_id``, ...) are
+    converted with the field's ``to_python()``; ``foreign_keys`` columns
+    (``category``) hold a primary key or natural key resolved through the maps
+    returned by ``lookup_maps()``. Rows conflicting on ``unique_fields``
+    update the columns they hold: a batch only holds rows with the same
+    columns and is written early when the next row's differ, so a column a
+    row leaves out keeps its stored value. Rows without ``unique_fields`` are
+    skipped, as they could only ever be inserted again.
+    """
+    model = None
+    unique_fields = ('id',)
+    # {column: foreign key attname} resolved through lookup_maps()
+    foreign_keys = {}
+
+    # Invalid rows reported one by one before only being counted
+    max_reported_errors = 20
+
+    def __init__(self, batch_size=5000, progress_every=50000, stdout=None, stderr=None, strict=False):
+        self.batch_size = batch_size
+        self.progress_every = progress_every
+        self.stdout = stdout or sys.stdout
+        self.stderr = stderr or sys.stderr
+        self.strict = strict
+        self.fields = {field.attname: field for field in self.model._meta.concrete_fields
+                       if field.editable or field.primary_key}
+        self.maps = {}
+        self.imported = self.skipped = 0
+
+    def lookup_maps(self):
+        """``{column: {key: pk}}`` for every column in ``foreign_keys``, keys as strings"""
+        return {}
+
+    def prepare(self):
+        """Load lookup maps before the first row"""
+        self.maps = self.lookup_maps()
+
+    def build(self, row):
+        """An unsaved instance for ``row``; raise RowError to skip it"""
+        values = {}
+        for column, value in row.items():
+            if column in self.foreign_keys:
+                values[self.foreign_keys[column]] = lookup(self.maps[column], value, column)
+            elif column in self.fields:
+                values[column] = self.convert(self.fields[column], value)
+            else:
+                raise RowError(f'unknown column {column!r}')
+        instance = self.model(**values)
+        for name in self.unique_fields:
+            if getattr(instance, self.model._meta.get_field(name).attname) in (None, ''):
+                raise RowError(f'{name} is required, rows are upserted on it')
+        return instance
+
+    def convert(self, field, value):
+        if value == '' or value is None:
+            if field.null or field.primary_key:
+                return None
+            if field.has_default():
+                return field.get_default()
+            if field.blank:
+                return ''
+            raise RowError(f'{field.name} is required')
+        if isinstance(field, models.BooleanField) and isinstance(value, str):
+            lowered = value.strip().lower()
+            if lowered in TRUE_VALUES | FALSE_VALUES:
+                return lowered in TRUE_VALUES
+        try:
+            value = field.to_python(value)
+        except ValidationError as e:
+            raise RowError(f'{field.name}: {" ".join(e.messages)}')
+        if field.choices and value not in {choice for choice, _ in field.flatchoices}:
+            raise RowError(f'{field.name}: {value!r} is not a valid choice')
+        return value
+
+    def update_fields(self, columns):
+        """Fields overwritten when a row conflicts with an existing one"""
+        attnames = {self.foreign_keys.get(column, column) for column in columns}
+        names = {self.fields[attname].name for attname in attnames if attname in self.fields}
+        names |= {field.name for field in self.model._meta.concrete_fields if getattr(field, 'auto_now', False)}
+        return sorted(names - set(self.unique_fields) - {self.model._meta.pk.name})
+
+    def write(self, instances, columns):
+        update_fields = self.update_fields(columns)
+        if update_fields:
+            self.model.objects.bulk_create(instances, update_conflicts=True, unique_fields=self.unique_fields,
+                                           update_fields=update_fields)
+        else:
+            self.model.objects.bulk_create(instances, ignore_conflicts=True)
+
+    def after_batch(self, instances):
+        """Hook run inside each batch's transaction"""
+
+    def flush(self, batch, columns, first_line, last_line):
+        try:
+            with transaction.atomic():
+                self.write(batch, columns)
+                self.after_batch(batch)
+        except DatabaseError as e:
+            raise CommandError(f'lines {first_line}-{last_line}: {e}')
+        self.imported += len(batch)
+
+    def run(self, rows):
+        self.prepare()
+        started = time.perf_counter()
+        reported = 0
+        batch, columns, first_line, last_line = [], set(), None, None
+        for line_number, row in rows:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                instance = self.build(row)
+            except RowError as e:
+                self.skipped += 1
+                if self.strict:
+                    raise CommandError(f'line {line_number}: {e}')
+                if self.skipped <= self.max_reported_errors:
+                    self.stderr.write(f'line {line_number}: {e}, skipped')
+            else:
+                if batch and set(row) != columns:
+                    # The upsert overwrites the batch's columns, with defaults for rows leaving one out
+                    self.flush(batch, columns, first_line, last_line)
+                    batch = []
+                if not batch:
+                    columns, first_line = set(row), line_number
+                batch.append(instance)
+                last_line = line_number
+            if len(batch) >= self.batch_size:
+                self.flush(batch, columns, first_line, last_line)
+                batch = []
+            if self.imported - reported >= self.progress_every:
+                reported = self.imported
+                self.report(started)
+        if batch:
+            self.flush(batch, columns, first_line, last_line)
+        return self.report(started, done=True)
+
+    def report(self, started, done=False):
+        """Write a progress line, or return the summary once ``done``"""
+        elapsed = time.perf_counter() - started
+        rate = self.imported / elapsed if elapsed else 0
+        name = str(self.model._meta.verbose_name_plural).lower()
+        if done:
+            return (f'Imported {self.imported} {name} ({self.skipped} skipped) '
+                    f'in {elapsed:.1f}s, {rate:.0f} rows/s')
+        self.stdout.write(f'  {self.imported} {name}, {rate:.0f} rows/s')
@@ -0,0 +1,241 @@
+"""
+Per-request SQL instrumentation.
+
+With ``SQL_INSTRUMENTATION['ENABLED']``, ``SQLInstrumentationMiddleware``
+collects the following for every request:
+- the queries on every database alias, with their count and total time;
+- statements that run repeatedly with different parameters (the N+1
+  signature);
+- the time spent serializing: rendering DRF responses and the blocks code
+  marks with ``serializing()``, with the queries they trigger left out.
+
+Timing uses execute wrappers on the database connections, so it does not
+depend on ``DEBUG``. The numbers go out as a ``Server-Timing`` header and as
+one log line on the ``trips.sql`` logger. Streaming responses run their
+queries while the body is sent, after the headers: they get no header, and
+are logged once the body is done. Queries slower than
+``SLOW_QUERY_MS`` and requests slower than ``SLOW_REQUEST_MS`` are logged as
+warnings with their SQL and an excerpt of the stack that ran them.
+
+When it is disabled the middleware removes itself (MiddlewareNotUsed) and
+nothing is installed, so requests pay nothing.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('trips.sql')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_QUERY_MS': 100,
+    # The same statement this many times in one request is reported as a duplicate
+    'DUPLICATE_THRESHOLD': 3,
+    'SERVER_TIMING': True,
+    'STACK_DEPTH': 5,
+}
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'SQL_INSTRUMENTATION', {})}
+
+_current = contextvars.ContextVar('sql_instrumentation', default=None)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _stack_excerpt(depth):
+    """The innermost ``depth`` frames of project code (not Django, DRF or this module)"""
+    frames = [frame for frame in traceback.extract_stack()
+              if frame.filename.startswith(_PROJECT_ROOT) and 'site-packages' not in frame.filename
+              and frame.filename != __file__]
+    return ''.join(traceback.format_list(frames[-depth:]))
+
+class RequestStats:
+    def __init__(self, options):
+        self.options = options
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        # sql -> [executions, total seconds]
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def record(self, alias, sql, duration, params):
+        with self._lock:
+            self.queries += 1
+            self.sql_time += duration
+            entry = self.statements.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+        if duration * 1000 >= self.options['SLOW_QUERY_MS']:
+            logger.warning('slow query (%.1f ms on %s): %s\nparams: %.300r\n%s', duration * 1000, alias, sql, params,
+                           _stack_excerpt(self.options['STACK_DEPTH']))
+
+    def duplicates(self):
+        """``(executions, sql)`` of the statements that ran at least DUPLICATE_THRESHOLD times, most first"""
+        threshold = self.options['DUPLICATE_THRESHOLD']
+        return sorted(((count, sql) for sql, (count, _) in self.statements.items() if count >= threshold),
+                      reverse=True)
+
+    def slowest(self, limit=5):
+        return sorted(((total, count, sql) for sql, (count, total) in self.statements.items()), reverse=True)[:limit]
+
+def _execute(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record(context['connection'].alias, sql, time.perf_counter() - started, params)
+
+def _add_wrapper(connection, **kwargs):
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+@contextmanager
+def serializing():
+    """Count the block as serialization time of the current request, minus the SQL it runs"""
+    stats = _current.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    started, sql_before = time.perf_counter(), stats.sql_time
+    try:
+        yield
+    finally:
+        stats.serializing = False
+        stats.serialize_time += time.perf_counter() - started - (stats.sql_time - sql_before)
+
+_installed = False
+
+def install():
+    """Wrap the execution of every database connection, once"""
+    global _installed
+    if _installed:
+        return
+    connection_created.connect(_add_wrapper, dispatch_uid='trips.instrumentation')
+    for connection in connections.all(initialized_only=True):
+        _add_wrapper(connection)
+    _installed = True
+
+@contextmanager
+def collect():
+    """Collect the SQL statistics of the block, yielded as a RequestStats"""
+    install()
+    stats = RequestStats(config())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def server_timing(stats, total):
+    description = f'{stats.queries} queries'
+    duplicates = stats.duplicates()
+    if duplicates:
+        description += f', {sum(count for count, _ in duplicates)} duplicated'
+    return ', '.join([
+        f'db;dur={stats.sql_time * 1000:.1f};desc="{description}"',
+        f'serialize;dur={stats.serialize_time * 1000:.1f}',
+        f'app;dur={max(total - stats.sql_time - stats.serialize_time, 0) * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+class SQLInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not config()['ENABLED']:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with collect() as stats:
+            response = self.get_response(request)
+        if response.streaming:
+            # Report once the body has been sent, with the queries it ran
+            def finish():
+                self.report(request, response, stats, time.perf_counter() - started)
+            if response.is_async:
+                response.streaming_content = _aiterate(response.streaming_content, stats, finish)
+            else:
+                response.streaming_content = _iterate(response.streaming_content, stats, finish)
+            return response
+        total = time.perf_counter() - started
+        if stats.options['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(stats, total)
+        self.report(request, response, stats, total)
+        return response
+
+    def process_template_response(self, request, response):
+        """Count rendering a DRF response, run right after this hook, as serialization"""
+        stats = _current.get()
+        if stats is not None and not stats.serializing:
+            started, sql_before = time.perf_counter(), stats.sql_time
+
+            def rendered(response):
+                stats.serialize_time += time.perf_counter() - started - (stats.sql_time - sql_before)
+            response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, stats, total):
+        options = stats.options
+        duplicates = stats.duplicates()
+        fields = {
+            'method': request.method, 'path': request.path, 'status': response.status_code,
+            'total_ms': round(total * 1000, 1), 'queries': stats.queries, 'sql_ms': round(stats.sql_time * 1000, 1),
+            'serialize_ms': round(stats.serialize_time * 1000, 1),
+            'duplicates': sum(count for count, _ in duplicates),
+        }
+        logger.info(' '.join(f'{key}={value}' for key, value in fields.items()), extra={'sql_stats': fields})
+        for count, sql in duplicates:
+            logger.warning('%s %s ran the same query %d times (N+1?): %s', request.method, request.path, count, sql,
+                           extra={'sql_stats': fields})
+        if total * 1000 >= options['SLOW_REQUEST_MS']:
+            slowest = '\n'.join(f'  {seconds * 1000:8.1f} ms  x{count:<4} {sql}'
+                                for seconds, count, sql in stats.slowest())
+            logger.warning('slow request %s %s (%.1f ms, %d queries, %.1f ms SQL), slowest statements:\n%s',
+                           request.method, request.path, total * 1000, stats.queries, stats.sql_time * 1000, slowest,
+                           extra={'sql_stats': fields})
+
+def _iterate(chunks, stats, finish):
+    """``chunks`` with the queries that producing them runs counted in ``stats``, then ``finish()``"""
+    try:
+        while True:
+            token = _current.set(stats)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        finish()
+
+async def _aiterate(chunks, stats, finish):
+    """_iterate() for async streaming content"""
+    try:
+        while True:
+            token = _current.set(stats)
+            try:
+                chunk = await anext(chunks)
+            except StopAsyncIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        finish()
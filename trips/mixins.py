@@ -0,0 +1,19 @@
+class DenormalizedCountersMixin:
+    """
+    Model mixin for counters that are only ever changed with atomic
+    ``F()`` UPDATEs (view counts, rating aggregates, per-category totals).
+
+    A plain ``save()`` of an existing row would write back whatever counter
+    values the instance was loaded with and silently undo concurrent
+    increments, so updates skip the fields listed in ``counter_fields``
+    unless they are named explicitly in ``update_fields``.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,235 @@
+"""
+Keyset (cursor) pagination shared by the blog and hiking APIs.
+
+Pages are selected with a ``WHERE (created_at, id) < (last_created_at, last_id)``
+style predicate on the queryset's ordering instead of OFFSET/LIMIT, so the
+cost of a page no longer grows with its depth. The ordering is whatever the
+view's filters applied (OrderingFilter, relevance ranking, ...) with ``id``
+appended as a tie-breaker, and the total ``count`` can be skipped with
+``?count=false``.
+
+``?page=N`` links from the page-number pagination these endpoints used
+before still work: that first page is read with OFFSET, and its ``next`` and
+``previous`` links are cursors.
+"""
+import asyncio
+import base64
+import datetime
+import decimal
+import json
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+def _positive_int(value, cutoff=None):
+    """``value`` as an integer of at least 1, capped at ``cutoff``; ValueError otherwise"""
+    number = int(value)
+    if number < 1:
+        raise ValueError(f'{value!r} is not a positive integer')
+    return min(number, cutoff) if cutoff else number
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    # Page-number links of the former PageNumberPagination, None to ignore them
+    page_query_param = 'page'
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_page_message = 'Invalid page'
+    # Used when the view did not order the queryset itself
+    ordering = ('-created_at', '-id')
+    display_page_controls = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page, counted, forwards = self._prepare(queryset, request)
+        self.count = counted.count() if counted is not None else None
+        return self._finish(list(page), *forwards)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() on the async ORM, awaiting the count and the page together"""
+        page, counted, forwards = self._prepare(queryset, request)
+
+        async def fetch():
+            return [row async for row in page]
+        if counted is None:
+            self.count, rows = None, await fetch()
+        else:
+            self.count, rows = await asyncio.gather(counted.acount(), fetch())
+        return self._finish(rows, *forwards)
+
+    def _prepare(self, queryset, request):
+        """``(page queryset, queryset to count or None, (position, reverse, offset))`` for ``request``"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        if self.page_query_param:
+            self.base_url = remove_query_param(self.base_url, self.page_query_param)
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+
+        position, reverse = self.decode_cursor(request, queryset)
+        offset = self.get_page_offset(request) if position is None else 0
+        ordering = [self._flip(term) for term in self.ordering] if reverse else self.ordering
+        page = queryset.order_by(*ordering)
+        if position is not None:
+            page = page.filter(self._after(ordering, position))
+        page = page[offset:offset + self.page_size + 1]
+        return page, queryset if self.include_count(request) else None, (position, reverse, offset)
+
+    def _finish(self, rows, position, reverse, offset):
+        if offset and not rows:
+            raise NotFound(self.invalid_page_message)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Going forwards there is a previous page whenever we came from a cursor
+        # or a page offset, going backwards there always is a next page (the one
+        # we came from).
+        has_next, has_previous = (True, has_more) if reverse else (has_more, position is not None or offset > 0)
+        self.next_position = self._position(rows[-1]) if rows and has_next else None
+        self.previous_position = self._position(rows[0]) if rows and has_previous else None
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(request.query_params[self.page_size_query_param], cutoff=self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_page_offset(self, request):
+        """Rows before the legacy ``?page=N``, 0 without one"""
+        if not self.page_query_param or self.page_query_param not in request.query_params:
+            return 0
+        try:
+            return (_positive_int(request.query_params[self.page_query_param]) - 1) * self.page_size
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, 'true').lower() not in ('false', '0', 'no')
+
+    def get_ordering(self, queryset):
+        ordering = [term for term in queryset.query.order_by] or list(self.ordering)
+        if any(not isinstance(term, str) or term == '?' for term in ordering):
+            raise ValueError('Keyset pagination needs an ordering made of field names')
+        if not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.next_position, reverse=False))
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.previous_position, reverse=True))
+
+    def encode_cursor(self, position, reverse):
+        payload = {'p': [_encode_value(value) for value in position], 'o': self.ordering, 'r': int(reverse)}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, ordering, reverse = payload['p'], payload['o'], bool(payload['r'])
+            if ordering != self.ordering or len(position) != len(ordering):
+                # The cursor was issued for a different ?ordering= than this request's
+                raise NotFound(self.invalid_cursor_message)
+            # Values the database cannot compare with would fail the query instead
+            position = [field.to_python(value) for field, value in zip(self._fields(queryset), position)]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _fields(self, queryset):
+        """The model fields (or annotation output fields) the ordering terms sort on"""
+        fields = []
+        for term in self.ordering:
+            name = term.lstrip('-')
+            if name in queryset.query.annotations:
+                fields.append(queryset.query.annotations[name].output_field)
+                continue
+            opts = queryset.model._meta
+            for part in name.split(LOOKUP_SEP):
+                field = opts.pk if part == 'pk' else opts.get_field(part)
+                if field.is_relation:
+                    opts = field.related_model._meta
+            fields.append(field)
+        return fields
+
+    def _position(self, row):
+        names = [term.lstrip('-') for term in self.ordering]
+        if isinstance(row, dict):
+            return [row['id' if name == 'pk' else name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    @staticmethod
+    def _flip(term):
+        return term[1:] if term.startswith('-') else f'-{term}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """Rows strictly after ``position`` in ``ordering``, as a lexicographic OR of ANDs"""
+        condition = Q()
+        equal = Q()
+        for term, value in zip(ordering, position):
+            name = term.lstrip('-')
+            lookup = 'lt' if term.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+class PaginatedActionMixin:
+    """Paginate the querysets of custom list actions like ``list()`` does"""
+
+    def paginated_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.get_serializer(queryset, many=True).data)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
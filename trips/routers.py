@@ -0,0 +1,129 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the ``default`` (primary) database. Reads go to one of
+the ``DATABASE_REPLICAS`` aliases only inside ``replica_reads()``, which the
+read-only API views enter for GET/HEAD/OPTIONS requests (``ReadReplicaMixin``)
+and the async endpoints for every request; everything else reads from the
+primary as before. One replica is picked per request so its reads see one
+snapshot.
+
+Reads switch back to the primary for the rest of the request as soon as it
+writes anything, inside transactions, and for authentication and session
+data. ``ReplicaStickinessMiddleware`` also keeps a client on the primary for
+``REPLICA_STICKY_SECONDS`` after a request of theirs wrote, so they read
+their own writes while the replicas catch up.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Always read from the primary: logins, sessions and tokens must never be stale
+PRIMARY_ONLY_APPS = {'auth', 'authtoken', 'contenttypes', 'sessions'}
+
+STICKY_COOKIE = 'primary_until'
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+class RoutingState:
+    """Routing decisions of one request (or ``replica_reads()`` block)"""
+
+    def __init__(self, pinned=False):
+        # Reads go to the primary, whatever replica_reads() says
+        self.pinned = pinned
+        self.replica_reads = False
+        self.replica = None
+        self.wrote = False
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+@contextmanager
+def routing(pinned=False):
+    """Start a fresh routing state for a request, yielded to read ``wrote`` afterwards"""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+@contextmanager
+def replica_reads():
+    """Read from a replica inside the block, until something is written"""
+    state = _state.get()
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = _state.set(state)
+    previous, state.replica_reads = state.replica_reads, True
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+        if token is not None:
+            _state.reset(token)
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads:
+            return None
+        aliases = replicas()
+        if (not aliases or state.pinned or model._meta.app_label in PRIMARY_ONLY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        if state.replica not in aliases:
+            state.replica = random.choice(aliases)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary (manage.py sync_replica)
+        return False if db in replicas() else None
+
+class ReadReplicaMixin:
+    """Serve the safe-method requests of a DRF view from a read replica"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+class ReplicaStickinessMiddleware:
+    """Route a request's reads to the primary if the client wrote in the last ``REPLICA_STICKY_SECONDS``"""
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        with routing(pinned) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,184 @@
+"""
+Discovery of the API's GET endpoints.
+
+``discover()`` walks the URLconf and returns one ``Route`` per GET endpoint
+served by a DRF view: viewset ``list``/``retrieve`` and custom actions,
+generic views and ``@api_view`` functions. Routes registered on more than
+one router, format-suffix variants and API roots are listed once. The query
+plan audit (``manage.py audit_query_plans``), the benchmark suite and the
+query count tests build their requests with ``sample_requests()``; the audit
+and the tests make them with ``call()``.
+"""
+import re
+from django.apps import apps
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.generics import GenericAPIView
+from rest_framework.routers import APIRootView
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+from .cache import response_cache
+
+# <converter:name> (path()) and (?P<name>...) (re_path()) URL parameters
+_PATH_PARAMETER = re.compile(r'<(?:\w+:)?(\w+)>')
+_REGEX_PARAMETER = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+class Route:
+    def __init__(self, pattern, name, callback):
+        self.pattern = pattern
+        self.name = name
+        self.callback = callback
+        self.view_class = callback.cls
+        self.initkwargs = getattr(callback, 'initkwargs', {})
+        # Viewset action served on GET, None for plain API views
+        self.action = (getattr(callback, 'actions', None) or {}).get('get')
+        self.url_kwargs = _REGEX_PARAMETER.findall(pattern) + _PATH_PARAMETER.findall(
+            _REGEX_PARAMETER.sub('', pattern))
+
+    def __repr__(self):
+        return f'<Route {self.name or self.pattern}>'
+
+    @property
+    def label(self):
+        """``ViewClass.action``, ``ViewClass(as_view arguments)`` or the @api_view function name"""
+        name = self.view_class.__name__
+        if name == 'WrappedAPIView':
+            # @api_view functions
+            name = self.callback.__name__
+        if self.action:
+            return f'{name}.{self.action}'
+        # as_view() arguments tell views like ExportView apart
+        arguments = ', '.join(f'{key}={value}' for key, value in self.initkwargs.items())
+        return f'{name}({arguments})' if arguments else name
+
+    @property
+    def detail(self):
+        return bool(self.url_kwargs)
+
+    def url(self, **kwargs):
+        """The URL path of the route for the given URL parameters"""
+        def value(match):
+            return str(kwargs[match.group(1)])
+        path = _PATH_PARAMETER.sub(value, _REGEX_PARAMETER.sub(value, self.pattern))
+        return '/' + path.replace('^', '').replace('$', '')
+
+    def view(self, request, **kwargs):
+        """An instance of the view set up for ``request`` (a Django request) like dispatch() would"""
+        view = self.view_class(**self.initkwargs)
+        view.action_map = getattr(self.callback, 'actions', None) or {}
+        view.args, view.kwargs, view.format_kwarg = (), kwargs, None
+        view.request = view.initialize_request(request, **kwargs)
+        return view
+
+def _walk(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _walk(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern), pattern
+
+def discover(urlconf=None):
+    """Every GET endpoint served by a DRF view, in URLconf order"""
+    routes, seen = [], set()
+    for pattern, url_pattern in _walk(get_resolver(urlconf).url_patterns):
+        callback = url_pattern.callback
+        view_class = getattr(callback, 'cls', None)
+        if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, APIRootView):
+            continue
+        if '<format>' in pattern or 'format>' in pattern:
+            continue
+        actions = getattr(callback, 'actions', None)
+        if actions is not None and 'get' not in actions:
+            continue
+        if actions is None and not hasattr(view_class, 'get'):
+            continue
+        route = Route(pattern, url_pattern.name, callback)
+        key = (view_class, route.action, callback.__name__, tuple(sorted(route.initkwargs.items(), key=str)))
+        if key not in seen:
+            seen.add(key)
+            routes.append(route)
+    return routes
+
+# Query parameters without which these endpoints only answer 400
+REQUIRED_PARAMS = {
+    'LocationViewSet.near': lambda: {'lat': '46.5', 'lon': '8.0', 'radius': '200'},
+    'TourViewSet.near': lambda: {'lat': '46.5', 'lon': '8.0', 'radius': '200'},
+    'TourDateViewSet.calendar': lambda: {'tour': str(_first('hiking.Tour', 'pk') or 1)},
+    'search_posts': lambda: {'q': 'trail'},
+}
+
+def _first(model, lookup):
+    if isinstance(model, str):
+        model = apps.get_model(model)
+    return (model._default_manager.exclude(**{f'{lookup}__isnull': True})
+            .order_by('pk').values_list(lookup, flat=True).first())
+
+def _filter_params(view, model):
+    """One ``{param: sample value}`` per filterset field of ``view``"""
+    fields = getattr(view, 'filterset_fields', None) or {}
+    if not isinstance(fields, dict):
+        fields = {name: ['exact'] for name in fields}
+    for name, lookups in fields.items():
+        sample = _first(model, name)
+        for lookup in lookups:
+            param = name if lookup == 'exact' else f'{name}__{lookup}'
+            yield {param: '1' if sample is None else str(sample)}
+
+def sample_requests(route, request):
+    """
+    ``(url, params)`` of representative requests to ``route``: the plain
+    request, then one per filterset field, ordering field (both directions)
+    and search. ``request`` (with the user to act as) is used to look up the
+    objects and filter values the view can see. Detail routes without any
+    visible object yield nothing.
+    """
+    view = route.view(request)
+    queryset = view.get_queryset() if isinstance(view, GenericAPIView) else None
+    kwargs = {}
+    if route.detail:
+        value = queryset.values_list(view.lookup_field, flat=True).first() if queryset is not None else None
+        if value is None:
+            return
+        kwargs = {name: value for name in route.url_kwargs}
+    url = route.url(**kwargs)
+    base = REQUIRED_PARAMS.get(route.label, dict)()
+    variants = [base]
+    if not route.detail and queryset is not None:
+        backends = getattr(view, 'filter_backends', ())
+        if any(issubclass(backend, DjangoFilterBackend) for backend in backends):
+            variants.extend({**base, **params} for params in _filter_params(view, queryset.model))
+        if any(issubclass(backend, OrderingFilter) for backend in backends):
+            for name in getattr(view, 'ordering_fields', None) or ():
+                if name != '__all__':
+                    variants += [{**base, 'ordering': name}, {**base, 'ordering': f'-{name}'}]
+        if getattr(view, 'search_fields', None) and any(issubclass(backend, SearchFilter) for backend in backends):
+            variants.append({**base, 'search': 'trail'})
+    seen = []
+    for params in variants:
+        # A sample filter value can repeat a required parameter
+        if params not in seen:
+            seen.append(params)
+            yield url, params
+
+def call(route, url, params=None, user=None):
+    """
+    Request ``url`` (a URL of ``route``) as ``user``, with the response cache
+    bypassed and inside a transaction that is rolled back. Returns the
+    response, with any streamed content consumed, and the queries it ran.
+    """
+    request = APIRequestFactory().get(url, params or {})
+    if user is not None:
+        force_authenticate(request, user)
+    with response_cache.bypassed(), CaptureQueriesContext(connection) as captured:
+        with transaction.atomic():
+            response = route.callback(request, **resolve(url).kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elif hasattr(response, 'render'):
+                response.render()
+            transaction.set_rollback(True)
+    return response, captured.captured_queries
@@ -0,0 +1,33 @@
+"""
+SQLite FTS5 helpers shared by the blog post and tour search indexes.
+
+Both indexes are FTS5 tables whose rowid is the primary key of the indexed
+row, so matches are expressed as ``pk__in`` subqueries and the BM25 rank as a
+correlated subquery annotation, without joining the FTS table into the
+queryset.
+"""
+import re
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+TOKEN_RE = re.compile(r'\w+')
+
+def match_expression(text):
+    """Turn free text into an FTS5 query where every term must match as a prefix"""
+    return ' '.join(f'"{term}"*' for term in TOKEN_RE.findall(text))
+
+def matching_ids(table, text):
+    """Subquery of the rowids of ``table`` matching ``text``, usable as ``pk__in``"""
+    return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match_expression(text)])
+
+def bm25(table, weights, text, model):
+    """
+    BM25 rank (lower is more relevant) of each ``model`` row against ``text``
+    with the column ``weights`` of ``table``, for rows that match
+    """
+    columns = ', '.join(str(weight) for weight in weights)
+    return RawSQL(
+        f'SELECT bm25({table}, {columns}) FROM {table} '
+        f'WHERE {table} MATCH %s AND {table}.rowid = {model._meta.db_table}.{model._meta.pk.column}',
+        [match_expression(text)], output_field=FloatField(),
+    )
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,13 +45,16 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework.authtoken',
     'booking',
     'django_filters',
     'corsheaders',
     'hiking',
+    'trips',
 ]
 
 MIDDLEWARE = [
+    'trips.instrumentation.SQLInstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,11 +63,19 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'trips.routers.ReplicaStickinessMiddleware',
 ]
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Thumbnail/card/hero JPEG and WebP variants of tour and blog post images,
+# generated in a process pool after upload (trips.images); 0 workers renders
+# them in the saving process
+IMAGE_VARIANTS = {
+    'WORKERS': int(os.environ.get('TRIPS_IMAGE_WORKERS', 2)),
+}
+
 ROOT_URLCONF = 'trips.urls'
 
 TEMPLATES = [
@@ -83,7 +96,7 @@ TEMPLATES = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'trips.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -101,19 +114,121 @@ REST_FRAMEWORK = {
     ],
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Seen by every worker of a deployment: point TRIPS_SHARED_CACHE_DIR at a
+    # directory they share, outside the source tree
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('TRIPS_SHARED_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'trips-cache')),
+    },
+}
+
+# Test runs get a cache of their own, not the one of a server running alongside
+if sys.argv[1:2] == ['test']:
+    CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'}
+
+# Catalog API response cache (trips.cache). BACKEND is 'django' to share entries
+# through the CACHE_ALIAS cache or 'locmem' for a per-worker LRU; either way the
+# tag versions that invalidate entries live in CACHE_ALIAS, seen by every worker.
+RESPONSE_CACHE = {
+    'BACKEND': 'django',
+    'MAX_ENTRIES': 1000,
+    'CACHE_ALIAS': 'shared',
+    'TIMEOUT': 300,
+}
+
+# Token -> user lookups of CachedTokenAuthentication (trips.authentication):
+# a per-process LRU, plus the CACHE_ALIAS cache shared by the workers when set
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 30,
+    'CACHE_ALIAS': None,
+    'SHARED_TIMEOUT': 300,
+}
+
+# Blog post page views are buffered in memory and flushed in batches (booking.counters)
+VIEW_COUNTER_FLUSH_INTERVAL = 5  # seconds; 0 writes every view through immediately
+VIEW_COUNTER_MAX_PENDING = 1000  # pending posts that force an early flush
+
+# Per (tour, month) availability calendars (hiking.availability), shared by every worker
+AVAILABILITY_CACHE_ALIAS = 'shared'
+AVAILABILITY_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Serve plain JSON tour and blog post lists from values() rows instead of the
+# serializers (trips.fastpath); the output is the same
+FAST_READ_PATH = False
+
+# Per-request query counts, SQL and serialization time as Server-Timing headers
+# and ``trips.sql`` log lines, with slow queries/requests logged with their SQL
+# (trips.instrumentation). Off, it costs nothing.
+SQL_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('TRIPS_SQL_INSTRUMENTATION') == '1',
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_QUERY_MS': 100,
+    'DUPLICATE_THRESHOLD': 3,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'trips.sql': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 WSGI_APPLICATION = 'trips.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# WAL lets readers run alongside a writer, synchronous=NORMAL only fsyncs at
+# checkpoints (safe with WAL), and a 64 MB page cache plus 256 MB of mmap keep
+# hot pages out of read() calls. Write transactions take the lock up front
+# (IMMEDIATE) so they queue on the busy timeout instead of failing on upgrade.
+SQLITE_PRAGMAS = 'PRAGMA synchronous=NORMAL; PRAGMA cache_size=-65536; PRAGMA mmap_size=268435456; ' \
+                 'PRAGMA temp_store=MEMORY'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': f'PRAGMA journal_mode=WAL; {SQLITE_PRAGMAS}',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas (trips.routers): TRIPS_DB_REPLICAS is a comma separated list of
+# SQLite files refreshed from the primary with ``manage.py sync_replica``.
+# Tests read them from the primary (TEST MIRROR).
+DATABASE_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('TRIPS_DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        'OPTIONS': {'init_command': f'PRAGMA query_only=ON; {SQLITE_PRAGMAS}'},
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['trips.routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after one of its requests wrote
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,418 @@
+import base64
+import datetime
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.serializers import Serializer
+from hiking.models import Category, Location, Review, Tour, TourDate
+from serializer.hiking_serializers import TourSerializer
+from trips import instrumentation
+from trips.authentication import token_cache
+from trips.cache import LocalTagVersions, LRUBackend, SharedTagVersions, response_cache
+from trips.routers import PrimaryReplicaRouter, ReplicaStickinessMiddleware, replica_reads
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages neither overlap nor skip rows, whatever the ordering and concurrent inserts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Trekking')
+        cls.location = Location.objects.create(name='Khumbu', country='Nepal')
+        # Few distinct prices, so pages break inside runs of equal values
+        cls.tours = [Tour.objects.create(title=f'Tour {i}', description='Trail notes', category=category,
+                                         location=cls.location, duration_days=i % 4 + 1, difficulty='easy',
+                                         price=f'{100 + 10 * (i % 3)}.00', max_participants=10)
+                     for i in range(11)]
+
+    def get(self, url, params=None, status=200):
+        with response_cache.bypassed():
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def walk(self, params):
+        pages, data = [], self.get('/api/api/v1/tours/', params)
+        while True:
+            pages.append([tour['id'] for tour in data['results']])
+            if not data['next']:
+                return pages
+            data = self.get(data['next'])
+
+    def expected(self, *ordering):
+        return list(Tour.objects.order_by(*ordering).values_list('id', flat=True))
+
+    def test_forward_pages(self):
+        for ordering, expected in (('price', ('price', 'id')), ('-price', ('-price', '-id')),
+                                   ('duration_days', ('duration_days', 'id')), (None, ('-created_at', '-id'))):
+            with self.subTest(ordering=ordering):
+                params = {'page_size': 3, **({'ordering': ordering} if ordering else {})}
+                pages = self.walk(params)
+                self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+                self.assertEqual(sum(pages, []), self.expected(*expected))
+
+    def test_backward_pages(self):
+        forward = self.walk({'page_size': 4, 'ordering': 'price'})
+        data = self.get('/api/api/v1/tours/', {'page_size': 4, 'ordering': 'price'})
+        while data['next']:
+            data = self.get(data['next'])
+        last = [tour['id'] for tour in data['results']]
+        backward = [last]
+        while data['previous']:
+            data = self.get(data['previous'])
+            backward.append([tour['id'] for tour in data['results']])
+        self.assertEqual(backward[::-1], forward)
+
+    def test_inserts_between_pages_do_not_shift_them(self):
+        first = self.get('/api/api/v1/tours/', {'page_size': 4, 'ordering': 'price'})
+        seen = [tour['id'] for tour in first['results']]
+        # Sorts before everything already read
+        cheap = Tour.objects.create(title='Cheap', description='Trail notes', category=self.tours[0].category,
+                                    location=self.location, duration_days=1, difficulty='easy', price='1.00',
+                                    max_participants=10)
+        data = first
+        while data['next']:
+            data = self.get(data['next'])
+            seen += [tour['id'] for tour in data['results']]
+        self.assertEqual(seen, [pk for pk in self.expected('price', 'id') if pk != cheap.pk])
+
+    def test_count_and_invalid_cursors(self):
+        data = self.get('/api/api/v1/tours/', {'page_size': 3, 'ordering': 'price'})
+        self.assertEqual(data['count'], 11)
+        self.assertNotIn('count', self.get('/api/api/v1/tours/', {'count': 'false'}))
+        cursor = parse_qs(urlsplit(data['next']).query)['cursor'][0]
+        self.get('/api/api/v1/tours/', {'ordering': 'price', 'cursor': cursor})
+        # A cursor only fits the ordering it was issued for
+        self.get('/api/api/v1/tours/', {'ordering': '-price', 'cursor': cursor}, status=404)
+        self.get('/api/api/v1/tours/', {'cursor': 'garbage'}, status=404)
+        # Well-formed, but with values the ordering's fields cannot hold
+        for position in (['not-a-date', 1], ['2030-01-01T00:00:00+00:00', 'x'], [['nested'], 1], 5):
+            with self.subTest(position=position):
+                cursor = base64.urlsafe_b64encode(json.dumps({'p': position, 'o': ['-created_at', '-id'],
+                                                              'r': 0}).encode()).decode()
+                self.get('/api/api/v1/tours/', {'cursor': cursor}, status=404)
+
+    def test_legacy_page_numbers(self):
+        pages = self.walk({'page_size': 3, 'ordering': 'price'})
+        data = self.get('/api/api/v1/tours/', {'page_size': 3, 'ordering': 'price', 'page': 2})
+        self.assertEqual([tour['id'] for tour in data['results']], pages[1])
+        self.assertNotIn('page=', data['next'])
+        self.assertEqual([tour['id'] for tour in self.get(data['next'])['results']], pages[2])
+        self.assertEqual([tour['id'] for tour in self.get(data['previous'])['results']], pages[0])
+        self.get('/api/api/v1/tours/', {'page_size': 3, 'page': 9}, status=404)
+        self.get('/api/api/v1/tours/', {'page': 'last'}, status=404)
+
+class ResponseCacheTests(TestCase):
+    """Cached catalog responses turn into misses once a write to what they render commits"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guide = User.objects.create(username='guide', first_name='Ang')
+        category = Category.objects.create(name='Trekking')
+        location = Location.objects.create(name='Khumbu', country='Nepal')
+        cls.tour = Tour.objects.create(title='Everest Base Camp', description='Trail notes', category=category,
+                                       location=location, duration_days=12, difficulty='hard', price='1500.00',
+                                       max_participants=10)
+        TourDate.objects.create(tour=cls.tour, start_date=datetime.date(2030, 4, 1),
+                                end_date=datetime.date(2030, 4, 12), available_spots=10, guide=cls.guide)
+
+    def setUp(self):
+        response_cache.clear()
+
+    def cache_status(self, url='/api/api/v1/tours/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache']
+
+    def test_miss_after_commit(self):
+        self.assertEqual(self.cache_status(), 'MISS')
+        self.assertEqual(self.cache_status(), 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(tour=self.tour, user=User.objects.create(username='hiker'), rating=5,
+                                  comment='Great')
+        self.assertEqual(self.cache_status(), 'MISS')
+        self.assertEqual(self.client.get('/api/api/v1/tours/').json()['results'][0]['reviews_count'], 1)
+
+    def test_only_rendered_user_fields_invalidate(self):
+        self.cache_status()
+        with self.captureOnCommitCallbacks(execute=True):
+            # What a login writes
+            self.guide.last_login = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+            self.guide.save(update_fields=['last_login'])
+            User.objects.create(username='someone else')
+        self.assertEqual(self.cache_status(), 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.guide.first_name = 'Pemba'
+            self.guide.save()
+        self.assertEqual(self.cache_status(), 'MISS')
+        self.assertEqual(self.client.get('/api/api/v1/tours/').json()['results'][0]['dates'][0]['guide']['first_name'],
+                         'Pemba')
+
+    def test_rebuild_commands_invalidate(self):
+        for command in ('rebuild_tour_ratings', 'rebuild_category_tour_counts', 'rebuild_tour_search_index'):
+            with self.subTest(command=command):
+                self.cache_status()
+                self.assertEqual(self.cache_status(), 'HIT')
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command(command, stdout=StringIO())
+                self.assertEqual(self.cache_status(), 'MISS')
+
+    def test_workers_share_tag_versions(self):
+        cache = caches['default']
+        self.addCleanup(cache.clear)
+        # Two workers, each with its own entries
+        first, second = (LRUBackend(versions=SharedTagVersions(cache)) for _ in range(2))
+        versions = first.get_versions(['hiking.tour'])
+        first.set('key', {'versions': versions})
+        self.assertEqual(second.get_versions(['hiking.tour']), versions)
+        second.bump(['hiking.tour'])
+        self.assertNotEqual(first.get_versions(['hiking.tour']), first.get('key')['versions'])
+
+    def test_local_tag_versions_are_bounded(self):
+        versions = LocalTagVersions(max_tags=3)
+        stored = versions.get(['hiking.tour:1'])
+        for pk in range(2, 10):
+            versions.bump([f'hiking.tour:{pk}'])
+        self.assertEqual(len(versions), 3)
+        # The dropped tag comes back with a version no stored entry has
+        self.assertNotEqual(versions.get(['hiking.tour:1']), stored)
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def test_only_replica_reads_use_the_replica(self):
+        self.assertIsNone(self.router.db_for_read(Tour))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Tour), 'replica')
+            self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_write(Tour), 'default')
+
+    def test_writes_pin_reads_to_the_primary(self):
+        with replica_reads():
+            self.router.db_for_write(Review)
+            self.assertEqual(self.router.db_for_read(Tour), 'default')
+
+    def test_clients_that_wrote_stick_to_the_primary(self):
+        def get_response(request):
+            with replica_reads():
+                if request.method == 'POST':
+                    self.router.db_for_write(Review)
+                response = HttpResponse()
+                response.read_from = self.router.db_for_read(Tour)
+            return response
+
+        middleware = ReplicaStickinessMiddleware(get_response)
+        factory = RequestFactory()
+        self.assertEqual(middleware(factory.get('/')).read_from, 'replica')
+        self.assertNotIn('primary_until', middleware(factory.get('/')).cookies)
+        cookie = middleware(factory.post('/')).cookies['primary_until']
+        request = factory.get('/')
+        request.COOKIES['primary_until'] = cookie.value
+        self.assertEqual(middleware(request).read_from, 'default')
+
+class SQLInstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        guide = User.objects.create(username='guide')
+        category = Category.objects.create(name='Trekking')
+        location = Location.objects.create(name='Khumbu', country='Nepal')
+        for i in range(3):
+            tour = Tour.objects.create(title=f'Tour {i}', description='Trail notes', category=category,
+                                       location=location, duration_days=3, difficulty='easy', price='100.00',
+                                       max_participants=10)
+            TourDate.objects.create(tour=tour, start_date=datetime.date(2030, 4, 1),
+                                    end_date=datetime.date(2030, 4, 3), available_spots=10, guide=guide)
+            Review.objects.create(tour=tour, user=User.objects.create(username=f'hiker{i}'), rating=4,
+                                  comment='Great')
+
+    def setUp(self):
+        response_cache.clear()
+
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/api/v1/tours/'))
+
+    @override_settings(SQL_INSTRUMENTATION={'ENABLED': True})
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('trips.sql', 'INFO') as logs:
+            response = self.client.get('/api/api/v1/tours/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="4 queries", serialize;dur=[\d.]+, ')
+        self.assertIn('path=/api/api/v1/tours/ status=200', logs.output[0])
+        self.assertIn('queries=4', logs.output[0])
+
+    @override_settings(SQL_INSTRUMENTATION={'ENABLED': True})
+    def test_serialization_is_timed_without_patching_drf(self):
+        with self.assertLogs('trips.sql', 'INFO') as logs:
+            self.client.get('/api/api/v1/tours/')
+        self.assertRegex(logs.output[0], r'serialize_ms=(?!0\.0\b)[\d.]+')
+        self.assertEqual(Serializer.data.fget.__module__, 'rest_framework.serializers')
+
+    @override_settings(SQL_INSTRUMENTATION={'ENABLED': True})
+    def test_streaming_responses_are_reported_once_sent(self):
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        with self.assertNoLogs('trips.sql', 'INFO'):
+            response = self.client.get('/api/api/v1/exports/reviews/')
+        self.assertNotIn('Server-Timing', response)
+        with self.assertLogs('trips.sql', 'INFO') as logs:
+            body = b''.join(response.streaming_content)
+        self.assertEqual(len(body.splitlines()), 4)
+        self.assertIn('path=/api/api/v1/exports/reviews/ status=200', logs.output[0])
+        # The session and user lookups, then the export itself
+        self.assertIn('queries=3', logs.output[0])
+
+    @override_settings(SQL_INSTRUMENTATION={'ENABLED': True, 'SLOW_QUERY_MS': 0})
+    def test_duplicates_and_slow_queries(self):
+        tours = list(Tour.objects.all()[:3])
+        with self.assertLogs('trips.sql', 'WARNING') as logs, instrumentation.collect() as stats:
+            for tour in tours:
+                Tour.objects.get(pk=tour.pk)
+        self.assertEqual(stats.queries, 3)
+        [(count, sql)] = stats.duplicates()
+        self.assertEqual(count, 3)
+        self.assertIn('FROM "hiking_tour"', sql)
+        self.assertIn('slow query', logs.output[0])
+        self.assertIn('test_duplicates_and_slow_queries', logs.output[0])
+
+class ImageVariantsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Trekking')
+        cls.location = Location.objects.create(name='Khumbu', country='Nepal', latitude=27.9, longitude=86.9)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media, IMAGE_VARIANTS={'WORKERS': 0})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def photo(self, color='teal'):
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', (2400, 1600), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile('summit.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def create_tour(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            tour = Tour.objects.create(title='Everest Base Camp', description='Trail notes', category=self.category,
+                                       location=self.location, duration_days=12, difficulty='hard', price=1500,
+                                       max_participants=10, **kwargs)
+        tour.refresh_from_db()
+        return tour
+
+    def test_upload_generates_variants(self):
+        tour = self.create_tour(image=self.photo())
+        variants = tour.image_variants['variants']
+        self.assertEqual(tour.image_variants['source'], tour.image.name)
+        self.assertEqual((variants['thumbnail']['width'], variants['thumbnail']['height']), (200, 200))
+        self.assertEqual((variants['card']['width'], variants['card']['height']), (640, 427))
+        self.assertEqual(variants['hero']['width'], 1600)
+        for variant in variants.values():
+            self.assertTrue(tour.image.storage.exists(variant['webp']))
+            self.assertTrue(variant['jpeg'].startswith(f'tours/variants/{tour.image_variants["sha256"]}/'))
+
+        data = TourSerializer(tour, context={'request': Request(RequestFactory().get('/'))}).data['image_variants']
+        self.assertEqual(data['card']['webp'],
+                         f'http://testserver/media/tours/variants/{tour.image_variants["sha256"]}/card.webp')
+        self.assertEqual(data['srcset']['webp'], ', '.join(
+            f'{data[size]["webp"]} {data[size]["width"]}w' for size in ('card', 'hero')))
+
+    def test_same_content_is_not_rendered_twice(self):
+        first = self.create_tour(image=self.photo())
+        with mock.patch('PIL.Image.open') as image_open:
+            second = self.create_tour(image=self.photo())
+        image_open.assert_not_called()
+        self.assertNotEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants['variants'], second.image_variants['variants'])
+
+    def test_new_image_drops_stale_variants(self):
+        tour = self.create_tour(image=self.photo())
+        sha = tour.image_variants['sha256']
+        tour.image = self.photo('navy')
+        with self.captureOnCommitCallbacks(execute=True):
+            tour.save()
+            self.assertEqual(Tour.objects.get(pk=tour.pk).image_variants, {})
+            self.assertIsNone(TourSerializer(Tour.objects.get(pk=tour.pk)).data['image_variants'])
+        tour.refresh_from_db()
+        self.assertEqual(tour.image_variants['source'], tour.image.name)
+        self.assertNotEqual(tour.image_variants['sha256'], sha)
+
+    def test_backfill(self):
+        tour = self.create_tour()
+        tour.image.save('summit.jpg', self.photo(), save=False)
+        Tour.objects.filter(pk=tour.pk).update(image=tour.image.name)
+        missing = self.create_tour()
+        Tour.objects.filter(pk=missing.pk).update(image='tours/missing.jpg')
+        out = StringIO()
+        call_command('generate_image_variants', model=['tours'], workers=1, stdout=out)
+        self.assertIn('1 rendered, 0 reused, 0 current, 1 missing', out.getvalue())
+        self.assertEqual(Tour.objects.get(pk=tour.pk).image_variants['source'], tour.image.name)
+        call_command('generate_image_variants', model=['tours'], workers=1, stdout=out)
+        self.assertIn('0 rendered, 0 reused, 1 current, 1 missing', out.getvalue())
+
+class CachedTokenAuthenticationTests(TestCase):
+    url = '/api/api/v1/bookings/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hiker', password='first password')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        token_cache.clear()
+        caches['default'].clear()
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+
+    def get(self):
+        return self.client.get(self.url, **self.headers)
+
+    def test_repeated_requests_skip_the_token_query(self):
+        before = token_cache.stats()
+        self.assertEqual(self.get().status_code, 200)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.get().status_code, 200)
+        self.assertFalse([query for query in captured if 'authtoken_token' in query['sql']])
+        stats = token_cache.stats()
+        self.assertEqual(stats['misses'] - before['misses'], 1)
+        self.assertEqual(stats['local_hits'] - before['local_hits'], 1)
+
+    def test_shared_cache(self):
+        with override_settings(TOKEN_AUTH_CACHE={'CACHE_ALIAS': 'default'}):
+            self.get()
+            token_cache.clear()
+            before = token_cache.stats()['shared_hits']
+            self.assertEqual(self.get().status_code, 200)
+            self.assertEqual(token_cache.stats()['shared_hits'], before + 1)
+
+    def test_deactivation_password_change_and_token_deletion_invalidate(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('second password')
+            self.user.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIn(self.get().status_code, (401, 403))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(is_active=True)
+            token_cache.invalidate_user(self.user.pk)
+        self.assertEqual(self.get().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.get(pk=self.token.pk).delete()
+        self.assertIn(self.get().status_code, (401, 403))